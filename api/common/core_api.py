@@ -1,17 +1,21 @@
 import os
-import json
-import sys
-import subprocess
-import threading
-import time
 
 from flask import render_template, make_response, request
 from flask_restful import Resource
 from src.app.config_loader import Config
+from src.core.session_manager import SessionManager
 from src.utils.ip_utils import get_local_ip
-from src.app.settings import TOOL_VERSION, CONFIG_PATH
+from src.utils.metrics import REGISTRY, MultiProcessMetrics
+from src.app.drain import DrainState
+from src.services.update_service import UpdateService
+from src.app.settings import TOOL_VERSION, UPDATE_DRAIN_TIMEOUT, WORKERS
 
 config = Config()
+update_service = UpdateService()
+# with several workers every one of them snapshots its metrics, and /metrics adds them up
+multiprocess_metrics = MultiProcessMetrics() if WORKERS > 1 else None
+if multiprocess_metrics is not None:
+    multiprocess_metrics.start()
 
 class Home(Resource):
     def get(self):
@@ -42,9 +46,8 @@ class SetConfig(Resource):
             return response, 400
 
         try:
-            with open(CONFIG_PATH, 'w') as f:
-                config.update(args)
-                f.write(json.dumps(config.get_data(), indent=4))
+            # atomic write, other workers pick the change up from the file
+            config.update(args)
             response = {
                 "status": "success",
                 "message": "Config updated successfully"
@@ -64,37 +67,48 @@ class Version(Resource):
 
 
 class Update(Resource):
+    def get(self):
+        return update_service.status(), 200
+
     def post(self):
+        body = request.get_json(silent=True) or request.form.to_dict()
         try:
-            # Step 1: Pull the latest code
-            repo_dir = os.getcwd()
-            result = subprocess.run(
-                ["git", "pull", "origin", "main"], cwd=repo_dir,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-            )
-
-            if result.returncode != 0:
-                return {"status": "error", "output": result.stderr}, 500
-
-            # Step 2: Restart the server in a background thread
-            def restart():
-                time.sleep(1)  # Give some time for the response to be sent
-                python = sys.executable
-                os.execl(python, python, *sys.argv)
-
-            threading.Thread(target=restart, daemon=True).start()
+            deadline = float(body.get("deadline", UPDATE_DRAIN_TIMEOUT))
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "deadline must be a number of seconds"}, 400
+        force = str(body.get("force", "")).lower() in ("1", "true", "yes")
 
+        try:
+            # Pull the latest code, then drain and restart in the background
+            status = update_service.start(
+                deadline=deadline, force=force, port=request.environ.get("SERVER_PORT"),
+                gunicorn=request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"),
+            )
+        except RuntimeError as e:
+            return {"status": "error", "message": str(e)}, 409 if DrainState().active else 500
         except Exception as e:
             return {"status": "error", "message": str(e)}, 500
 
-        return {"status": "success", "message": "Updating and restarting..."}, 200
+        return {"status": "success", "message": "Updated, draining before the restart...", "update": status}, 202
 
 
 class HealthCheck(Resource):
     def get(self):
         return {
             'status': 'ok', 
-            # 'active_sessions': len(active_sessions),
+            'active_sessions': SessionManager().active_count(),
+            'version': TOOL_VERSION,
+            'pid': os.getpid(),
+            'master': os.getppid(),
+            'draining': DrainState().active,
             'server_type': 'Gunicorn + EventLet',
             'transport': 'WebSocket + Polling'
-        }, 200
\ No newline at end of file
+        }, 200
+
+
+class Metrics(Resource):
+    def get(self):
+        # Prometheus text exposition format
+        headers = {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        body = multiprocess_metrics.exposition() if multiprocess_metrics is not None else REGISTRY.exposition()
+        return make_response(body, 200, headers)
@@ -1,17 +1,115 @@
-from flask_restful import reqparse, Resource
+from flask import request, send_file
+from flask_restful import reqparse, inputs, Resource
+from flask_socketio import join_room, emit
+from src.app.socket_server import socketio
 from src.services.command_service import CommandService
+from src.core.output_capture import get_output_path
+from src.app.settings import BATCH_MAX_COMMANDS
 
 parser = reqparse.RequestParser()
-service = CommandService()
+parser.add_argument('command', type=str, required=True)
+parser.add_argument('cwd', type=str, required=False, default=None)
+parser.add_argument('env', type=dict, default=None)
+parser.add_argument('stream', type=inputs.boolean, default=False)
+
+job_parser = parser.copy()
+job_parser.add_argument('timeout', type=float, default=None)
+
+service = CommandService(emitter=socketio)
 
 class Command(Resource):
     def post(self):
-        parser.add_argument('command', type=str, required=True)
-        parser.add_argument('cwd', type=str, required=False, default=None)
-        parser.add_argument('env', type=dict, default=None)
         args = parser.parse_args()
 
+        if args['stream']:
+            job_id = service.submit_command(args['command'], cwd=args['cwd'], env=args['env'], stream=True)
+            return {"job_id": job_id, "room": job_id}, 202
+
         success, stdout, stderr = service.run_command(args['command'], cwd=args['cwd'], env=args['env'])
         if success:
-            return {"stdout": stdout, "stderr": stderr}, 200
+            return {
+                "stdout": stdout.text(),
+                "stderr": stderr.text(),
+                "outputs": {"stdout": stdout.info(), "stderr": stderr.info()},
+            }, 200
         return {"error": stderr}, 400
+
+
+class CommandOutput(Resource):
+    def get(self, output_id):
+        '''Serve a spilled output file, honouring HTTP Range requests.'''
+        path = get_output_path(output_id)
+        if path is None:
+            return {"error": f"Output '{output_id}' not found"}, 404
+        return send_file(path, mimetype='text/plain', conditional=True, etag=False)
+
+
+class CommandBatch(Resource):
+    def post(self):
+        body = request.get_json(silent=True) or {}
+        commands = body.get('commands')
+
+        # Validate input
+        if not isinstance(commands, list) or not commands:
+            return {"error": "'commands' must be a non-empty list"}, 400
+        if len(commands) > BATCH_MAX_COMMANDS:
+            return {"error": f"At most {BATCH_MAX_COMMANDS} commands are allowed per batch"}, 400
+        for index, spec in enumerate(commands):
+            if isinstance(spec, str):
+                commands[index] = spec = {"command": spec}
+            if not isinstance(spec, dict) or not isinstance(spec.get('command'), str):
+                return {"error": f"commands[{index}] must be a string or an object with a 'command' string"}, 400
+            if spec.get('timeout') is not None:
+                try:
+                    spec['timeout'] = float(spec['timeout'])
+                except (TypeError, ValueError):
+                    spec['timeout'] = None
+                if spec['timeout'] is None or spec['timeout'] <= 0:
+                    return {"error": f"commands[{index}].timeout must be a positive number of seconds"}, 400
+
+        try:
+            parallelism = int(body.get('parallelism', 1))
+        except (TypeError, ValueError):
+            return {"error": "'parallelism' must be an integer"}, 400
+        stop_on_failure = str(body.get('stop_on_failure', False)).lower() in ("1", "true", "yes")
+
+        return service.run_batch(commands, parallelism=parallelism, stop_on_failure=stop_on_failure), 200
+
+
+class CommandJobs(Resource):
+    def get(self):
+        return {"jobs": service.list_jobs()}, 200
+
+    def post(self):
+        args = job_parser.parse_args()
+
+        job_id = service.submit_command(args['command'], cwd=args['cwd'], env=args['env'],
+                                        stream=args['stream'], timeout=args['timeout'])
+        return {"job_id": job_id, "status": "queued"}, 202
+
+
+class CommandJob(Resource):
+    def get(self, job_id):
+        job = service.get_job(job_id)
+        if job is None:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        return job, 200
+
+    def delete(self, job_id):
+        if not service.cancel_job(job_id):
+            return {"error": f"Job '{job_id}' is not queued or running"}, 409
+        return {"job_id": job_id, "status": "cancelling"}, 202
+
+
+@socketio.on('command_subscribe')
+def command_subscribe(data):
+    '''Join the room of a streamed command and replay its buffered chunks.'''
+    job_id = (data or {}).get('job_id')
+    stream = service.get_stream(job_id)
+    if stream is None:
+        return {"error": f"Unknown job id '{job_id}'"}
+
+    join_room(job_id)
+    for event, payload in stream.backlog():
+        emit(event, payload)
+    return {"job_id": job_id, "status": "subscribed"}
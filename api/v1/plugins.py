@@ -0,0 +1,19 @@
+from flask_restful import Resource
+from src.plugins.plugin_engine import PLUGIN_LIST, dispatcher
+
+ACTIONS = ('enable', 'disable')
+
+class PluginList(Resource):
+    def get(self):
+        return {"plugins": dispatcher.stats()}, 200
+
+
+class PluginAction(Resource):
+    def post(self, name, action):
+        if name not in PLUGIN_LIST:
+            return {"error": f"Plugin '{name}' not found"}, 404
+        if action not in ACTIONS:
+            return {"error": f"Unknown action '{action}', expected one of {', '.join(ACTIONS)}"}, 400
+
+        getattr(dispatcher, action)(name)
+        return {"plugin": name, **dispatcher.stats()[name]}, 200
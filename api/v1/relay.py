@@ -0,0 +1,92 @@
+from flask import request
+from flask_restful import Resource, inputs
+from src.core.relay_registry import RelayRegistry
+from src.services.relay_sequencer_service import RelaySequencerService, parse_outlets
+
+registry = RelayRegistry()
+registry.load()
+# writes go through the registry, which locks the relay against other workers and stores its states
+sequencer = RelaySequencerService(registry.relays, device=registry.device)
+
+RELAY_ACTIONS = ('on', 'off', 'toggle', 'reset')
+
+class RelayList(Resource):
+    def get(self):
+        return {"relays": registry.states()}, 200
+
+
+class RelayState(Resource):
+    def get(self, name):
+        if registry.state(name) is None:
+            return {"error": f"Relay '{name}' not found"}, 404
+        if inputs.boolean(request.args.get('refresh', False)):
+            return registry.refresh(name, from_device=True), 200
+        return registry.state(name), 200
+
+
+class RelayAction(Resource):
+    def post(self, name, action):
+        relay = registry.get(name)
+        if relay is None:
+            return {"error": f"Relay '{name}' not found"}, 404
+        if action not in RELAY_ACTIONS:
+            return {"error": f"Unknown action '{action}', expected one of {', '.join(RELAY_ACTIONS)}"}, 400
+
+        body = request.get_json(silent=True) or {}
+        outlets = body.get('outlets', f"1-{len(relay.prev_state)}")
+        step = {"relay": name, "outlets": outlets}
+        for key in ('stagger', 'off_time'):
+            if key in body:
+                step[key] = body[key]
+
+        try:
+            if action == 'toggle':
+                current = registry.state(name)["states"]
+                selected = parse_outlets(outlets)
+                steps = []
+                switch_off = [outlet for outlet in selected if 0 < outlet <= len(current) and current[outlet - 1]]
+                switch_on = [outlet for outlet in selected if outlet not in switch_off]
+                if switch_off:
+                    steps.append(dict(step, action='off', outlets=switch_off))
+                if switch_on:
+                    steps.append(dict(step, action='on', outlets=switch_on))
+            else:
+                steps = [dict(step, action=action)]
+            job_id = sequencer.run_sequence(steps)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"job_id": job_id}, 202
+
+
+class RelaySequences(Resource):
+    def get(self):
+        return {"jobs": sequencer.list_jobs()}, 200
+
+    def post(self):
+        body = request.get_json(silent=True) or {}
+        stop_on_error = body.get('stop_on_error', True)
+        try:
+            # true/false, or "true"/"false", "1"/"0", "on"/"off"
+            stop_on_error = inputs.boolean(stop_on_error if isinstance(stop_on_error, bool) else str(stop_on_error))
+        except ValueError:
+            return {"error": "'stop_on_error' must be true or false"}, 400
+        try:
+            job_id = sequencer.run_sequence(body.get('steps'), stop_on_error=stop_on_error)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"job_id": job_id}, 202
+
+
+class RelaySequence(Resource):
+    def get(self, job_id):
+        job = sequencer.get_job(job_id)
+        if job is None:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        return job, 200
+
+    def delete(self, job_id):
+        if sequencer.get_job(job_id) is None:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        if not sequencer.cancel_job(job_id):
+            return {"error": f"Job '{job_id}' has already finished"}, 409
+        return sequencer.get_job(job_id), 200
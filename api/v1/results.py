@@ -0,0 +1,81 @@
+import io
+import csv
+import json
+from flask import request, Response
+from flask_restful import Resource
+from src.core.result_store import ResultStore, RESULT_FIELDS, FILTER_FIELDS, parse_time
+from src.app.settings import RESULT_QUERY_LIMIT
+
+store = ResultStore()
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'columnar')
+
+def _filters() -> dict:
+    '''Filters of the query string: the record fields plus since / until. Raises ValueError.'''
+    filters = {field: request.args.get(field) for field in FILTER_FIELDS}
+    filters["since"] = parse_time(request.args.get('since'))
+    filters["until"] = parse_time(request.args.get('until'))
+    return filters
+
+
+class Results(Resource):
+    def get(self):
+        '''Matching step records, or per-group statistics when group_by is given (e.g. group_by=flow,day).'''
+        try:
+            filters = _filters()
+            group_by = [field for field in request.args.get('group_by', '').split(',') if field]
+            if group_by or request.args.get('aggregate'):
+                return {"groups": store.aggregate(group_by, **filters)}, 200
+            limit = int(request.args.get('limit', RESULT_QUERY_LIMIT))
+            if limit < 1:
+                raise ValueError("'limit' must be at least 1")
+            limit = min(limit, RESULT_QUERY_LIMIT)
+            results = store.query(limit=limit, **filters)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"count": len(results), "results": results}, 200
+
+
+class ResultExport(Resource):
+    def get(self):
+        '''Every matching record as ndjson (default), csv or columnar JSON ({field: [values]}).'''
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return {"error": f"Unknown format '{export_format}', expected one of {', '.join(EXPORT_FORMATS)}"}, 400
+        try:
+            filters = _filters()
+            lines = store.lines(**filters)
+            first = next(lines, None)   # runs the filter validation before the response starts
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        def records():
+            if first is not None:
+                yield first
+                yield from lines
+
+        if export_format == 'ndjson':
+            # stored lines are already NDJSON, they are sent as they are
+            return Response((line + '\n' for _, line in records()), mimetype='application/x-ndjson')
+
+        if export_format == 'csv':
+            def rows():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(RESULT_FIELDS)
+                for record, _ in records():
+                    writer.writerow([json.dumps(record[field]) if field == "metrics" and record[field] is not None
+                                     else record[field] for field in RESULT_FIELDS])
+                    if buffer.tell() > 64 * 1024:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            return Response(rows(), mimetype='text/csv',
+                            headers={"Content-Disposition": "attachment; filename=results.csv"})
+
+        columns = {field: [] for field in RESULT_FIELDS}
+        for record, _ in records():
+            for field in RESULT_FIELDS:
+                columns[field].append(record[field])
+        return {"count": len(columns["ts"]), "columns": columns}, 200
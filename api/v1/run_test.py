@@ -1,16 +1,46 @@
 from flask_restful import reqparse, Resource
-from src.services.test_executor_service import TestExecutorService
+from src.services.test_executor_service import TestExecutorService, TestScheduler, normalize_resources
+
+
+def resources(value) -> list:
+    '''An object of lists by kind or a list of "kind:name" keys, as a sorted list of keys. Raises ValueError.'''
+    return sorted(normalize_resources(value))
+
 
 parser = reqparse.RequestParser()
+parser.add_argument('test_flow', type=str, required=True)
+parser.add_argument('name', type=str, default=None)
+parser.add_argument('priority', type=int, default=0)
+parser.add_argument('resources', type=resources, default=None, location='json')
+parser.add_argument('parameters', type=dict, default=None, location='json')
+
+scheduler = TestScheduler()
 
 class RunTest(Resource):
+    def get(self):
+        return {"runs": scheduler.list()}, 200
+
     def post(self):
-        parser.add_argument('name', type=str, required=True)
         args = parser.parse_args()
 
-        service = TestExecutorService(args)
-        status = service.entry_point()
+        service = TestExecutorService(args, scheduler)
+        try:
+            run_id = service.entry_point()
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"run_id": run_id, "status": scheduler.get(run_id)["status"]}, 202
+
+
+class TestRunStatus(Resource):
+    def get(self, run_id):
+        run = scheduler.get(run_id)
+        if run is None:
+            return {"error": f"Run '{run_id}' not found"}, 404
+        return run, 200
 
-        if not status:
-            return {"error": "Some error occurred"}, 400
-        return {'status': status}, 201
+    def delete(self, run_id):
+        if scheduler.get(run_id) is None:
+            return {"error": f"Run '{run_id}' not found"}, 404
+        if not scheduler.cancel(run_id):
+            return {"error": f"Run '{run_id}' has already finished"}, 409
+        return scheduler.get(run_id), 200
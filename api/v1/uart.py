@@ -0,0 +1,78 @@
+from flask import request
+from flask_restful import Resource
+from src.core.session_manager import SessionManager
+from src.core.console_watchdog import ConsoleWatchdog
+from src.modules.uart import validate_pipeline
+from src.utils.exception import UartSessionBusy
+
+session_manager = SessionManager()
+watchdog = ConsoleWatchdog()
+
+
+def _positive(value, kind: type, name: str):
+    try:
+        number = kind(value)
+    except (TypeError, ValueError):
+        number = 0
+    if isinstance(value, bool) or number <= 0:
+        raise ValueError(f"'{name}' must be a positive number")
+    return number
+
+
+class UartSessions(Resource):
+    def get(self):
+        return {"sessions": session_manager.sessions()}, 200
+
+
+class UartPipeline(Resource):
+    def post(self):
+        body = request.get_json(silent=True) or {}
+        port = body.get('port')
+        steps = body.get('steps')
+
+        # Validate input
+        if not isinstance(port, str) or not port:
+            return {"error": "'port' is required"}, 400
+        try:
+            validate_pipeline(steps)
+            baudrate = _positive(body.get('baudrate', 115200), int, 'baudrate')
+            lease_timeout = _positive(body.get('lease_timeout', 10), float, 'lease_timeout')
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            with session_manager.lease(port, baudrate=baudrate, timeout=lease_timeout) as uart:
+                result = uart.run_pipeline(steps, variables=body.get('variables'))
+        except UartSessionBusy as e:
+            return {"error": str(e)}, 409
+        except Exception as e:
+            return {"error": f"Error opening UART port {port}: {str(e)}"}, 500
+
+        return result, 200 if result["status"] == "passed" else 422
+
+
+class UartWatchdog(Resource):
+    def get(self):
+        return {"ports": watchdog.ports(), "events": watchdog.recent_events()}, 200
+
+    def post(self):
+        body = request.get_json(silent=True) or {}
+        port = body.get('port')
+        if not isinstance(port, str) or not port:
+            return {"error": "'port' is required"}, 400
+
+        try:
+            baudrate = _positive(body.get('baudrate', 115200), int, 'baudrate')
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        try:
+            watchdog.watch(port, baudrate=baudrate)
+        except Exception as e:
+            return {"error": f"Error opening UART port {port}: {str(e)}"}, 500
+        return {"ports": watchdog.ports()}, 201
+
+    def delete(self):
+        body = request.get_json(silent=True) or {}
+        watchdog.unwatch(body.get('port'))
+        return {"ports": watchdog.ports()}, 200
@@ -1,3 +1,4 @@
+from flask import request
 from flask_restful import reqparse, Resource
 from src.services.workarea_service import WorkareaService
 
@@ -13,3 +14,36 @@ class Workarea(Resource):
         if not success:
             return {"error": "Workarea already exists", "path": path}, 400
         return {'name': args['name']}, 201
+
+
+class WorkareaSync(Resource):
+    def get(self):
+        return {"jobs": service.list_jobs()}, 200
+
+    def post(self):
+        body = request.get_json(silent=True) or {}
+        missing = [key for key in ('device', 'sdk', 'xml_name') if not body.get(key)]
+        if missing:
+            return {"error": f"Missing {', '.join(missing)}"}, 400
+        try:
+            jobs = int(body['jobs']) if body.get('jobs') is not None else None
+            job_id = service.submit_sync(str(body['device']), str(body['sdk']), str(body['xml_name']),
+                                         workarea=body.get('workarea'), jobs=jobs)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        return {"job_id": job_id}, 202
+
+
+class WorkareaSyncJob(Resource):
+    def get(self, job_id):
+        job = service.get_job(job_id)
+        if job is None:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        return job, 200
+
+    def delete(self, job_id):
+        if service.get_job(job_id) is None:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        if not service.cancel_job(job_id):
+            return {"error": f"Job '{job_id}' has already finished"}, 409
+        return service.get_job(job_id), 200
@@ -1,38 +1,102 @@
+import time
 import secrets
+import threading
 from flask import Flask
 from flask_restful import Api
-from flask_socketio import SocketIO
 from src.app.auth import AuthMiddleware
+from src.app.drain import DrainMiddleware, DrainState, HANDED_OFF
+from src.app.socket_server import socketio
+from src.app.message_bus import UnixSocketManager
+from src.utils.file_lock import FileLock
+from src.app.settings import WORKERS, RESUME_INTERVAL
 
 ###################################################################################
 ##########################[ Initializing Flask App ]###############################
 
 app = Flask(__name__)
-app.wsgi_app = AuthMiddleware(app.wsgi_app)
+app.wsgi_app = AuthMiddleware(DrainMiddleware(app.wsgi_app))
 app.secret_key = secrets.token_hex(32)  # Secure random secret key for session/flash
 api = Api(app)
-socketio = SocketIO(app, cors_allowed_origins="*")  # TODO: update CORS origins
+# with several workers, emits are relayed to the clients connected to the other workers
+socketio.init_app(app, cors_allowed_origins="*",  # TODO: update CORS origins
+                  client_manager=UnixSocketManager() if WORKERS > 1 else None)
 
 ###################################################################################
 ################[ Importing Resources & Setting API Route ]########################
 
 # Importing Common APIs
-from api.common.core_api import Home, SetConfig, Version, Update, HealthCheck
+from api.common.core_api import Home, SetConfig, Version, Update, HealthCheck, Metrics
 
 api.add_resource(Home, '/')
 api.add_resource(SetConfig, '/set_config')
 api.add_resource(Version, '/version')
 api.add_resource(Update, '/update')
 api.add_resource(HealthCheck, '/health')
+api.add_resource(Metrics, '/metrics')
 
 # Importing V1 APIs
-from api.v1.workarea import Workarea
-from api.v1.command import Command
-from api.v1.run_test import RunTest
+from api.v1.workarea import Workarea, WorkareaSync, WorkareaSyncJob
+from api.v1.command import Command, CommandBatch, CommandJobs, CommandJob, CommandOutput
+from api.v1.run_test import RunTest, TestRunStatus, scheduler
+from api.v1.uart import UartSessions, UartPipeline, UartWatchdog, watchdog
+from api.v1.relay import RelayList, RelayState, RelayAction, RelaySequences, RelaySequence, registry
+from api.v1.plugins import PluginList, PluginAction
+from api.v1.results import Results, ResultExport
 
 api.add_resource(Workarea, '/api/v1/workarea')
+api.add_resource(WorkareaSync, '/api/v1/workarea/sync')
+api.add_resource(WorkareaSyncJob, '/api/v1/workarea/sync/<string:job_id>')
 api.add_resource(Command, '/api/v1/command')
+api.add_resource(CommandBatch, '/api/v1/command/batch')
+api.add_resource(CommandJobs, '/api/v1/command/jobs')
+api.add_resource(CommandJob, '/api/v1/command/jobs/<string:job_id>')
+api.add_resource(CommandOutput, '/api/v1/command/output/<string:output_id>')
 api.add_resource(RunTest, '/api/v1/run_test')
+api.add_resource(TestRunStatus, '/api/v1/run_test/<string:run_id>')
+api.add_resource(UartSessions, '/api/v1/uart/sessions')
+api.add_resource(UartPipeline, '/api/v1/uart/pipeline')
+api.add_resource(UartWatchdog, '/api/v1/uart/watchdog')
+api.add_resource(RelayList, '/api/v1/relay')
+api.add_resource(RelaySequences, '/api/v1/relay/sequences')
+api.add_resource(RelaySequence, '/api/v1/relay/sequences/<string:job_id>')
+api.add_resource(RelayState, '/api/v1/relay/<string:name>')
+api.add_resource(RelayAction, '/api/v1/relay/<string:name>/<string:action>')
+api.add_resource(PluginList, '/api/v1/plugins')
+api.add_resource(PluginAction, '/api/v1/plugins/<string:name>/<string:action>')
+api.add_resource(Results, '/api/v1/results')
+api.add_resource(ResultExport, '/api/v1/results/export')
+
+from src.services.test_executor_service import TestExecutorService
+
+# Background services run in one worker only, the one holding this lock for its lifetime.
+# After an update the new server's workers wait for it until the old server has exited.
+background_lock = FileLock('background')
+
+def start_background_services():
+    background_lock.acquire(blocking=True)
+
+    # The old server stopped draining only to hand off, this server has taken over now.
+    # A drain of an update that was killed or cut short by a reboot is ended too.
+    drain = DrainState()
+    info = drain.info()
+    if info is not None and (info.get("phase") == HANDED_OFF or drain.stale(info)):
+        drain.end()
+
+    # Start monitoring the consoles listed in config.json
+    watchdog.start_from_config()
+
+    # Initialize the relays of data/relays.json and keep their state cache fresh
+    registry.start()
+
+    # Resume the test runs the old server checkpointed while draining
+    while True:
+        try:
+            TestExecutorService.resume_interrupted(scheduler)
+        except Exception as e:
+            print(f"[ Error ] Failed to resume interrupted test runs : {e}")
+        time.sleep(RESUME_INTERVAL)
+
+threading.Thread(target=start_background_services, name='background-services', daemon=True).start()
 
 ###################################################################################
 #########################[ Running the Flask Application ]#########################
@@ -0,0 +1,64 @@
+import sys
+import time
+from src.plugins.plugin_engine import Plugin, PLUGIN_LIST, dispatcher
+from src.plugins.base_plugin import BasePlugin
+
+# Per-call overhead of the plugin decorators, compared with calling the step directly.
+# Usage: python plugin_benchmark.py [calls]
+
+class CountingPlugin(BasePlugin):
+    def __init__(self):
+        self.calls = 0
+
+    def on_command_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.calls += 1
+
+    def on_command_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.calls += 1
+
+
+class AsyncCountingPlugin(CountingPlugin):
+    # hand-off cost only: events the background thread cannot keep up with are dropped
+    ASYNC = True
+    OVERFLOW_POLICY = 'drop'
+
+
+plugin = Plugin()
+
+class Steps:
+    def raw(self, shared_data: dict = {}) -> bool:
+        return True
+
+    @plugin.on_command
+    def command_step(self, shared_data: dict = {}) -> bool:
+        return True
+
+
+def measure(function, calls: int) -> float:
+    shared_data = {}
+    start = time.perf_counter()
+    for _ in range(calls):
+        function(shared_data)
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    steps = Steps()
+    for name in PLUGIN_LIST.names():
+        dispatcher.disable(name)
+
+    baseline = measure(steps.raw, calls)
+    print(f"direct call                  : {baseline:8.1f} ns/call")
+    print(f"decorated, no subscribers    : {measure(steps.command_step, calls):8.1f} ns/call")
+
+    PLUGIN_LIST.register('counting', CountingPlugin())
+    print(f"decorated, 1 subscriber      : {measure(steps.command_step, calls):8.1f} ns/call")
+
+    dispatcher.disable('counting')
+    print(f"decorated, subscriber disabled: {measure(steps.command_step, calls):8.1f} ns/call")
+
+    PLUGIN_LIST.register('async_counting', AsyncCountingPlugin())
+    print(f"decorated, 1 async subscriber: {measure(steps.command_step, calls):8.1f} ns/call")
+    dispatcher.drain()
+    print(f"async events dropped         : {dispatcher.stats()['async_counting']['async']['dropped']}")
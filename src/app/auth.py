@@ -1,36 +1,165 @@
+import hmac
+import hashlib
+import threading
 from src.app.config_loader import Config
-from src.app.settings import SECURE_PATHS, PUBLIC_PATHS, PROTECTED_PATHS
+from src.app.settings import SECURE_PATHS, PUBLIC_PATHS, PROTECTED_PATHS, AUTH_PATH_CACHE_SIZE
+
+# Path classes
+SECURE = 'secure'
+PUBLIC = 'public'
+PROTECTED = 'protected'
+LOCAL = 'local'
+
+LOCALHOST = frozenset(('127.0.0.1', '::1', 'localhost'))
+ALL_SCOPES = '*'
+
+UNAUTHORIZED = [b'{"error": "Unauthorized: Invalid or missing token."}']
+FORBIDDEN_SCOPE = [b'{"error": "Forbidden: Token is not allowed on this path."}']
+FORBIDDEN_LOCAL = [b'{"error": "Forbidden: Only localhost allowed."}']
+JSON_HEADERS = [('Content-Type', 'application/json')]
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+class TokenSnapshot:
+    '''
+    Tokens of one config version.
+
+    "AUTH_TOKEN" is the token named "default", allowed everywhere. "AUTH_TOKENS"
+    adds named tokens, each limited to path prefixes:
+        {"ci": {"token": "...", "scopes": ["/api/v1/run_test", "/api/v1/results"]}}
+    A scope of "*" (the default) allows every path.
+
+    Tokens are kept as SHA-256 digests, indexed by their first 8 bytes. A
+    lookup finds the candidates through the index (almost always one) and
+    confirms them with hmac.compare_digest on the full digest, so it is O(1)
+    in the number of tokens and its timing does not depend on how much of a
+    token is right. A token configured twice keeps its first name and scopes.
+    '''
+    def __init__(self, config_data: dict, version: int):
+        self.version = version
+        self.tokens = {}    # digest[:8] -> [(digest, name, allowed path prefixes or None for all)]
+        if config_data.get("AUTH_TOKEN"):
+            self._add("default", config_data["AUTH_TOKEN"], [ALL_SCOPES])
+        for name, entry in (config_data.get("AUTH_TOKENS") or {}).items():
+            if isinstance(entry, str):
+                entry = {"token": entry}
+            if isinstance(entry, dict) and entry.get("token"):
+                scopes = entry.get("scopes") or [ALL_SCOPES]
+                if isinstance(scopes, str):
+                    # a bare string would otherwise be matched character by character
+                    print(f"[ Warning ] Scopes of token '{name}' should be a list, using [\"{scopes}\"]")
+                    scopes = [scopes]
+                if not isinstance(scopes, list) or not all(isinstance(scope, str) for scope in scopes):
+                    print(f"[ Error ] Token '{name}' ignored, its scopes must be a list of path prefixes")
+                    continue
+                self._add(name, entry["token"], scopes)
+
+    def _add(self, name: str, token, scopes: list) -> None:
+        digest = _digest(str(token))
+        entries = self.tokens.setdefault(digest[:8], [])
+        for other in entries:
+            if other[0] == digest:
+                print(f"[ Warning ] Token '{name}' is the same as token '{other[1]}', ignored")
+                return
+        entries.append((digest, name, None if ALL_SCOPES in scopes else tuple(scopes)))
+
+    def match(self, token: str) -> tuple:
+        '''(name, scopes) of the token, or None.'''
+        digest = _digest(token)
+        for entry in self.tokens.get(digest[:8], ()):
+            if hmac.compare_digest(digest, entry[0]):
+                return entry[1], entry[2]
+        return None
+
 
 class AuthMiddleware:
-    def __init__(self, app):
+    '''
+    WSGI middleware enforcing the path access lists of settings.
+
+    Paths are classified once (SECURE_PATHS / PUBLIC_PATHS prefixes, exact
+    PROTECTED_PATHS, anything else is localhost only) and the class is cached
+    per path. Tokens come from a snapshot of the config that is only rebuilt
+    when Config.version changes, so a request takes no lock and does no I/O.
+    The name of the matched token is put in environ["sysconn.auth_token"].
+
+    As before named tokens existed, a server without any token configured
+    lets requests without an Authorization header through to SECURE_PATHS.
+    '''
+    def __init__(self, app, config: Config = None, cache_size: int = AUTH_PATH_CACHE_SIZE):
         self.app = app
+        self.config = config or Config()
+        self.cache_size = cache_size
+        self._secure = tuple(SECURE_PATHS)
+        self._public = tuple(PUBLIC_PATHS)
+        self._protected = frozenset(PROTECTED_PATHS)
+        self._classes = {}
+        self._snapshot = TokenSnapshot({}, None)
+        self._lock = threading.Lock()
+
+    def classify(self, url_path: str) -> str:
+        path_class = self._classes.get(url_path)
+        if path_class is not None:
+            return path_class
+        if url_path.startswith(self._secure):
+            path_class = SECURE
+        elif url_path.startswith(self._public):
+            path_class = PUBLIC
+        elif url_path in self._protected:
+            path_class = PROTECTED
+        else:
+            path_class = LOCAL
+        if len(self._classes) >= self.cache_size:
+            # paths carry ids, keep the cache bounded
+            self._classes = {}
+        self._classes[url_path] = path_class
+        return path_class
+
+    def tokens(self) -> TokenSnapshot:
+        snapshot = self._snapshot
+        if snapshot.version == self.config.version:
+            return snapshot
+        with self._lock:
+            if self._snapshot.version != self.config.version:
+                version = self.config.version
+                self._snapshot = TokenSnapshot(self.config.get_data(), version)
+            return self._snapshot
 
     def __call__(self, environ, start_response):
-        url_path = environ.get('PATH_INFO')
-
-        if any(url_path.startswith(path) for path in SECURE_PATHS):
-            token = environ.get('HTTP_AUTHORIZATION')
-            auth_token = Config().get_data().get("AUTH_TOKEN")
-            if token != auth_token:
-                start_response('401 Unauthorized', [('Content-Type', 'application/json')])
-                return [b'{"error": "Unauthorized: Invalid or missing token."}']
-        elif any(url_path.startswith(path) for path in PUBLIC_PATHS):
+        url_path = environ.get('PATH_INFO') or '/'
+        path_class = self.classify(url_path)
+
+        if path_class == SECURE:
+            token = environ.get('HTTP_AUTHORIZATION') or ''
+            if token.startswith('Bearer '):
+                token = token[len('Bearer '):]
+            snapshot = self.tokens()
+            if not snapshot.tokens and not environ.get('HTTP_AUTHORIZATION'):
+                # no token configured yet, e.g. a fresh install
+                return self.app(environ, start_response)
+            entry = snapshot.match(token) if token else None
+            if entry is None:
+                start_response('401 Unauthorized', JSON_HEADERS)
+                return UNAUTHORIZED
+            name, scopes = entry
+            if scopes is not None and not url_path.startswith(scopes):
+                start_response('403 Forbidden', JSON_HEADERS)
+                return FORBIDDEN_SCOPE
+            environ['sysconn.auth_token'] = name
+        elif path_class == PUBLIC:
             # Allow open access to these paths
             pass
-        elif any(url_path == path for path in PROTECTED_PATHS):
-            print("Accessing protected path:", url_path)
+        elif path_class == PROTECTED:
             # If no auth token is set, allow access to PROTECTED_PATHS
             # but restrict other paths to localhost only
-            auth_token = Config().get_data().get("AUTH_TOKEN")
-            print("Auth token from config:", auth_token)
-            if auth_token:
-                if environ.get('REMOTE_ADDR') not in ('127.0.0.1', '::1', 'localhost'):
-                    start_response('403 Forbidden', [('Content-Type', 'application/json')])
-                    return [b'{"error": "Forbidden: Only localhost allowed."}']
-        else:
+            if self.tokens().tokens and environ.get('REMOTE_ADDR') not in LOCALHOST:
+                start_response('403 Forbidden', JSON_HEADERS)
+                return FORBIDDEN_LOCAL
+        elif environ.get('REMOTE_ADDR') not in LOCALHOST:
             # Only allow requests from localhost
-            if environ.get('REMOTE_ADDR') not in ('127.0.0.1', '::1', 'localhost'):
-                start_response('403 Forbidden', [('Content-Type', 'application/json')])
-                return [b'{"error": "Forbidden: Only localhost allowed."}']
+            start_response('403 Forbidden', JSON_HEADERS)
+            return FORBIDDEN_LOCAL
 
-        return self.app(environ, start_response)
\ No newline at end of file
+        return self.app(environ, start_response)
@@ -1,40 +1,109 @@
+import os
 import json
+import time
+import tempfile
 from pathlib import Path
 from src.utils.singleton import SingletonMeta
-from src.app.settings import CONFIG_PATH
+from src.utils.file_lock import FileLock
+from src.app.settings import CONFIG_PATH, CONFIG_CHECK_INTERVAL
 
 class Config(metaclass=SingletonMeta):
-    def __init__(self, config_path=CONFIG_PATH):
-        self.config_path = config_path
+    '''
+    config.json, shared by every worker process.
+
+    Writes go to a temporary file that replaces config.json atomically, so
+    readers never see a half-written file, and update() holds a lock across
+    workers while it re-reads, changes and writes the file, so concurrent
+    updates are not lost. Changes made by other workers (or by hand) are
+    picked up within check_interval seconds, by comparing the file's mtime,
+    size and inode. `version` changes whenever the data does.
+    '''
+    def __init__(self, config_path=CONFIG_PATH, check_interval=CONFIG_CHECK_INTERVAL):
+        self.config_path = Path(config_path)
+        self.check_interval = check_interval
+        self._version = 0
+        self._stamp = None
+        self._checked_at = time.monotonic()
+        self._lock = FileLock('config')
         self.data = {
             "AUTH_TOKEN": None,
             "SUDO_PASSWORD": None
         }
         self.load()
 
+    @property
+    def version(self) -> int:
+        # readers cache what they derive from the data until this changes
+        self.refresh()
+        return self._version
+
+    def _file_stamp(self) -> tuple:
+        try:
+            stat = os.stat(self.config_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def refresh(self) -> bool:
+        '''Reload if the file changed, at most once per check_interval. Returns True if it was reloaded.'''
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        if self._file_stamp() == self._stamp:
+            return False
+        return self.load()
+
     def load(self):
         # Load existing config if available
         if self.config_path.exists():
-            with open(self.config_path, 'r') as f:
-                self.data = json.load(f)
+            stamp = self._file_stamp()
+            try:
+                with open(self.config_path, 'r') as f:
+                    data = json.load(f)
+            except ValueError as e:
+                # e.g. a hand edit in progress; keep the last good data and retry on the next change
+                print(f"[ Error ] Invalid config file {self.config_path} : {e}")
+                self._stamp = stamp
+                return False
+            self.data = data
+            self._stamp = stamp
+            self._version += 1
+            return True
         else:
             # Ensure config directory exists
             self.config_path.parent.mkdir(parents=True, exist_ok=True)
             # Create a default config file
-            with open(self.config_path, 'w') as f:
-                json.dump(self.data, f, indent=4)
+            self.save()
+            return False
 
     def save(self):
-        with open(self.config_path, 'w') as f:
-            json.dump(self.data, f, indent=4)
+        fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=self.config_path.parent)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._stamp = self._file_stamp()
 
     def update(self, new_data):
-        self.data.update(new_data)
-        self.save()
+        with self._lock:
+            # start from what is on disk, another worker may have changed it
+            if self._file_stamp() != self._stamp:
+                self.load()
+            self.data = dict(self.data, **new_data)
+            self._version += 1
+            self.save()
 
     def get_data(self):
+        self.refresh()
         return self.data
 
 # Initialize and load config at module level
 config = Config()
-config.load()
\ No newline at end of file
+config.load()
@@ -1,49 +1,359 @@
 import os
+import re
+import json
+import time
+import atexit
+import sqlite3
 import threading
 from pathlib import Path
 from tinydb import TinyDB, Query
-from typing import Any, Dict, List, Callable
+from tinydb.storages import Storage, touch
+from tinydb.middlewares import CachingMiddleware
+from tinydb.table import Document
+from typing import Any, Dict, List, Callable, Union
+from src.utils.rw_lock import RWLock
+from src.utils.file_lock import FileLock
 from src.utils.singleton import SingletonMeta
-from src.app.settings import DB_PATH
+from src.app.settings import (DB_PATH, DB_BACKEND, DB_SQLITE_PATH, DB_INDEXES, DB_SYNC, DB_WRITE_BEHIND,
+							  DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_INTERVAL, WORKERS)
 
-class DB(metaclass=SingletonMeta):
-	def __init__(self, db_path: str = DB_PATH) -> None:
-		"""Initialize the database client."""
+# A condition is either a {field: value} dict (equality on every field, can use
+# the SQLite indexes) or any callable taking a record, e.g. a TinyDB Query.
+Condition = Union[Dict[str, Any], Callable[[Dict[str, Any]], bool]]
+
+_FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# DB_SYNC -> SQLite synchronous pragma
+_SQLITE_SYNC = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+
+def _as_callable(cond: Condition) -> Callable[[Dict[str, Any]], bool]:
+	if isinstance(cond, dict):
+		return lambda record: all(record.get(field) == value for field, value in cond.items())
+	return cond
+
+
+class AtomicJSONStorage(Storage):
+	"""
+	TinyDB storage that never leaves a half-written file behind: the data is
+	written to a temporary file, fsynced (unless sync is "off") and renamed
+	over the old one. Every read opens the file on its own, so reads can run
+	concurrently.
+	"""
+	def __init__(self, path: str, sync: str = DB_SYNC) -> None:
+		touch(path, create_dirs=True)
+		self.path = str(path)
+		self.sync = sync
+
+	def read(self) -> Dict[str, Any]:
+		with open(self.path, 'r') as f:
+			content = f.read()
+		return json.loads(content) if content.strip() else None
+
+	def write(self, data: Dict[str, Any]) -> None:
+		temp_path = f"{self.path}.tmp"
+		with open(temp_path, 'w') as f:
+			json.dump(data, f)
+			f.flush()
+			if self.sync != "off":
+				os.fsync(f.fileno())
+		os.replace(temp_path, self.path)
+		if self.sync == "full":
+			# make the rename itself durable
+			dir_fd = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+			try:
+				os.fsync(dir_fd)
+			finally:
+				os.close(dir_fd)
+
+	def close(self) -> None:
+		pass
+
+
+class TinyDBBackend:
+	"""
+	Records in one JSON file. Every write rewrites the file, fine for small databases.
+
+	Searches share a read lock and run concurrently, writes are exclusive.
+	With write_behind the file is kept in memory (CachingMiddleware) and only
+	written after batch_size writes, every batch_interval seconds or on flush().
+	"""
+	def __init__(self, db_path: str = DB_PATH, sync: str = DB_SYNC, write_behind: bool = DB_WRITE_BEHIND,
+				 batch_size: int = DB_WRITE_BATCH_SIZE, batch_interval: float = DB_WRITE_BATCH_INTERVAL) -> None:
+		os.makedirs(os.path.dirname(db_path), exist_ok=True)
+		self.write_behind = write_behind
+		storage = CachingMiddleware(AtomicJSONStorage) if write_behind else AtomicJSONStorage
+		self.db: TinyDB = TinyDB(db_path, storage=storage, sync=sync)
+		if write_behind:
+			self.db.storage.WRITE_CACHE_SIZE = batch_size
+			threading.Thread(target=self._flush_loop, args=(batch_interval,), name='db-flush', daemon=True).start()
+		self._lock = RWLock()
+
+	def _records(self) -> List[Document]:
+		# straight from the storage, the table's query cache is not safe for concurrent readers
+		table = (self.db.storage.read() or {}).get(self.db.default_table_name, {})
+		return [Document(dict(record), doc_id=int(doc_id)) for doc_id, record in table.items()]
+
+	def insert(self, data: Dict[str, Any]) -> int:
+		json.dumps(data)	# fail here, not later when a write-behind batch is flushed
+		with self._lock.write():
+			return self.db.insert(data)
+
+	def update(self, fields: Dict[str, Any], cond: Condition) -> List[int]:
+		json.dumps(fields)
+		with self._lock.write():
+			return self.db.update(fields, _as_callable(cond))
+
+	def delete(self, cond: Condition) -> List[int]:
+		with self._lock.write():
+			return self.db.remove(_as_callable(cond))
+
+	def search(self, cond: Condition) -> List[Dict[str, Any]]:
+		cond = _as_callable(cond)
+		with self._lock.read():
+			return [record for record in self._records() if cond(record)]
+
+	def get_all(self) -> List[Dict[str, Any]]:
+		with self._lock.read():
+			return self._records()
+
+	def clear(self) -> None:
+		with self._lock.write():
+			self.db.truncate()
+
+	def flush(self) -> None:
+		if self.write_behind:
+			with self._lock.write():
+				self.db.storage.flush()
+
+	def _flush_loop(self, interval: float) -> None:
+		while True:
+			time.sleep(interval)
+			try:
+				self.flush()
+			except Exception as e:
+				print(f"[ Error ] DB flush failed : {e}")
+
+
+class SQLiteBackend:
+	"""
+	Records as JSON documents in a SQLite table, in WAL mode.
+
+	Writes append a row instead of rewriting a file, and every field in
+	`indexes` gets an expression index so dict conditions on those fields are
+	index lookups instead of scans. Callable conditions still work, they are
+	evaluated on every record.
+
+	Readers use their own per-thread connection and never wait for writers
+	(WAL). Writes go through one writer connection, one at a time. With
+	write_behind they are grouped into one transaction that is committed
+	after batch_size writes, every batch_interval seconds or on flush();
+	readers see them once committed. `sync` is the fsync policy: "full"
+	fsyncs every commit, "normal" fsyncs at WAL checkpoints (a crash never
+	corrupts the database but may lose the last commits), "off" leaves it
+	to the OS.
+	"""
+	def __init__(self, db_path: str = DB_SQLITE_PATH, indexes: List[str] = DB_INDEXES, sync: str = DB_SYNC,
+				 write_behind: bool = DB_WRITE_BEHIND, batch_size: int = DB_WRITE_BATCH_SIZE,
+				 batch_interval: float = DB_WRITE_BATCH_INTERVAL) -> None:
 		os.makedirs(os.path.dirname(db_path), exist_ok=True)
-		
-		self.db: TinyDB = TinyDB(db_path)
+		self.db_path = str(db_path)
+		self.sync = _SQLITE_SYNC[sync]
+		self.write_behind = write_behind
+		self.batch_size = batch_size
+		self._local = threading.local()
+		self._pending = 0
+		self._write_lock = threading.Lock()
+
+		# transactions of the writer are managed explicitly, see _write()
+		self._writer = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+		self._writer.execute("PRAGMA journal_mode=WAL")
+		self._writer.execute(f"PRAGMA synchronous={self.sync}")
+		self._writer.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)")
+		for field in indexes:
+			self._writer.execute(f"CREATE INDEX IF NOT EXISTS idx_{self._field(field)} ON records ({self._expr(field)})")
+
+		if write_behind:
+			threading.Thread(target=self._flush_loop, args=(batch_interval,), name='db-flush', daemon=True).start()
+
+	def _conn(self) -> sqlite3.Connection:
+		# sqlite3 connections must not be shared between threads
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			conn = sqlite3.connect(self.db_path, timeout=30)
+			conn.execute(f"PRAGMA synchronous={self.sync}")
+			self._local.conn = conn
+		return conn
+
+	@staticmethod
+	def _field(field: str) -> str:
+		if not _FIELD_PATTERN.match(field):
+			raise ValueError(f"Invalid field name '{field}'")
+		return field
+
+	def _expr(self, field: str) -> str:
+		# must be written exactly like this in queries for SQLite to use the index
+		return f"json_extract(data, '$.{self._field(field)}')"
+
+	def _where(self, cond: Dict[str, Any]) -> tuple:
+		clauses = []
+		params = []
+		for field, value in cond.items():
+			if value is None:
+				clauses.append(f"{self._expr(field)} IS NULL")
+				continue
+			if isinstance(value, (dict, list)):
+				value = json.dumps(value)
+				clauses.append(f"json({self._expr(field)}) = json(?)")
+			else:
+				clauses.append(f"{self._expr(field)} = ?")
+			params.append(value)
+		return " AND ".join(clauses) or "1", params
+
+	def _select(self, conn: sqlite3.Connection, cond: Condition) -> List[tuple]:
+		if isinstance(cond, dict):
+			where, params = self._where(cond)
+			rows = conn.execute(f"SELECT id, data FROM records WHERE {where} ORDER BY id", params).fetchall()
+			return [(row_id, json.loads(data)) for row_id, data in rows]
+		rows = conn.execute("SELECT id, data FROM records ORDER BY id").fetchall()
+		records = ((row_id, json.loads(data)) for row_id, data in rows)
+		return [(row_id, record) for row_id, record in records if cond(record)]
+
+	def _write(self, operation: Callable[[sqlite3.Connection], Any]) -> Any:
+		"""Run operation(conn) on the writer, in its own savepoint so a failure never discards a pending batch."""
+		with self._write_lock:
+			conn = self._writer
+			if not conn.in_transaction:
+				conn.execute("BEGIN")
+			conn.execute("SAVEPOINT write_op")
+			try:
+				result = operation(conn)
+			except Exception:
+				conn.execute("ROLLBACK TO write_op")
+				conn.execute("RELEASE write_op")
+				if not self._pending:
+					conn.execute("COMMIT")
+				raise
+			conn.execute("RELEASE write_op")
+			self._pending += 1
+			if not self.write_behind or self._pending >= self.batch_size:
+				self._commit()
+			return result
+
+	def _commit(self) -> None:
+		# called with the write lock held
+		if self._writer.in_transaction:
+			self._writer.execute("COMMIT")
+		self._pending = 0
+
+	def insert(self, data: Dict[str, Any], doc_id: int = None) -> int:
+		data = json.dumps(data)
+		return self._write(lambda conn: conn.execute("INSERT INTO records (id, data) VALUES (?, ?)", (doc_id, data)).lastrowid)
+
+	def update(self, fields: Dict[str, Any], cond: Condition) -> List[int]:
+		def operation(conn):
+			matched = self._select(conn, cond)
+			for row_id, record in matched:
+				record.update(fields)
+				conn.execute("UPDATE records SET data = ? WHERE id = ?", (json.dumps(record), row_id))
+			return [row_id for row_id, _ in matched]
+		return self._write(operation)
+
+	def delete(self, cond: Condition) -> List[int]:
+		def operation(conn):
+			ids = [row_id for row_id, _ in self._select(conn, cond)]
+			conn.executemany("DELETE FROM records WHERE id = ?", [(row_id,) for row_id in ids])
+			return ids
+		return self._write(operation)
+
+	def search(self, cond: Condition) -> List[Dict[str, Any]]:
+		return [record for _, record in self._select(self._conn(), cond)]
+
+	def get_all(self) -> List[Dict[str, Any]]:
+		rows = self._conn().execute("SELECT data FROM records ORDER BY id").fetchall()
+		return [json.loads(data) for (data,) in rows]
+
+	def clear(self) -> None:
+		self._write(lambda conn: conn.execute("DELETE FROM records"))
+
+	def flush(self) -> None:
+		"""Commit pending write-behind writes."""
+		with self._write_lock:
+			self._commit()
+
+	def _flush_loop(self, interval: float) -> None:
+		while True:
+			time.sleep(interval)
+			try:
+				self.flush()
+			except Exception as e:
+				print(f"[ Error ] DB flush failed : {e}")
+
+	def is_empty(self) -> bool:
+		return self._conn().execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+	def migrate_from_json(self, json_path: str) -> int:
+		"""Copy the records of a TinyDB JSON file (keeping their ids) and rename the file to *.migrated."""
+		json_path = Path(json_path)
+		if not json_path.exists():
+			return 0
+
+		# every worker gets here at import, only the first one migrates
+		with FileLock('db-migrate'):
+			if not json_path.exists() or not self.is_empty():
+				return 0
+
+			with open(json_path, 'r') as f:
+				content = f.read().strip()
+			table = json.loads(content).get("_default", {}) if content else {}
+			rows = [(int(doc_id), json.dumps(record)) for doc_id, record in table.items()]
+			self._write(lambda conn: conn.executemany("INSERT INTO records (id, data) VALUES (?, ?)", rows))
+			self.flush()
+			os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+		print(f"[ Info ] Migrated {len(table)} records from {json_path} to {self.db_path}")
+		return len(table)
+
+
+class DB(metaclass=SingletonMeta):
+	def __init__(self, db_path: str = None, backend: str = DB_BACKEND) -> None:
+		"""Initialize the database client with the 'sqlite' or 'tinydb' backend."""
+		if backend == "sqlite":
+			self.backend = SQLiteBackend(db_path or DB_SQLITE_PATH)
+			self.backend.migrate_from_json(DB_PATH)
+		elif backend == "tinydb":
+			if WORKERS > 1:
+				print("[ Warning ] The tinydb backend is not safe with several workers, use DB_BACKEND = \"sqlite\"")
+			self.backend = TinyDBBackend(db_path or DB_PATH)
+		else:
+			raise ValueError(f"Unknown DB backend '{backend}'")
 		self.query: Query = Query()
-		self._lock = threading.Lock()
+		# write-behind batches must reach the disk on a clean shutdown
+		atexit.register(self.flush)
 
 	def insert(self, data: Dict[str, Any]) -> int:
 		"""Insert a new record into the database."""
-		with self._lock:
-			return self.db.insert(data)
+		return self.backend.insert(data)
 
-	def update(self, fields: Dict[str, Any], cond: Callable[[Dict[str, Any]], bool]) -> List[int]:
+	def update(self, fields: Dict[str, Any], cond: Condition) -> List[int]:
 		"""Update records matching the condition."""
-		with self._lock:
-			return self.db.update(fields, cond)
+		return self.backend.update(fields, cond)
 
-	def delete(self, cond: Callable[[Dict[str, Any]], bool]) -> List[int]:
+	def delete(self, cond: Condition) -> List[int]:
 		"""Delete records matching the condition."""
-		with self._lock:
-			return self.db.remove(cond)
+		return self.backend.delete(cond)
 
-	def search(self, cond: Callable[[Dict[str, Any]], bool]) -> List[Dict[str, Any]]:
+	def search(self, cond: Condition) -> List[Dict[str, Any]]:
 		"""Search for records matching the condition."""
-		with self._lock:
-			return self.db.search(cond)
+		return self.backend.search(cond)
 
 	def get_all(self) -> List[Dict[str, Any]]:
 		"""Get all records from the database."""
-		with self._lock:
-			return self.db.all()
+		return self.backend.get_all()
 
 	def clear(self) -> None:
 		"""Remove all records from the database."""
-		with self._lock:
-			self.db.truncate()
-
-
+		self.backend.clear()
 
+	def flush(self) -> None:
+		"""Write out pending write-behind writes now."""
+		self.backend.flush()
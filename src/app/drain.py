@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import tempfile
+from src.utils.singleton import SingletonMeta
+from src.app.settings import DRAIN_FILE, DRAIN_CHECK_INTERVAL, DRAIN_BLOCKED_PATHS, UPDATE_HEALTH_TIMEOUT
+
+# Update phases, kept in the drain file
+DRAINING = 'draining'
+HANDING_OFF = 'handing_off'
+HANDED_OFF = 'handed_off'      # the new server ends the drain once it has taken over
+
+
+def pid_alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DrainState(metaclass=SingletonMeta):
+    '''
+    Whether the server is draining before a restart, shared by every worker.
+
+    The state is a small JSON file (DRAIN_FILE) that exists while draining;
+    workers check for it at most every check_interval seconds, so asking
+    costs a clock read most of the time. A drain whose update process is gone
+    (killed, host rebooted) or that overran its deadline is stale and ends
+    on the next check.
+    '''
+    def __init__(self, path=DRAIN_FILE, check_interval: float = DRAIN_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._active = False
+        self._checked_at = 0.0
+
+    @property
+    def active(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            active = os.path.exists(self.path)
+            if active and self.stale():
+                print(f"[ Warning ] Ending the drain left behind by update process {(self.info() or {}).get('pid')}")
+                self.end()
+                active = False
+            self._active = active
+            self._checked_at = now
+        return self._active
+
+    def stale(self, info: dict = None) -> bool:
+        '''
+        True if the drain was left behind: the process that began it is gone,
+        or it is past the deadline plus the time a hand-off may take.
+        '''
+        info = self.info() if info is None else info
+        if info is None:
+            return False
+        deadline = info.get("deadline")
+        if not isinstance(deadline, (int, float)):
+            return True
+        return not pid_alive(info.get("pid")) or time.time() > deadline + UPDATE_HEALTH_TIMEOUT
+
+    def info(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def begin(self, deadline: float, **info) -> None:
+        self.write(dict(info, phase=DRAINING, pid=os.getpid(), started_at=time.time(), deadline=deadline))
+
+    def write(self, info: dict) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.draining-', dir=os.path.dirname(self.path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self.path)
+        self._active, self._checked_at = True, time.monotonic()
+
+    def update(self, **info) -> None:
+        current = self.info()
+        if current is not None:
+            self.write(dict(current, **info))
+
+    def end(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._active, self._checked_at = False, time.monotonic()
+
+
+class DrainMiddleware:
+    '''
+    While draining, requests that would start new work (POST/PUT under
+    DRAIN_BLOCKED_PATHS) get 503 with Retry-After; reads, cancels and
+    streams of running work are still served.
+    '''
+    def __init__(self, app, state: DrainState = None):
+        self.app = app
+        self.state = state or DrainState()
+        self._blocked = tuple(DRAIN_BLOCKED_PATHS)
+
+    def __call__(self, environ, start_response):
+        if (self.state.active and environ.get('REQUEST_METHOD') in ('POST', 'PUT')
+                and (environ.get('PATH_INFO') or '/').startswith(self._blocked)):
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'), ('Retry-After', '30')])
+            return [b'{"error": "Server is draining for a restart, retry later."}']
+        return self.app(environ, start_response)
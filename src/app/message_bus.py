@@ -0,0 +1,60 @@
+import os
+import pickle
+import socket
+from pathlib import Path
+from socketio import PubSubManager
+from src.app.settings import SOCKETIO_BUS_DIR, SOCKETIO_BUS_MAX_MESSAGE
+
+
+class UnixSocketManager(PubSubManager):
+    '''
+    Socket.IO client manager relaying emits between the worker processes of one host.
+
+    Stands in for a Redis/AMQP message_queue: every worker binds a Unix
+    datagram socket <bus_dir>/<channel>-<pid>.sock, and a publish is sent to
+    every socket in the directory (its own included, as with a Redis
+    channel), so an emit to a room reaches clients connected to any worker.
+    Sockets of workers that are gone are removed by the next publish.
+    '''
+    name = 'unixsocket'
+
+    def __init__(self, bus_dir: Path = SOCKETIO_BUS_DIR, channel: str = 'socketio', write_only: bool = False,
+                 logger=None, max_message: int = SOCKETIO_BUS_MAX_MESSAGE):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus_dir = Path(bus_dir)
+        self.max_message = max_message
+        os.makedirs(self.bus_dir, exist_ok=True)
+        self.path = self.bus_dir / f"{channel}-{os.getpid()}.sock"
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, max_message)
+
+    def _publish(self, data):
+        message = pickle.dumps(data)
+        if len(message) > self.max_message:
+            print(f"[ Error ] Socket.IO message of {len(message)} bytes is too large for the worker bus")
+            return
+        for path in self.bus_dir.glob(f"{self.channel}-*.sock"):
+            try:
+                self._sender.sendto(message, str(path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # nobody listens there any more, the worker exited
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            except OSError as e:
+                print(f"[ Error ] Socket.IO message to {path.name} failed : {e}")
+
+    def _listen(self):
+        if self.path.exists():
+            self.path.unlink()  # left over by an earlier process with the same pid
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.max_message)
+        receiver.bind(str(self.path))
+        try:
+            while True:
+                yield receiver.recv(self.max_message)
+        finally:
+            receiver.close()
+            if self.path.exists():
+                self.path.unlink()
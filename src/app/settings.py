@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Application Version
@@ -9,8 +10,124 @@ API_VERSION = "v1"
 # File Paths
 CONFIG_PATH = Path.cwd() / "data" / "config.json"
 DB_PATH = Path.cwd() / "data" / "db" / "main_db.json"
+DB_SQLITE_PATH = Path.cwd() / "data" / "db" / "main_db.sqlite3"
+
+# Database
+DB_BACKEND = "sqlite"           # "sqlite" (WAL, indexed) or "tinydb" (single JSON file); sqlite migrates DB_PATH on first start
+DB_INDEXES = ["kind", "job_id", "run_id", "status", "timestamp"]    # record fields with a SQLite index
+DB_SYNC = "normal"              # fsync policy: "full" every commit, "normal" crash-safe but may lose the last commits, "off"
+DB_WRITE_BEHIND = False         # group writes and commit them in batches instead of one by one
+DB_WRITE_BATCH_SIZE = 100       # write-behind: commit after this many writes...
+DB_WRITE_BATCH_INTERVAL = 0.5   # ...or after this many seconds, whichever comes first
 
 # API Path Access Control Lists
-SECURE_PATHS = ['/api/', '/update'] # paths that always require auth token
-PUBLIC_PATHS = ['/docs', '/version', "/health"] # open access to these paths
+SECURE_PATHS = ['/api/', '/update', '/socket.io/'] # paths that always require auth token
+PUBLIC_PATHS = ['/docs', '/version', "/health", "/metrics"] # open access to these paths
 PROTECTED_PATHS = ['/set_config', '/'] # if auth token is not set, allow access to these paths but restrict other paths to localhost only
+AUTH_PATH_CACHE_SIZE = 4096     # request paths whose access class is cached by the auth middleware
+
+# Command Streaming
+STREAM_READ_CHUNK = 4096        # max bytes read per line from a command pipe
+STREAM_BACKLOG_LINES = 200      # chunks replayed to late Socket.IO subscribers
+
+# Command Jobs
+COMMAND_MAX_WORKERS = 8         # commands running concurrently, the rest wait in the queue
+JOB_HISTORY_LIMIT = 500         # finished jobs kept in memory, older ones live only in the DB
+BATCH_MAX_PARALLELISM = 16      # upper bound for the parallelism of one batch request
+BATCH_MAX_COMMANDS = 200        # commands accepted in one batch request
+
+# Command Output Capture
+OUTPUT_SPILL_DIR = Path.cwd() / "workareas" / ".outputs"
+OUTPUT_MEMORY_LIMIT = 64 * 1024     # bytes kept in memory per stream before spilling to disk
+OUTPUT_EXCERPT_BYTES = 8 * 1024     # head/tail bytes returned for spilled output
+OUTPUT_RETENTION = 24 * 60 * 60     # seconds a spill file is kept
+
+# UART Sessions
+UART_SESSION_IDLE_TIMEOUT = 300     # seconds an unused port stays open before it is closed
+UART_SESSION_REAP_INTERVAL = 30     # seconds between idle session checks
+UART_HANDOVER_POLL = 0.5            # seconds between requests to the worker holding a port to release it
+UART_BUFFER_SIZE = 1024 * 1024      # bytes of console history kept per port by the reader thread
+UART_EXPECT_OVERLAP = 1024          # bytes rescanned per wakeup so matches spanning two reads are found
+UART_READ_TIMEOUT = 0.05            # serial read timeout of the reader thread, in seconds
+
+# UART Logs
+UART_LOG_MAX_BYTES = 64 * 1024 * 1024   # rotate a console log once it reaches this size (0 = never)
+UART_LOG_ROTATE_INTERVAL = 24 * 60 * 60 # rotate a console log after this many seconds (0 = never)
+UART_LOG_BACKUP_COUNT = 20              # compressed segments kept per log
+UART_LOG_QUEUE_SIZE = 4096              # chunks buffered before new ones are dropped
+UART_LOG_FLUSH_INTERVAL = 0.2           # seconds the writer waits to batch more chunks
+
+# Console Watchdog
+WATCHDOG_PATTERNS = {           # name -> regex, overridable with WATCHDOG_PATTERNS in config.json
+    "kernel_panic": r"Kernel panic - not syncing",
+    "oops": r"Internal error: Oops|BUG: unable to handle|Unable to handle kernel",
+    "watchdog_reset": r"[Ww]atchdog.*(reset|expired|timeout)",
+    "segfault": r"Segmentation fault",
+}
+WATCHDOG_CONTEXT_BEFORE = 20    # lines attached from before the match
+WATCHDOG_CONTEXT_AFTER = 20     # lines attached from after the match
+WATCHDOG_CONTEXT_TIMEOUT = 2.0  # seconds to wait for the after-context before firing anyway
+WATCHDOG_MAX_LINE = 4096        # longer lines are cut so a port without newlines cannot grow memory
+WATCHDOG_HISTORY = 200          # recent events kept for the API
+WATCHDOG_REOPEN_INTERVAL = 2.0  # seconds between attempts to reopen a watched port another worker had open
+
+# Relays
+RELAY_CONFIG_PATH = Path.cwd() / "data" / "relays.json"
+RELAY_STATE_DIR = Path.cwd() / "workareas" / ".relays"   # last known outlet states, shared by the workers
+RELAY_POLL_INTERVAL = 10        # seconds between background re-reads of every relay's outlets
+RELAY_STATE_CHECK_INTERVAL = 0.5    # seconds a cached relay state is used before its state file is checked again
+RELAY_STATE_TTL = 5.0           # seconds cached IP relay outlet states are trusted before a re-read
+RELAY_HTTP_TIMEOUT = 5          # seconds per IP relay HTTP request
+RELAY_HTTP_POOL_SIZE = 4        # keep-alive connections kept per IP relay
+RELAY_RESET_OFF_TIME = 1.0      # seconds an outlet stays off during a reset step
+RELAY_SEQUENCE_MAX_STEPS = 500  # steps accepted in one relay sequence
+
+# Timers
+TIMER_WHEEL_TICK = 0.01         # seconds per timer wheel tick (scheduling resolution)
+TIMER_WHEEL_SLOTS = 512         # slots per revolution of the timer wheel
+
+# Test Runs
+TEST_MAX_WORKERS = 8            # test runs executing at the same time
+FLOW_MAX_PARALLEL_STAGES = 8    # stages of one DAG flow running at the same time
+TEST_LOG_DIR = Path.cwd() / "workareas" / ".runs"    # one log directory per run id
+
+# Plugins
+PLUGIN_QUEUE_SIZE = 1024        # events queued per async plugin
+PLUGIN_OVERFLOW_POLICY = "drop" # when an async plugin's queue is full: "block", "drop" or "sample"
+PLUGIN_SAMPLE_EVERY = 10        # "sample": keep one event in this many once the queue is half full
+
+# Test Results
+RESULT_STORE_DIR = Path.cwd() / "data" / "results"  # one NDJSON file of step results per UTC day
+RESULT_BATCH_SIZE = 500         # buffered step records that trigger a write
+RESULT_FLUSH_INTERVAL = 1.0     # seconds buffered step records wait at most before being written
+RESULT_QUERY_LIMIT = 1000       # records returned by a result query unless it asks for fewer
+
+# Metrics
+METRICS_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)    # seconds
+
+# Workers
+WORKERS = int(os.environ.get("SYSCONN_WORKERS", "1"))   # gunicorn worker processes, set by start_server.sh
+LOCK_DIR = Path.cwd() / "workareas" / ".locks"          # lock files shared by the workers (config, UART ports, ...)
+CONFIG_CHECK_INTERVAL = 1.0     # seconds between checks whether another worker changed config.json
+SOCKETIO_BUS_DIR = Path.cwd() / "workareas" / ".bus"    # Unix sockets relaying Socket.IO emits between workers
+SOCKETIO_BUS_MAX_MESSAGE = 1024 * 1024                  # bytes, larger Socket.IO messages are not relayed
+UART_TAP_DIR = Path.cwd() / "workareas" / ".uart"       # Unix sockets sharing UART ports between workers
+METRICS_DIR = Path.cwd() / "workareas" / ".metrics"     # per-worker metric snapshots merged by /metrics
+METRICS_SNAPSHOT_INTERVAL = 5.0 # seconds between metric snapshots of each worker
+
+# Updates
+UPDATE_DRAIN_TIMEOUT = 4 * 60 * 60  # seconds /update waits for running jobs and tests before giving up (or forcing)
+UPDATE_HEALTH_TIMEOUT = 120         # seconds the new server has to answer /health before the old one keeps serving
+GUNICORN_PID_FILE = Path.cwd() / "logs" / "gunicorn.pid"   # --pid of start_server.sh
+DRAIN_FILE = LOCK_DIR / "draining"  # exists while the server drains for a restart
+DRAIN_CHECK_INTERVAL = 0.5          # seconds between checks of the drain state by each worker
+DRAIN_BLOCKED_PATHS = ['/api/v1/command', '/api/v1/run_test', '/api/v1/relay', '/api/v1/uart',
+                       '/api/v1/workarea', '/update']    # POST/PUT get 503 while draining
+RESUME_INTERVAL = 5                 # seconds between checks for test runs left queued by a replaced server
+
+# Repo sync
+REPO_MANIFEST_DIR = Path.cwd() / "data" / "manifests"   # <device>/<sdk>/<xml_name> manifests for repo_sync
+REPO_MIRROR_DIR = Path.cwd() / "workareas" / ".mirror"  # bare mirrors whose objects every workarea shares
+REPO_SYNC_JOBS = 4                  # repositories fetched in parallel by one sync
+REPO_SYNC_MAX_WORKERS = 2           # syncs running at once in a worker process
+REPO_SYNC_TIMEOUT = 60 * 60         # seconds a single git command may take
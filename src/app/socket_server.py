@@ -0,0 +1,5 @@
+from flask_socketio import SocketIO
+
+# Shared Socket.IO instance, bound to the Flask app in app.py via init_app().
+# Services and API modules import it from here to avoid importing app.py.
+socketio = SocketIO()
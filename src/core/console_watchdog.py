@@ -0,0 +1,225 @@
+import time
+import queue
+import threading
+from collections import deque
+from src.app.config_loader import Config
+from src.core.session_manager import SessionManager
+from src.plugins.plugin_engine import Plugin
+from src.utils.pattern_matcher import MultiPattern
+from src.utils.singleton import SingletonMeta
+from src.utils.exception import UartSessionBusy
+from src.app.settings import (WATCHDOG_PATTERNS, WATCHDOG_CONTEXT_BEFORE, WATCHDOG_CONTEXT_AFTER,
+                              WATCHDOG_CONTEXT_TIMEOUT, WATCHDOG_MAX_LINE, WATCHDOG_HISTORY,
+                              WATCHDOG_REOPEN_INTERVAL)
+
+
+class PortMonitor:
+    '''
+    Line assembly and matching for one port.
+
+    feed() runs on the port's reader thread. Complete lines of a chunk are
+    scanned with a single search of the combined pattern; only when that
+    finds something are the lines looked at one by one.
+    '''
+    def __init__(self, port: str, names: list, matcher: MultiPattern, context_before: int, context_after: int):
+        self.port = port
+        self.names = names
+        self.matcher = matcher
+        self.context_after = context_after
+        self.history = deque(maxlen=context_before)
+        self.pending = []
+        self.lock = threading.Lock()
+        self._partial = b''
+
+    def feed(self, data: bytes) -> list:
+        '''Consume a chunk, return the events whose after-context is complete.'''
+        with self.lock:
+            return self._feed(data)
+
+    def _feed(self, data: bytes) -> list:
+        data = self._partial + data
+        cut = data.rfind(b'\n') + 1
+        self._partial = data[cut:][-WATCHDOG_MAX_LINE:]
+        if not cut:
+            return []
+
+        block = data[:cut]
+        lines = block.split(b'\n')[:-1]
+        ready = []
+
+        if self.pending:
+            for line in lines:
+                for event in self.pending:
+                    if len(event["after"]) < self.context_after:
+                        event["after"].append(self._decode(line))
+            ready = [event for event in self.pending if len(event["after"]) >= self.context_after]
+            self.pending = [event for event in self.pending if len(event["after"]) < self.context_after]
+
+        # fast path: one scan of the whole block, nothing matched
+        if self.matcher.search(block) is None:
+            self.history.extend(lines)
+            return ready
+
+        for position, line in enumerate(lines):
+            found = self.matcher.search(line)
+            if found is not None:
+                event = {
+                    "port": self.port,
+                    "pattern": self.names[found[0]],
+                    "line": self._decode(line),
+                    "before": [self._decode(item) for item in self.history],
+                    "after": [self._decode(item) for item in lines[position + 1:position + 1 + self.context_after]],
+                    "timestamp": time.time(),
+                }
+                if len(event["after"]) >= self.context_after:
+                    ready.append(event)
+                else:
+                    self.pending.append(event)
+            self.history.append(line)
+        return ready
+
+    def expire(self, now: float, timeout: float) -> list:
+        '''Pending events that waited long enough for their after-context.'''
+        with self.lock:
+            ready = [event for event in self.pending if now - event["timestamp"] >= timeout]
+            if ready:
+                self.pending = [event for event in self.pending if now - event["timestamp"] < timeout]
+            return ready
+
+    @staticmethod
+    def _decode(line: bytes) -> str:
+        return line.rstrip(b'\r').decode('iso8859-1')
+
+
+class ConsoleWatchdog(metaclass=SingletonMeta):
+    '''
+    Watches the console of every monitored UART port for critical patterns
+    (kernel panic, oops, watchdog reset, segfault, ...), also while no test
+    is using the port.
+
+    It listens to the SessionManager reader threads, so it sees exactly what
+    the ports receive without competing for the fd. A watched port is kept
+    open while idle, but never held against another worker: that worker takes
+    it over, its reads arrive through the PortTap, and the port is reopened
+    here once it is closed there. Matches are reported as
+    the `on_console_match` plugin event, with the surrounding lines attached,
+    from a separate dispatcher thread so plugins never slow down the readers.
+    '''
+    EVENT_NAME = 'on_console_match'
+
+    def __init__(self, patterns: dict = None, context_before: int = WATCHDOG_CONTEXT_BEFORE,
+                 context_after: int = WATCHDOG_CONTEXT_AFTER, context_timeout: float = WATCHDOG_CONTEXT_TIMEOUT):
+        patterns = patterns or Config().get_data().get("WATCHDOG_PATTERNS") or WATCHDOG_PATTERNS
+        self.names = list(patterns)
+        self.matcher = MultiPattern([patterns[name] for name in self.names])
+        self.context_before = context_before
+        self.context_after = context_after
+        self.context_timeout = context_timeout
+        self.plugin = Plugin()
+        self.events = deque(maxlen=WATCHDOG_HISTORY)
+        self._monitors = {}
+        self._baudrates = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        session_manager = SessionManager()
+        session_manager.add_listener(self._on_data)
+        if session_manager.tap is not None:
+            session_manager.tap.subscribe(self._on_data)
+        threading.Thread(target=self._dispatch_loop, name='console-watchdog', daemon=True).start()
+        threading.Thread(target=self._expire_loop, name='console-watchdog-expire', daemon=True).start()
+        threading.Thread(target=self._reopen_loop, name='console-watchdog-reopen', daemon=True).start()
+
+    def start_from_config(self) -> None:
+        '''Watch the ports listed in WATCHDOG_PORTS of config.json, if any.'''
+        for item in Config().get_data().get("WATCHDOG_PORTS") or []:
+            try:
+                if isinstance(item, str):
+                    self.watch(item)
+                else:
+                    self.watch(item["port"], baudrate=int(item.get("baudrate", 115200)))
+            except Exception as e:
+                print(f"[ Error ] Console watchdog could not open {item} : {e}")
+
+    def watch(self, port: str, baudrate: int = 115200) -> None:
+        '''
+        Start monitoring `port`. Its session is opened and pinned so it stays open
+        while idle, unless another worker has the port open.
+        '''
+        self.start()
+        with self._lock:
+            if port not in self._monitors:
+                self._monitors[port] = PortMonitor(port, self.names, self.matcher, self.context_before, self.context_after)
+            self._baudrates[port] = baudrate
+        self._open(port, baudrate)
+
+    def unwatch(self, port: str) -> None:
+        with self._lock:
+            self._monitors.pop(port, None)
+            self._baudrates.pop(port, None)
+        SessionManager().pin(port, False)
+
+    def ports(self) -> list:
+        with self._lock:
+            return list(self._monitors)
+
+    def recent_events(self) -> list:
+        return list(self.events)
+
+    def _on_data(self, port: str, data: bytes) -> None:
+        # runs on the reader thread of `port`
+        monitor = self._monitors.get(port)
+        if monitor is None:
+            return
+        for event in monitor.feed(data):
+            self._queue.put(event)
+
+    @staticmethod
+    def _open(port: str, baudrate: int) -> bool:
+        session_manager = SessionManager()
+        try:
+            # never taken over: a worker that has the port open keeps it, its reads come through the tap
+            with session_manager.lease(port, baudrate=baudrate, timeout=0, take_over=False):
+                pass
+        except UartSessionBusy:
+            return False
+        session_manager.pin(port)
+        return True
+
+    def _reopen_loop(self) -> None:
+        while True:
+            time.sleep(WATCHDOG_REOPEN_INTERVAL)
+            with self._lock:
+                ports = dict(self._baudrates)
+            for port, baudrate in ports.items():
+                if SessionManager().is_open(port):
+                    continue
+                try:
+                    self._open(port, baudrate)
+                except Exception:
+                    pass    # unplugged, tried again on the next round
+
+    def _expire_loop(self) -> None:
+        while True:
+            time.sleep(self.context_timeout / 2)
+            now = time.time()
+            with self._lock:
+                monitors = list(self._monitors.values())
+            for monitor in monitors:
+                for event in monitor.expire(now, self.context_timeout):
+                    self._queue.put(event)
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            event = self._queue.get()
+            self.events.append(event)
+            try:
+                self.plugin.notify(self.EVENT_NAME, event)
+            except Exception as e:
+                print(f"[ Error ] Console watchdog failed to dispatch {event['pattern']} on {event['port']} : {e}")
@@ -0,0 +1,180 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class Job:
+    '''A unit of background work tracked by the JobManager.'''
+    def __init__(self, job_id: str, kind: str, metadata: dict = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.metadata = metadata or {}
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.cancel_event = threading.Event()
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def on_cancel(self, callback: callable) -> None:
+        '''Register a callback that stops the running work (e.g. kill a process).'''
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+            cancelled = self.cancel_event.is_set()
+        if cancelled:
+            callback()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancel_event.set()
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[JOB MANAGER] Exception in cancel callback of job {self.job_id}: {e}")
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        data.update(self.metadata)
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    '''
+    Runs jobs on a bounded thread pool. Submitting never blocks: jobs beyond
+    max_workers wait in the executor queue. Finished jobs are kept in memory
+    up to history_limit and handed to on_finish (e.g. to persist them).
+    With max_workers=0 there is no pool and jobs can only be track()ed.
+    '''
+    def __init__(self, max_workers: int, history_limit: int = 500, on_finish: callable = None, name: str = 'job'):
+        self.max_workers = max_workers
+        self.history_limit = history_limit
+        self.on_finish = on_finish
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name) if max_workers else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: callable, *args, kind: str = 'job', metadata: dict = None, job_id: str = None, **kwargs) -> Job:
+        '''Queue fn(job, *args, **kwargs) and return the Job handle.'''
+        if self._executor is None:
+            raise RuntimeError("This JobManager only tracks jobs, it has no worker pool")
+        job = Job(job_id or uuid.uuid4().hex, kind, metadata)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job, fn, *args, **kwargs)
+        return job
+
+    def track(self, kind: str = 'job', metadata: dict = None, job_id: str = None) -> Job:
+        '''
+        Register a job that is driven elsewhere (e.g. by timers) instead of a
+        pool worker. It starts RUNNING and must be completed with finish().
+        '''
+        job = Job(job_id or uuid.uuid4().hex, kind, metadata)
+        job.status = RUNNING
+        job.started_at = time.time()
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        return job
+
+    def finish(self, job: Job, status: str = None) -> None:
+        '''Complete a tracked job. Without status it is derived like for pooled jobs.'''
+        if job.finished:
+            return
+        if status is None:
+            if job.cancel_event.is_set():
+                status = CANCELLED
+            else:
+                status = FAILED if job.error else SUCCEEDED
+        self._finish(job, status)
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def cancel(self, job_id: str) -> bool:
+        '''Cancel a queued or running job. Returns False if unknown or already finished.'''
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+
+        job.cancel()
+        if job.future is not None and job.future.cancel():
+            # never started, the worker will not run it
+            self._finish(job, CANCELLED)
+        return True
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn: callable, *args, **kwargs) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            if job.cancel_event.is_set():
+                status = CANCELLED
+            else:
+                status = FAILED if job.error else SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            status = FAILED
+        self._finish(job, status)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                print(f"[JOB MANAGER] Exception in on_finish of job {job.job_id}: {e}")
+
+    def _prune(self) -> None:
+        # drop the oldest finished jobs, queued and running ones are always kept
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._jobs[job_id]
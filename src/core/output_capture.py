@@ -0,0 +1,101 @@
+import os
+import re
+import time
+import threading
+from pathlib import Path
+from src.app.settings import OUTPUT_SPILL_DIR, OUTPUT_MEMORY_LIMIT, OUTPUT_EXCERPT_BYTES, OUTPUT_RETENTION
+
+OUTPUT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}-(stdout|stderr)$')
+
+
+class OutputCapture:
+    '''
+    Bounded-memory capture of one output stream.
+
+    Output is kept in memory until it grows past memory_limit. From then on
+    everything is written to a spill file under OUTPUT_SPILL_DIR, and only the
+    first and last excerpt_bytes stay in memory. Spilled output can be read
+    back by its output_id, see get_output_path().
+    '''
+    def __init__(self, output_id: str, memory_limit: int = OUTPUT_MEMORY_LIMIT, excerpt_bytes: int = OUTPUT_EXCERPT_BYTES,
+                 spill_dir: Path = OUTPUT_SPILL_DIR):
+        self.output_id = output_id
+        self.memory_limit = memory_limit
+        self.excerpt_bytes = excerpt_bytes
+        self.spill_dir = Path(spill_dir)
+        self.size = 0
+        self.path = None
+        self._buffer = bytearray()
+        self._head = b''
+        self._tail = bytearray()
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    def write(self, data: bytes) -> None:
+        with self._lock:
+            self.size += len(data)
+            if self._file is None:
+                self._buffer += data
+                if len(self._buffer) > self.memory_limit:
+                    self._spill()
+                return
+
+            self._file.write(data)
+            self._tail += data
+            if len(self._tail) > self.excerpt_bytes:
+                del self._tail[:len(self._tail) - self.excerpt_bytes]
+
+    def _spill(self) -> None:
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        cleanup_outputs(self.spill_dir)
+        self.path = self.spill_dir / self.output_id
+        self._file = open(self.path, 'wb')
+        self._file.write(self._buffer)
+        self._head = bytes(self._buffer[:self.excerpt_bytes])
+        self._tail = bytearray(self._buffer[-self.excerpt_bytes:])
+        self._buffer = bytearray()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def text(self) -> str:
+        '''Full output if it fit in memory, head and tail excerpts otherwise.'''
+        with self._lock:
+            if not self.spilled:
+                return self._buffer.decode('utf-8', errors='replace')
+            skipped = self.size - len(self._head) - len(self._tail)
+            marker = f"\n... [{skipped} bytes truncated, fetch output '{self.output_id}' for the full log] ...\n"
+            return self._head.decode('utf-8', errors='replace') + marker + self._tail.decode('utf-8', errors='replace')
+
+    def info(self) -> dict:
+        return {
+            "size": self.size,
+            "truncated": self.spilled,
+            "output_id": self.output_id if self.spilled else None,
+        }
+
+
+def get_output_path(output_id: str, spill_dir: Path = OUTPUT_SPILL_DIR) -> Path:
+    '''Resolve an output id to its spill file, None for unknown or malformed ids.'''
+    if not output_id or not OUTPUT_ID_PATTERN.match(output_id):
+        return None
+    path = Path(spill_dir) / output_id
+    return path if path.is_file() else None
+
+
+def cleanup_outputs(spill_dir: Path = OUTPUT_SPILL_DIR, max_age: float = OUTPUT_RETENTION) -> None:
+    '''Remove spill files older than max_age seconds.'''
+    cutoff = time.time() - max_age
+    for entry in os.scandir(spill_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,107 @@
+import os
+import time
+import socket
+import threading
+from pathlib import Path
+from src.app.settings import UART_TAP_DIR
+
+DATA = b'D'
+RELEASE = b'R'
+MAX_CHUNK = 64 * 1024       # bytes of console data per datagram
+SUBSCRIBER_TTL = 1.0        # seconds the list of subscribed workers is reused before the directory is read again
+
+
+class PortTap:
+    '''
+    Shares the UART ports of the host between worker processes, over Unix
+    datagram sockets in tap_dir.
+
+    A port is open in one worker at a time (its lock file). That worker sends
+    every chunk it reads to the subscribed workers (tap-<pid>.sock), so the
+    console watchdog sees a port whichever worker has it open. A worker that
+    needs a port asks the holder (<pid>.sock) to release it, which it does
+    as soon as its session of the port is idle.
+    '''
+    def __init__(self, directory: Path = UART_TAP_DIR):
+        self.directory = Path(directory)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._receivers = {}
+        self._subscribers = []
+        self._subscribers_at = 0.0
+        self._lock = threading.Lock()
+
+    def serve(self, on_release: callable) -> None:
+        '''on_release(port) is called when another worker asks for a port. Only binds once.'''
+        self._bind(f"{os.getpid()}.sock", on_release)
+
+    def subscribe(self, on_data: callable) -> None:
+        '''on_data(port, data) receives the chunks other workers read from their ports. Only binds once.'''
+        self._bind(f"tap-{os.getpid()}.sock", on_data)
+
+    def publish(self, port: str, data: bytes) -> None:
+        # runs on the reader thread: never blocks, a subscriber that is behind misses the chunk
+        header = DATA + port.encode() + b'\0'
+        for path in self._subscribed():
+            for offset in range(0, len(data), MAX_CHUNK):
+                if not self._send(path, header + data[offset:offset + MAX_CHUNK]):
+                    break
+
+    def request_release(self, port: str, pid: int) -> bool:
+        '''Ask worker `pid` to release `port`. False if it cannot be reached.'''
+        if not pid or pid == os.getpid():
+            return False
+        return self._send(self.directory / f"{pid}.sock", RELEASE + port.encode())
+
+    def _subscribed(self) -> list:
+        now = time.monotonic()
+        if now - self._subscribers_at > SUBSCRIBER_TTL:
+            own = f"tap-{os.getpid()}.sock"
+            # the own worker's subscriber already gets its reads from the SessionManager listeners
+            self._subscribers = [path for path in self.directory.glob("tap-*.sock") if path.name != own]
+            self._subscribers_at = now
+        return self._subscribers
+
+    def _send(self, path: Path, message: bytes) -> bool:
+        try:
+            self._sender.sendto(message, str(path))
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            # nobody listens there any more, the worker exited
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print(f"[ Error ] UART tap message to {path.name} failed : {e}")
+        return False
+
+    def _bind(self, name: str, callback: callable) -> None:
+        with self._lock:
+            if name in self._receivers:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.directory / name
+            if path.exists():
+                path.unlink()   # left over by an earlier process with the same pid
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * MAX_CHUNK)
+            receiver.bind(str(path))
+            self._receivers[name] = receiver
+        threading.Thread(target=self._receive, args=(receiver, callback), name=f'uart-tap-{name}', daemon=True).start()
+
+    @staticmethod
+    def _receive(receiver: socket.socket, callback: callable) -> None:
+        while True:
+            message = receiver.recv(MAX_CHUNK + 4096)
+            kind, body = message[:1], message[1:]
+            try:
+                if kind == DATA:
+                    port, _, data = body.partition(b'\0')
+                    callback(port.decode(), data)
+                elif kind == RELEASE:
+                    callback(body.decode())
+            except Exception as e:
+                print(f"[ Error ] UART tap failed to handle a message : {e}")
@@ -0,0 +1,104 @@
+import importlib
+import threading
+
+
+class LazyRegistry:
+    '''
+    Named objects that are imported and instantiated on first use.
+
+    Entries are registered as "package.module:Name" paths (or the class /
+    instance itself). Nothing is imported until an entry is looked up; the
+    class is then imported, instantiated without arguments and the instance
+    cached. Packages can add entries through the `entry_point_group` entry
+    point group, which is only read on the first lookup of an unknown name
+    or the first listing.
+    '''
+    def __init__(self, specs: dict = None, entry_point_group: str = None, kind: str = 'object'):
+        self.entry_point_group = entry_point_group
+        self.kind = kind
+        self._specs = dict(specs or {})
+        self._instances = {}
+        self.version = 0    # bumped whenever the set of entries changes
+        self._entry_points_loaded = entry_point_group is None
+        self._lock = threading.RLock()
+
+    def register(self, name: str, spec) -> None:
+        '''spec: "package.module:Name", a class, or a ready instance.'''
+        with self._lock:
+            self._specs[name] = spec
+            self._instances.pop(name, None)
+            self.version += 1
+
+    def names(self) -> list:
+        self._load_entry_points()
+        with self._lock:
+            return list(self._specs)
+
+    def loaded(self) -> list:
+        '''Names instantiated so far.'''
+        with self._lock:
+            return list(self._instances)
+
+    def get(self, name: str, default=None):
+        '''Instance registered as `name`, importing it if needed. Import errors are raised.'''
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+        if name not in self:
+            return default
+
+        with self._lock:
+            # another thread may have finished loading while we waited
+            if name not in self._instances:
+                self._instances[name] = self._instantiate(self._specs[name])
+            return self._instances[name]
+
+    def values(self) -> list:
+        '''Every instance, in registration order. Entries that fail to load are reported and left out.'''
+        instances = []
+        for name in self.names():
+            try:
+                instances.append(self.get(name))
+            except Exception as e:
+                print(f"[ Error ] Failed to load {self.kind} '{name}' : {e}")
+        return instances
+
+    def __getitem__(self, name: str):
+        if name not in self:
+            raise KeyError(name)
+        return self.get(name)
+
+    def __contains__(self, name) -> bool:
+        with self._lock:
+            if name in self._specs:
+                return True
+        self._load_entry_points()
+        with self._lock:
+            return name in self._specs
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self) -> int:
+        return len(self.names())
+
+    def _load_entry_points(self) -> None:
+        with self._lock:
+            if self._entry_points_loaded:
+                return
+            self._entry_points_loaded = True
+            # importlib.metadata alone costs tens of ms, only pay for it when needed
+            from importlib.metadata import entry_points
+            # entry points only name the object, it is imported on first use like any other spec
+            for entry_point in entry_points(group=self.entry_point_group):
+                self._specs.setdefault(entry_point.name, entry_point.value)
+            self.version += 1
+
+    @staticmethod
+    def _instantiate(spec):
+        if isinstance(spec, str):
+            module_name, _, attribute = spec.partition(':') if ':' in spec else spec.rpartition('.')
+            spec = importlib.import_module(module_name)
+            for part in attribute.split('.'):
+                spec = getattr(spec, part)
+        return spec() if isinstance(spec, type) else spec
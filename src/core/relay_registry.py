@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from src.modules.relay import RelayFactory
+from src.utils.file_lock import FileLock
+from src.utils.singleton import SingletonMeta
+from src.app.settings import RELAY_CONFIG_PATH, RELAY_STATE_DIR, RELAY_POLL_INTERVAL, RELAY_STATE_CHECK_INTERVAL
+
+
+class RelayRegistry(metaclass=SingletonMeta):
+    '''
+    Named relays from data/relays.json, plus a shared cache of their outlet states.
+
+    Every worker process has the relays, but device I/O goes through
+    device(), which holds a lock file per relay, so writes of different
+    workers never interleave. The last known states are kept in
+    state_dir/<name>.json, loaded into the relay before each use and written
+    back after it, so every worker reports and toggles from the same state.
+
+    The cache is a copy-on-write dict: writers replace it as a whole and
+    readers just take the current reference, so reading the state of the
+    whole fleet never locks and never touches a device. Whether another
+    worker replaced a state file is checked at most every check_interval
+    seconds per relay, so most reads are a dict lookup and a clock read. It
+    is kept current by write-through (after every relay write) and a
+    background poll every poll_interval seconds for changes made outside
+    this server.
+    '''
+    RESERVED_NAMES = ('sequences',)
+
+    def __init__(self, config_path=RELAY_CONFIG_PATH, poll_interval: float = RELAY_POLL_INTERVAL,
+                 state_dir: Path = RELAY_STATE_DIR, check_interval: float = RELAY_STATE_CHECK_INTERVAL):
+        self.config_path = config_path
+        self.poll_interval = poll_interval
+        self.check_interval = check_interval
+        self.state_dir = Path(state_dir)
+        self.relays = {}
+        self._types = {}
+        self._errors = {}
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._poller = None
+
+    def load(self) -> None:
+        '''Create the relays listed in the config file. Relays that fail to be created are reported in the cache.'''
+        if not self.config_path.exists():
+            print(f"[ Info ] No relay config at {self.config_path}, relay API has no relays")
+            return
+        with open(self.config_path, 'r') as f:
+            config = json.load(f)
+
+        for name, spec in config.items():
+            if name in self.RESERVED_NAMES:
+                print(f"[ Error ] Relay name '{name}' is reserved, skipped")
+                continue
+            spec = dict(spec)
+            relay_type = spec.pop("type", None)
+            self._types[name] = relay_type
+            try:
+                self.relays[name] = RelayFactory.create_relay(relay_type, **spec)
+            except Exception as e:
+                print(f"[ Error ] Failed to create relay '{name}' : {e}")
+                self._errors[name] = str(e)
+
+    def start(self) -> None:
+        '''Initialize the relays and keep polling them, on a background thread.'''
+        with self._lock:
+            if self._poller is not None:
+                return
+            self._poller = threading.Thread(target=self._poll_loop, name='relay-poller', daemon=True)
+        self._poller.start()
+
+    def get(self, name: str):
+        return self.relays.get(name)
+
+    @contextmanager
+    def device(self, name: str):
+        '''
+        The relay `name` for device I/O, exclusive across workers. Its states
+        are loaded from the shared store first and stored back afterwards, with
+        the error if the block raised.
+        '''
+        relay = self.relays[name]
+        with FileLock(f"relay-{name}"):
+            entry = self._read(name)
+            if entry is not None and entry["states"]:
+                relay.prev_state = list(entry["states"])
+            error = None
+            try:
+                yield relay
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                try:
+                    relay.close()
+                except Exception as e:
+                    print(f"[ Error ] Failed to close relay '{name}' : {e}")
+                self._store(name, relay.prev_state, error=error)
+
+    def states(self) -> dict:
+        '''Cached state of every relay, {name: {type, states, updated_at, error}}.'''
+        return {name: self.state(name) for name in self._types}
+
+    def state(self, name: str) -> dict:
+        if name not in self._types:
+            return None
+        now = time.monotonic()
+        cached = self._snapshot.get(name)
+        if cached is not None and now - cached[2] < self.check_interval:
+            return cached[1]
+        version = self._version(name)
+        if cached is not None and cached[0] == version:
+            self._cache(name, version, cached[1])
+            return cached[1]
+
+        entry = self._read(name) if version is not None else None
+        if entry is None:
+            # nothing stored yet
+            relay = self.relays.get(name)
+            entry = self._entry(name, relay.prev_state if relay is not None else [], self._errors.get(name))
+            entry["updated_at"] = None
+        self._cache(name, version, entry)
+        return entry
+
+    def refresh(self, name: str, from_device: bool = False) -> dict:
+        '''Update the stored state of one relay from what the relay object knows (or from the device).'''
+        if name not in self.relays:
+            return self.state(name)
+        try:
+            with self.device(name) as relay:
+                relay.get_state(refresh=from_device)
+        except Exception:
+            pass    # stored with the error
+        return self.state(name)
+
+    def _path(self, name: str) -> Path:
+        return self.state_dir / (re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.json')
+
+    def _version(self, name: str) -> tuple:
+        try:
+            stat = self._path(name).stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _read(self, name: str) -> dict:
+        try:
+            with open(self._path(name), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _entry(self, name: str, states: list, error: str = None) -> dict:
+        return {
+            "type": self._types.get(name),
+            "states": [bool(state) for state in states],
+            "updated_at": time.time(),
+            "error": error,
+        }
+
+    def _store(self, name: str, states: list, error: str = None) -> dict:
+        # called with the relay's lock file held, the file is replaced so readers never see half of it
+        entry = self._entry(name, states, error)
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.state-', dir=self.state_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        path = self._path(name)
+        os.replace(tmp_path, path)
+        self._cache(name, self._version(name), entry)
+        return entry
+
+    def _cache(self, name: str, version: tuple, entry: dict) -> None:
+        with self._lock:
+            snapshot = dict(self._snapshot)
+            snapshot[name] = (version, entry, time.monotonic())
+            self._snapshot = snapshot
+
+    def _poll_loop(self) -> None:
+        for name in list(self.relays):
+            try:
+                with self.device(name) as relay:
+                    relay.initialize()
+            except Exception as e:
+                print(f"[ Error ] Failed to initialize relay '{name}' : {e}")
+                continue
+            self.refresh(name)
+
+        while True:
+            time.sleep(self.poll_interval)
+            for name in list(self.relays):
+                self.refresh(name, from_device=True)
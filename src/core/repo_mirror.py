@@ -0,0 +1,59 @@
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from src.utils.file_lock import FileLock
+from src.utils.exception import GitError
+from src.app.settings import REPO_MIRROR_DIR, REPO_SYNC_TIMEOUT
+
+
+def run_git(args: list, cwd=None, timeout: float = REPO_SYNC_TIMEOUT) -> str:
+    '''Run git, return its stdout. Raises GitError on a non-zero exit or timeout.'''
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")     # never wait for credentials on a headless node
+    try:
+        result = subprocess.run(["git", *args], cwd=cwd, env=env, timeout=timeout,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except subprocess.TimeoutExpired:
+        raise GitError(f"git {args[0]} timed out after {timeout}s")
+    if result.returncode != 0:
+        raise GitError(f"git {' '.join(args[:2])} failed : {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+class RepoMirror:
+    '''
+    Node-local bare mirrors of remote repositories, one per fetch URL.
+
+    Workareas clone from a mirror with --shared, so their object store is
+    the mirror's (through .git/objects/info/alternates): a checkout of a
+    multi-GB tree copies no objects, and only the mirror talks to the
+    remote. A mirror is fetched under a lock file, so syncs in other
+    workers or processes wait instead of fetching it twice. The mirror
+    never prunes unreachable objects, workareas may still use them.
+    '''
+    def __init__(self, directory: Path = REPO_MIRROR_DIR):
+        self.directory = Path(directory)
+
+    def path(self, url: str) -> Path:
+        name = re.sub(r'[^A-Za-z0-9._-]+', '_', url.split('://', 1)[-1]).strip('_.')
+        return self.directory / (name if name.endswith('.git') else f"{name}.git")
+
+    def update(self, url: str) -> tuple:
+        '''Clone or fetch the mirror of url. Returns (mirror path, "cloned" or "fetched").'''
+        path = self.path(url)
+        os.makedirs(self.directory, exist_ok=True)
+        with FileLock(f"mirror-{path.name}"):
+            if (path / "HEAD").exists():
+                run_git(["fetch", "--prune", "--tags", "origin"], cwd=path)
+                return path, "fetched"
+
+            # clone next to the final path, an interrupted clone never looks like a mirror
+            partial = path.with_name(f".{path.name}.partial")
+            if partial.exists():
+                shutil.rmtree(partial)
+            run_git(["clone", "--mirror", url, str(partial)])
+            run_git(["config", "gc.pruneExpire", "never"], cwd=partial)
+            run_git(["config", "gc.auto", "0"], cwd=partial)
+            os.replace(partial, path)
+            return path, "cloned"
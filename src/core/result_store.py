@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import atexit
+import threading
+from pathlib import Path
+from collections import deque
+from datetime import datetime, timezone
+from src.utils.singleton import SingletonMeta
+from src.app.settings import RESULT_STORE_DIR, RESULT_BATCH_SIZE, RESULT_FLUSH_INTERVAL
+
+# fields of a step record, in export column order
+RESULT_FIELDS = ["ts", "run_id", "flow", "board", "step", "event", "status", "duration", "error", "metrics"]
+FILTER_FIELDS = ["run_id", "flow", "board", "step", "event", "status"]
+GROUP_FIELDS = FILTER_FIELDS + ["day", "hour"]
+
+
+def parse_time(value) -> float:
+    '''Epoch seconds or an ISO 8601 date/time (UTC unless it has an offset) -> epoch seconds.'''
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError(f"Invalid time '{value}', expected epoch seconds or ISO 8601")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _percentile(values: list, fraction: float) -> float:
+    # values must be sorted
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ResultStore(metaclass=SingletonMeta):
+    '''
+    Append-only store of per-step test results.
+
+    Records are JSON lines in one file per UTC day (results-YYYY-MM-DD.ndjson),
+    so a time range query only opens the files of the days it covers.
+    append() serializes the record and buffers the line; a flush thread writes
+    the buffer out in one write per file every flush_interval seconds, or as
+    soon as batch_size lines are waiting. Queries flush first, so they always
+    see every appended record.
+    '''
+    def __init__(self, directory: Path = RESULT_STORE_DIR, batch_size: int = RESULT_BATCH_SIZE,
+                 flush_interval: float = RESULT_FLUSH_INTERVAL):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._buffer = []
+        self._lock = threading.Lock()           # guards _buffer
+        self._write_lock = threading.Lock()     # one flush at a time, keeps lines in order
+        self._wakeup = threading.Event()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='result-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def append(self, record: dict) -> None:
+        '''Buffer one step record. Unknown fields are dropped, missing ones are null.'''
+        record = {field: record.get(field) for field in RESULT_FIELDS}
+        if record["ts"] is None:
+            record["ts"] = time.time()
+        # serialized here so a bad record fails in the caller and not in the flush thread
+        line = json.dumps(record, separators=(',', ':'), default=str)
+        with self._lock:
+            self._buffer.append((self._day(record["ts"]), line))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, []
+            if not buffer:
+                return
+            days = {}
+            for day, line in buffer:
+                days.setdefault(day, []).append(line)
+            for day, lines in days.items():
+                with open(self._path(day), 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+            self.written += len(buffer)
+
+    def lines(self, since: float = None, until: float = None, **filters) -> iter:
+        '''
+        Yield (record, line) for every stored record in [since, until) whose
+        fields equal the given filters (None filters are ignored), oldest day first.
+        '''
+        self.flush()
+        filters = {field: value for field, value in filters.items() if value is not None}
+        for field in filters:
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unknown filter '{field}', expected one of {', '.join(FILTER_FIELDS)}")
+        # records are written compactly, so a record can only match if these substrings are in its line
+        needles = [f'"{field}":{json.dumps(value, separators=(",", ":"))}' for field, value in filters.items()]
+
+        for path in self._files(since, until):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not all(needle in line for needle in needles):
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue    # torn last line after a crash
+                    if since is not None and record["ts"] < since:
+                        continue
+                    if until is not None and record["ts"] >= until:
+                        continue
+                    if all(record.get(field) == value for field, value in filters.items()):
+                        yield record, line.rstrip('\n')
+
+    def query(self, since: float = None, until: float = None, limit: int = None, **filters) -> list:
+        '''The newest `limit` matching records, oldest first.'''
+        records = deque((record for record, _ in self.lines(since, until, **filters)), maxlen=limit or None)
+        return list(records)
+
+    def aggregate(self, group_by: list = None, since: float = None, until: float = None, **filters) -> list:
+        '''
+        Pass rate and duration statistics per group, e.g. group_by=["flow", "day"].
+        Steps count as passed, failed or error by their status.
+        '''
+        group_by = list(group_by or [])
+        for field in group_by:
+            if field not in GROUP_FIELDS:
+                raise ValueError(f"Unknown group_by field '{field}', expected one of {', '.join(GROUP_FIELDS)}")
+
+        groups = {}
+        for record, _ in self.lines(since, until, **filters):
+            key = tuple(self._group_value(record, field) for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"count": 0, "passed": 0, "failed": 0, "error": 0, "durations": [],
+                                       "first": record["ts"], "last": record["ts"]}
+            group["count"] += 1
+            if record.get("status") in ("passed", "failed", "error"):
+                group[record["status"]] += 1
+            if isinstance(record.get("duration"), (int, float)):
+                group["durations"].append(record["duration"])
+            group["first"] = min(group["first"], record["ts"])
+            group["last"] = max(group["last"], record["ts"])
+
+        results = []
+        for key, group in sorted(groups.items(), key=lambda item: tuple(str(value) for value in item[0])):
+            durations = sorted(group.pop("durations"))
+            row = dict(zip(group_by, key))
+            row.update(group)
+            row["pass_rate"] = round(group["passed"] / group["count"], 4)
+            row["duration"] = {
+                "avg": round(sum(durations) / len(durations), 6) if durations else None,
+                "p50": _percentile(durations, 0.5),
+                "p95": _percentile(durations, 0.95),
+                "max": durations[-1] if durations else None,
+            }
+            results.append(row)
+        return results
+
+    @staticmethod
+    def _group_value(record: dict, field: str):
+        if field == "day":
+            return datetime.fromtimestamp(record["ts"], timezone.utc).strftime('%Y-%m-%d')
+        if field == "hour":
+            return datetime.fromtimestamp(record["ts"], timezone.utc).strftime('%Y-%m-%dT%H:00')
+        return record.get(field)
+
+    @staticmethod
+    def _day(ts: float) -> str:
+        return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+    def _path(self, day: str) -> Path:
+        return self.directory / f"results-{day}.ndjson"
+
+    def _files(self, since: float = None, until: float = None) -> list:
+        first = self._day(since) if since is not None else None
+        # until is exclusive, a range ending exactly at midnight does not need that day's file
+        last = self._day(until - 1e-6) if until is not None else None
+        files = []
+        for path in sorted(self.directory.glob('results-*.ndjson')):
+            day = path.stem[len('results-'):]
+            if (first is None or day >= first) and (last is None or day <= last):
+                files.append(path)
+        return files
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ Error ] Result store flush failed : {e}")
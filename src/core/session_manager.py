@@ -0,0 +1,227 @@
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from src.modules.uart import Uart
+from src.utils.singleton import SingletonMeta
+from src.utils.file_lock import FileLock
+from src.utils.exception import UartSessionBusy
+from src.core.port_tap import PortTap
+from src.app.settings import UART_SESSION_IDLE_TIMEOUT, UART_SESSION_REAP_INTERVAL, UART_HANDOVER_POLL, WORKERS
+
+
+class UartSession:
+    '''
+    One long-lived Uart connection. The lock serializes callers of the port
+    within this process; port_lock keeps other worker processes off the port
+    while the session is open.
+    '''
+    def __init__(self, port: str, uart: Uart, listeners: list = None):
+        self.port = port
+        self.uart = uart
+        self.listeners = listeners if listeners is not None else []
+        self.lock = threading.RLock()
+        self.port_lock = FileLock(f"uart-{port}")
+        self.last_used = time.monotonic()
+        self.pinned = False
+        self.broken = False
+
+    def ensure_connected(self, handover: callable = None, deadline: float = None) -> None:
+        '''
+        handover(port, pid) asks the worker holding the port to release it; it
+        is asked again until the port is free or the deadline (time.monotonic())
+        has passed.
+        '''
+        # reconnect if the fd died (board reset, usb re-plug) or a caller hit an I/O error
+        if self.broken or not self.uart.is_connected():
+            while not self.port_lock.acquire():
+                owner = self.port_lock.owner()
+                remaining = UART_HANDOVER_POLL if deadline is None else min(UART_HANDOVER_POLL, deadline - time.monotonic())
+                if handover is None or remaining <= 0 or not handover(self.port, owner):
+                    raise UartSessionBusy(f"UART port {self.port} is in use in another worker (pid {owner})")
+                if self.port_lock.acquire(blocking=True, timeout=remaining):
+                    break
+            self.uart.disconnect()
+            self.uart.connect()
+            self.broken = False
+            if self.uart.reader is not None:
+                for listener in self.listeners:
+                    self.uart.reader.add_listener(functools.partial(listener, self.port))
+
+    def close(self) -> None:
+        self.uart.disconnect()
+        self.port_lock.release()
+
+
+class SessionManager(metaclass=SingletonMeta):
+    '''
+    Pool of persistent UART connections, one per port.
+
+    Callers borrow a port with lease(), which serializes access per port and
+    reconnects automatically when needed. Sessions unused for idle_timeout
+    seconds are closed by a background reaper thread.
+
+    With several workers, a port open in another worker is taken over through
+    the PortTap: the holder closes its session once it is idle. What a
+    session reads is also sent to the tap's subscribers.
+    '''
+    def __init__(self, idle_timeout: float = UART_SESSION_IDLE_TIMEOUT, reap_interval: float = UART_SESSION_REAP_INTERVAL,
+                 tap: PortTap = None):
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.tap = tap if tap is not None else (PortTap() if WORKERS > 1 else None)
+        self._sessions = {}
+        self._listeners = [self.tap.publish] if self.tap is not None else []
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @contextmanager
+    def lease(self, port: str, baudrate: int = 115200, timeout: float = None, take_over: bool = True, **uart_kwargs):
+        '''
+        Borrow the Uart of `port`, waiting up to `timeout` seconds (forever if None)
+        for other holders, in this worker or, with take_over, in other workers.
+        Raises UartSessionBusy if the port stays busy.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        session = self._acquire(port, baudrate, deadline, **uart_kwargs)
+        handover = self.tap.request_release if take_over and self.tap is not None else None
+        try:
+            if session.uart.uart_port_info['baudrate'] != baudrate:
+                session.uart.uart_port_info['baudrate'] = baudrate
+                session.broken = True
+            session.ensure_connected(handover, deadline)
+            yield session.uart
+        except UartSessionBusy:
+            # the port never opened here, do not keep an empty session around
+            with self._lock:
+                if self._sessions.get(port) is session:
+                    del self._sessions[port]
+            raise
+        except (OSError, IOError):
+            session.broken = True
+            raise
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+
+    def add_listener(self, listener: callable) -> None:
+        '''
+        listener(port, data) receives every chunk read on every session's reader
+        thread, from the next (re)connect on. Must be fast, it runs on the reader.
+        '''
+        with self._lock:
+            self._listeners.append(listener)
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            reader = session.uart.reader
+            if reader is not None:
+                reader.add_listener(functools.partial(listener, session.port))
+
+    def pin(self, port: str, pinned: bool = True) -> None:
+        '''Pinned sessions are never closed by the idle reaper.'''
+        with self._lock:
+            if port in self._sessions:
+                self._sessions[port].pinned = pinned
+
+    def is_open(self, port: str) -> bool:
+        '''True if this worker has `port` open.'''
+        with self._lock:
+            session = self._sessions.get(port)
+        return session is not None and session.port_lock.locked
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def sessions(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "port": session.port,
+                "baudrate": session.uart.uart_port_info['baudrate'],
+                "idle": round(now - session.last_used, 3),
+                "pinned": session.pinned,
+            } for session in self._sessions.values()]
+
+    def close(self, port: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(port, None)
+        if session is None:
+            return False
+        with session.lock:
+            session.close()
+        return True
+
+    def release(self, port: str) -> bool:
+        '''Close the session of `port` unless it is in use, so another worker can open the port.'''
+        with self._lock:
+            session = self._sessions.get(port)
+        if session is None or not session.lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if self._sessions.get(port) is session:
+                    del self._sessions[port]
+            session.close()
+        finally:
+            session.lock.release()
+        print(f"[ Info ] UART port {port} released for another worker")
+        return True
+
+    def close_all(self) -> None:
+        with self._lock:
+            ports = list(self._sessions)
+        for port in ports:
+            self.close(port)
+
+    def _acquire(self, port: str, baudrate: int, deadline: float, **uart_kwargs) -> UartSession:
+        while True:
+            session = self._get_session(port, baudrate, **uart_kwargs)
+            wait = -1 if deadline is None else max(0, deadline - time.monotonic())
+            if not session.lock.acquire(timeout=wait):
+                raise UartSessionBusy(f"UART port {port} is busy")
+            with self._lock:
+                registered = self._sessions.get(port) is session
+            if registered:
+                return session
+            # the reaper closed this session while we were waiting, take a fresh one
+            session.lock.release()
+
+    def _get_session(self, port: str, baudrate: int, **uart_kwargs) -> UartSession:
+        with self._lock:
+            session = self._sessions.get(port)
+            if session is None:
+                uart_kwargs.setdefault('use_reader', True)
+                session = UartSession(port, Uart(port, baudrate=baudrate, **uart_kwargs), self._listeners)
+                self._sessions[port] = session
+                if self.tap is not None:
+                    self.tap.serve(self.release)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name='uart-session-reaper', daemon=True)
+                self._reaper.start()
+            return session
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap_idle()
+
+    def reap_idle(self) -> None:
+        '''Close sessions that are idle for longer than idle_timeout and not in use.'''
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [session for session in self._sessions.values()
+                    if not session.pinned and session.last_used < cutoff]
+        for session in idle:
+            # skip sessions that got leased in the meantime
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                if session.last_used >= cutoff:
+                    continue
+                with self._lock:
+                    if self._sessions.get(session.port) is session:
+                        del self._sessions[session.port]
+                session.close()
+            finally:
+                session.lock.release()
@@ -1,8 +1,15 @@
 import serial
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 from abc import ABC, abstractmethod
+from src.utils.metrics import REGISTRY
+from src.app.settings import RELAY_STATE_TTL, RELAY_HTTP_TIMEOUT, RELAY_HTTP_POOL_SIZE
+
+RELAY_REQUEST_SECONDS = REGISTRY.histogram('sysconn_relay_request_duration_seconds',
+                                           'Duration of IP relay outlet write requests.', ('address', 'result'))
+RELAY_REQUESTS_IN_FLIGHT = REGISTRY.gauge('sysconn_relay_requests_in_flight', 'IP relay requests waiting for a reply.', ('address',))
 
 init_command=[b"\x50", b"\x51"]
 
@@ -31,18 +38,46 @@ class Relay(ABC):
         """Power on reset the specified relay."""
         raise NotImplementedError("This method should be overridden by subclasses")
 
+    def get_state(self, refresh=False):
+        """Last known outlet states. Relays that cannot be read back only know what was written."""
+        return list(self.prev_state)
+
+    def set_states(self, states):
+        """Set several outlets at once, e.g. {1: 0, 2: 0, 5: 1}. Returns True if all writes succeeded."""
+        success = True
+        for relay_no, state in states.items():
+            if self.set_state(relay_no, state) is False:
+                success = False
+        return success
+
+    def close(self):
+        """Release the device connection, if the relay keeps one. It is reopened on the next write."""
+        pass
+
 class SerialRelay(Relay):
     def __init__(self, uart_port, baudrate=9600):
-        """Initialize the Serial Relay with the specified UART port and baudrate."""
-        self.serial = serial.Serial(uart_port, baudrate)
+        """Initialize the Serial Relay with the specified UART port and baudrate. The port is opened on first use."""
+        self.uart_port = uart_port
+        self.baudrate = baudrate
+        self.serial = None
         self.prev_state = [0] * 8  # Assuming 8 relays
+
+    def open(self):
+        if self.serial is None:
+            self.serial = serial.Serial(self.uart_port, self.baudrate)
+        return self.serial
+
+    def close(self):
+        if self.serial is not None:
+            serial_conn, self.serial = self.serial, None
+            serial_conn.close()
         
     def initialize(self):
         print("Relay initialization in progress. Please wait...")
         time.sleep(1)
-        self.serial.write(init_command[0])
+        self.open().write(init_command[0])
         time.sleep(1)
-        self.serial.write(init_command[1])
+        self.open().write(init_command[1])
         time.sleep(1)
         print("Relay initialization Done.")
 
@@ -65,22 +100,33 @@ class SerialRelay(Relay):
         self.set_state(relay_no, 1)
 
     # helper function to set the state of a relay
-    @staticmethod
     def set_state(self, relay_no, state):
         num = (relay_no-1) ^ state
         byte_string = num.to_bytes(1, byteorder='big')
-        self.serial.write(byte_string)
-        self.prev_state[relay_no-1] = num
+        self.open().write(byte_string)
+        self.prev_state[relay_no-1] = state
+        return True
 
 
 class IpRelay(Relay):
-    def __init__(self, ip_address, username, password):
+    def __init__(self, ip_address, username, password, state_ttl=RELAY_STATE_TTL, timeout=RELAY_HTTP_TIMEOUT):
         """Initialize the IP Relay with the specified IP address, username, and password."""
         self.ip_address = ip_address
         self.prev_state = [False] * 8   # Assuming 8 relays
         self.base_url = f"http://{self.ip_address}/restapi"
-        self.auth = auth=HTTPDigestAuth(username, password)
-        self.proxies = {"http" : None, "https" : None}
+        self.state_ttl = state_ttl
+        self.timeout = timeout
+        self.synced_at = 0
+
+        # one keep-alive session per relay; the digest auth object keeps the
+        # server nonce, so only the first request pays for the 401 challenge
+        self.session = requests.Session()
+        self.session.auth = HTTPDigestAuth(username, password)
+        self.session.proxies = {"http" : None, "https" : None}
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RELAY_HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         
     def initialize(self):
         print("Relay initialization in progress. Please wait...")
@@ -92,15 +138,22 @@ class IpRelay(Relay):
         headers = {"Accept": "application/json"}
         
         try:
-            response = requests.get(url, auth=self.auth, headers=headers, proxies=self.proxies)
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
             response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
             self.prev_state = response.json()
+            self.synced_at = time.monotonic()
         except requests.exceptions.RequestException as e:
             print(f"Request failed: {e}")
 
+    def get_state(self, refresh=False):
+        """Outlet states, re-read from the relay only when older than state_ttl."""
+        if refresh or time.monotonic() - self.synced_at > self.state_ttl:
+            self.sync_state()
+        return list(self.prev_state)
+
     def toggle(self, relay_no):
         """Toggle the specified relay."""
-        return self.set_state(relay_no, self.prev_state[relay_no-1] ^ 1)
+        return self.set_state(relay_no, self.get_state()[relay_no-1] ^ 1)
 
     def on(self, relay_no):
         """Turn on the specified relay."""
@@ -118,20 +171,43 @@ class IpRelay(Relay):
         time.sleep(1)
 
     # helper function to toggle the state of a relay
-    @staticmethod
     def set_state(self, relay_no, state):
-        url = self.base_url + f"/relay/outlets/{relay_no - 1}/state/"
-        data = {"value": "true" if state == 1 else "false"}
-        headers = {"X-CSRF": "x"}
-        
-        try:
-            response = requests.put(url, auth=self.auth, headers=headers, data=data, proxies=self.proxies)
-            response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
-        except Exception as e:
-            print(f"Request failed: {e}")
-            
-        self.sync_state()
-        return response.status_code == 204
+        return self.set_states({relay_no: state})
+
+    def set_states(self, states):
+        """Set several outlets at once, e.g. {1: 0, 2: 0, 5: 1}. One request per distinct state."""
+        groups = {}
+        for relay_no, state in states.items():
+            groups.setdefault(1 if state else 0, []).append(relay_no)
+
+        success = True
+        for state, relays in groups.items():
+            # matrix URI addressing several outlets: /relay/outlets/=0,1,4/state/
+            outlets = ",".join(str(relay_no - 1) for relay_no in sorted(relays))
+            url = self.base_url + f"/relay/outlets/={outlets}/state/"
+            data = {"value": "true" if state == 1 else "false"}
+            headers = {"X-CSRF": "x"}
+
+            in_flight = RELAY_REQUESTS_IN_FLIGHT.labels(self.ip_address)
+            in_flight.inc()
+            start = time.perf_counter()
+            try:
+                response = self.session.put(url, headers=headers, data=data, timeout=self.timeout)
+                response.raise_for_status()  # Raise an exception for 4xx or 5xx status codes
+            except Exception as e:
+                RELAY_REQUEST_SECONDS.labels(self.ip_address, 'failed').observe(time.perf_counter() - start)
+                in_flight.dec()
+                print(f"Request failed: {e}")
+                self.synced_at = 0  # state unknown, re-read on next access
+                success = False
+                continue
+            RELAY_REQUEST_SECONDS.labels(self.ip_address, 'ok').observe(time.perf_counter() - start)
+            in_flight.dec()
+
+            # write-through instead of re-reading every outlet after each write
+            for relay_no in relays:
+                self.prev_state[relay_no - 1] = bool(state)
+        return success
 
 
 class RelayFactory:
@@ -1,12 +1,44 @@
+import os
+import re
+import time
 import traceback
 import pexpect
 import serial
 from pexpect import fdpexpect
 from src.utils.exception import UartSetupIssue
+from src.modules.uart_reader import UartReader, ExpectResult
+from src.utils.log_writer import AsyncLogWriter
+from src.utils.metrics import REGISTRY
+from src.app.settings import UART_BUFFER_SIZE, UART_READ_TIMEOUT
+
+UART_COMMAND_SECONDS = REGISTRY.histogram('sysconn_uart_command_duration_seconds',
+                                          'Duration of Uart.send_command, retries included.', ('port', 'result'))
+UART_COMMAND_RETRIES = REGISTRY.counter('sysconn_uart_command_retries_total',
+                                        'Uart commands sent again after the expected string timed out.', ('port',))
+UART_COMMANDS_IN_FLIGHT = REGISTRY.gauge('sysconn_uart_commands_in_flight', 'Uart commands waiting for their reply.', ('port',))
+
+
+def validate_pipeline(steps: list) -> list:
+    '''Check the steps of Uart.run_pipeline() before a port is leased. Raises ValueError.'''
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("'steps' must be a non-empty list")
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or ('command' not in step and 'expect' not in step):
+            raise ValueError(f"steps[{index}] must be an object with a 'command' and/or 'expect'")
+        try:
+            timeout = float(step.get('timeout', 30))
+        except (TypeError, ValueError):
+            timeout = -1
+        if timeout <= 0:
+            raise ValueError(f"steps[{index}].timeout must be a positive number of seconds")
+        retries = step.get('retries', 0)
+        if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+            raise ValueError(f"steps[{index}].retries must be a non-negative integer")
+    return steps
 
 
 class Uart:
-    def __init__(self, uart_port, baudrate=115200, log_file_path=None, log_level=0):
+    def __init__(self, uart_port, baudrate=115200, log_file_path=None, log_level=0, use_reader=False, buffer_size=UART_BUFFER_SIZE):
         self.uart_port_info = {
             "port": uart_port,
             "baudrate": baudrate,
@@ -22,6 +54,12 @@ class Uart:
         self.file_descriptor_process = None
         self.log_level = log_level
         self.log_file_obj = None
+        # with use_reader, a UartReader thread owns the fd instead of pexpect
+        self.use_reader = use_reader
+        self.buffer_size = buffer_size
+        self.reader = None
+        self.read_cursor = 0
+        self.last_output = None
     
     def __del__(self):
         self.disconnect()
@@ -32,23 +70,55 @@ class Uart:
         self.serial_conn_obj = serial.Serial(self.uart_port_info['port'])
         ser_settings = self.serial_conn_obj.getSettingsDict()
         ser_settings.update(self.uart_port_info)
+        if self.use_reader:
+            # short read timeout so the reader thread can notice stop()
+            ser_settings['timeout'] = UART_READ_TIMEOUT
         self.serial_conn_obj.applySettingsDict(ser_settings)
         
         if self.log_level > 1:
             print(f"[ Info ] Serial connection is opened for port {self.uart_port_info['port']}")
         
         if self.log_file_path is not None:
-            self.log_file_obj = open(self.log_file_path, 'ab+')
+            # timestamped, rotated and compressed off the serial I/O path
+            self.log_file_obj = AsyncLogWriter(self.log_file_path)
             if self.log_level > 1:
                 print('[ Info ] Uart log file opened.')
-            
+
+        if self.use_reader:
+            self.reader = UartReader(self.serial_conn_obj, capacity=self.buffer_size)
+            self.read_cursor = 0
+            if self.log_file_obj is not None:
+                self.reader.add_listener(self.log_file_obj.write)
+            self.reader.start()
+            if self.log_level > 1:
+                print("[ Info ] Uart reader thread is started.\n")
+            return
+
         # create logging for serial_log_obj
         self.file_descriptor_process = fdpexpect.fdspawn(self.serial_conn_obj, logfile=self.log_file_obj, use_poll=True)
         if self.log_level > 1:
             print("[ Info ] File descriptor process is opened.\n")
     
+    def is_connected(self) -> bool:
+        '''True while the serial port is open and its device node still exists.'''
+        try:
+            if self.reader is not None:
+                alive = self.reader.is_alive()
+            else:
+                alive = self.file_descriptor_process is not None and self.file_descriptor_process.isalive()
+            return (alive and self.serial_conn_obj is not None and self.serial_conn_obj.isOpen()
+                    and os.path.exists(self.uart_port_info['port']))
+        except Exception:
+            return False
+
     def disconnect(self):
         try:
+            if self.reader is not None:
+                self.reader.stop()
+                self.reader.join(timeout=1)
+                self.reader = None
+                if self.log_level > 1:
+                    print('\n[ Info ] Uart reader thread is stopped.')
             if self.serial_conn_obj and self.serial_conn_obj.isOpen():
                 self.serial_conn_obj.close()
                 if self.log_level > 1:
@@ -59,6 +129,7 @@ class Uart:
                     print('[ Info ] File descriptor process is closed.')
             if self.log_file_obj:
                 self.log_file_obj.close()
+                self.log_file_obj = None
                 if self.log_level > 1:
                     print('[ Info ] Uart log file closed.')
         except Exception as e:
@@ -67,18 +138,51 @@ class Uart:
                 print(traceback.format_exc())
 
 
+    def send_line(self, cmd) -> int:
+        '''Send cmd followed by a newline. Returns the reader offset the reply starts at.'''
+        if self.reader is not None:
+            mark = self.reader.tell()
+            self.serial_conn_obj.write((cmd + '\n').encode('iso8859-1'))
+            return mark
+        self.file_descriptor_process.sendline(cmd + '\n')
+        return None
+
+    def expect(self, patterns, timeout=120, start=None) -> ExpectResult:
+        '''
+        Wait for the first of several patterns. With the reader thread, data
+        received since `start` (a send_line() mark) is searched, or since the
+        end of the previous match if no start is given, like pexpect does.
+        Returns an ExpectResult, or None on timeout/EOF.
+        '''
+        if self.reader is not None:
+            result = self.reader.expect(patterns, timeout, start=self.read_cursor if start is None else start)
+            if result is not None:
+                self.read_cursor = result.end
+            return result
+
+        index = self.file_descriptor_process.expect(list(patterns) + [pexpect.TIMEOUT, pexpect.EOF], timeout)
+        if index >= len(patterns):
+            return None
+        match = self.file_descriptor_process.match
+        return ExpectResult(index, None, None, match.groups(), self.file_descriptor_process.before, self.file_descriptor_process.after)
+
     def send_command(self, cmd, expected_string=None, return_code=None, timeout=120, retry_count=1) -> bool:
         # command success status
         status = False
+        port = self.uart_port_info["port"]
+        UART_COMMANDS_IN_FLIGHT.labels(port).inc()
+        start = time.perf_counter()
         
         try:
             index = None
             # retry 3 times
             for iteration in range(retry_count):
+                if iteration:
+                    UART_COMMAND_RETRIES.labels(port).inc()
                 # run the command
                 if self.log_level > 1:
                     print('[ Info ] Sending Uart Command : ' + str(cmd))
-                self.file_descriptor_process.sendline(cmd + '\n')
+                mark = self.send_line(cmd)
         
                 # check the output if expected_string is defined
                 # skip otherwise
@@ -86,16 +190,17 @@ class Uart:
                     # check the constraint
                     if self.log_level > 1:
                         print('[ Info ] Waiting for : ' + expected_string)
-                    index = self.file_descriptor_process.expect([expected_string, pexpect.TIMEOUT, pexpect.EOF], timeout)
+                    result = self.expect([expected_string], timeout, start=mark)
+                    index = 1 if result is None else 0
                         
                     # checking the return code based on the list provided in expect()
                     if index == 0:  # Process is completes and we received expected string
                         # Print the DUT UART logs
-                        cmd_response = self.file_descriptor_process.before + self.file_descriptor_process.after
+                        cmd_response = result.before + result.after
                         cmd_response = cmd_response.decode(encoding='iso8859-1')
                         if self.log_level > 2:
                             print(f"[ Info ] Command Output \n```\n{cmd_response}\n```\n")
-                        log_buffer = cmd_response
+                        self.last_output = cmd_response
         
                     # if command execute successfully then break the loop
                     if index == 0:
@@ -105,8 +210,8 @@ class Uart:
                     elif index == 1:  # Timeout and we did not received expected string
                         if self.log_level > 1:
                             print(
-                                (f"[ Warning ] Did not fond expected_string in {timeout}s timeout.")
-                                (f"Trying Again... iteration - {iteration + 1}")
+                                f"[ Warning ] Did not fond expected_string in {timeout}s timeout. "
+                                f"Trying Again... iteration - {iteration + 1}"
                             )
         
             if index == 1:
@@ -118,6 +223,103 @@ class Uart:
                 print('[ Error ] Error occurred while sending command : ', e)
                 print(traceback.format_exc())
         finally:
-            pass
+            UART_COMMAND_SECONDS.labels(port, 'ok' if status else 'failed').observe(time.perf_counter() - start)
+            UART_COMMANDS_IN_FLIGHT.labels(port).dec()
         
         return status
+
+    def run_pipeline(self, steps: list, variables: dict = None) -> dict:
+        '''
+        Run an ordered script of steps on this port in one call.
+
+        Each step is a dict with:
+            command          line to send (optional, a step can just wait)
+            expect           regex or list of regexes to wait for (optional)
+            timeout          seconds to wait for `expect` (default 30)
+            retries          extra attempts when `expect` times out (default 0)
+            capture          variable name to store group 1 of the match, or
+                             the reply text without the echoed command
+            continue_on_error  keep going if this step fails (default False)
+            output           include the reply text in the step result
+
+        `${name}` in command/expect is replaced by earlier captured values.
+        Returns per-step status, attempts and timings plus all variables.
+        '''
+        validate_pipeline(steps)
+        variables = dict(variables or {})
+        results = []
+        status = True
+        start = time.monotonic()
+
+        for index, step in enumerate(steps):
+            if not status:
+                results.append({"index": index, "command": step.get('command'), "status": "skipped"})
+                continue
+
+            step_result = self._run_pipeline_step(index, step, variables)
+            results.append(step_result)
+            if step_result["status"] != "passed" and not step.get('continue_on_error', False):
+                status = False
+
+        return {
+            "status": "passed" if status else "failed",
+            "duration": round(time.monotonic() - start, 4),
+            "steps": results,
+            "variables": variables,
+        }
+
+    def _run_pipeline_step(self, index: int, step: dict, variables: dict) -> dict:
+        substitute = lambda text: re.sub(r'\$\{(\w+)\}', lambda m: str(variables.get(m.group(1), m.group(0))), text)
+
+        command = substitute(step['command']) if step.get('command') is not None else None
+        expected = step.get('expect')
+        patterns = [substitute(item) for item in ([expected] if isinstance(expected, str) else expected or [])]
+        timeout = float(step.get('timeout', 30))
+        attempts = 1 + step.get('retries', 0)
+
+        step_result = {"index": index, "command": command, "status": "failed", "attempts": 0}
+        step_start = time.monotonic()
+        reply = None
+        try:
+            for attempt in range(attempts):
+                step_result["attempts"] = attempt + 1
+                mark = self.send_line(command) if command is not None else None
+                if not patterns:
+                    step_result["status"] = "passed"
+                    break
+
+                result = self.expect(patterns, timeout, start=mark)
+                if result is not None:
+                    reply = (result.before + result.after).decode('iso8859-1')
+                    step_result["status"] = "passed"
+                    step_result["matched"] = result.index
+                    if step.get('capture'):
+                        variables[step['capture']] = self._capture_value(command, result)
+                    break
+                if self.log_level > 1:
+                    print(f"[ Warning ] Step {index} did not match in {timeout}s. Attempt {attempt + 1}/{attempts}")
+        except Exception as e:
+            step_result["error"] = str(e)
+            if self.log_level > 0:
+                print(f'[ Error ] Error occurred in pipeline step {index} : ', e)
+
+        step_result["duration"] = round(time.monotonic() - step_start, 4)
+        if step.get('output') and reply is not None:
+            step_result["output"] = reply
+        if step.get('capture') and step_result["status"] == "passed":
+            step_result["captured"] = variables.get(step['capture'])
+        self.last_output = reply
+        return step_result
+
+    @staticmethod
+    def _capture_value(command: str, result: ExpectResult) -> str:
+        # first group of the matched pattern if it has one
+        if result.groups and result.groups[0] is not None:
+            return result.groups[0].decode('iso8859-1')
+
+        # otherwise the reply, minus the echoed command line
+        text = result.before.decode('iso8859-1')
+        lines = text.splitlines()
+        if command is not None and lines and lines[0].strip() == command.strip():
+            lines = lines[1:]
+        return '\n'.join(lines).strip()
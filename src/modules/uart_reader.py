@@ -0,0 +1,153 @@
+import time
+import threading
+import traceback
+from src.utils.pattern_matcher import MultiPattern
+from src.app.settings import UART_BUFFER_SIZE, UART_EXPECT_OVERLAP
+
+
+class RingBuffer:
+    '''
+    Fixed-size byte buffer addressed by absolute stream offsets.
+
+    Offset 0 is the first byte ever received. When the buffer grows past its
+    capacity the oldest bytes are dropped (in batches, so the memmove cost is
+    amortized) and `base` moves forward. Regex searches run directly on the
+    underlying bytearray with pos/endpos, so no copy is made.
+    '''
+    def __init__(self, capacity: int = UART_BUFFER_SIZE):
+        self.capacity = capacity
+        self.base = 0
+        self._data = bytearray()
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self._data)
+
+    def append(self, data: bytes) -> None:
+        self._data += data
+        if len(self._data) > self.capacity + self.capacity // 4:
+            drop = len(self._data) - self.capacity
+            del self._data[:drop]
+            self.base += drop
+
+    def search(self, matcher: MultiPattern, start: int, end: int = None) -> tuple:
+        '''Search absolute range [start, end). Returns (index, abs_start, abs_end, groups) or None.'''
+        end = self.end if end is None else end
+        found = matcher.search(self._data, max(start, self.base) - self.base, end - self.base)
+        if found is None:
+            return None
+        index, match = found
+        return index, self.base + match.start(), self.base + match.end(), matcher.groups(index, match)
+
+    def read(self, start: int, end: int = None) -> bytes:
+        '''Copy of absolute range [start, end), clipped to what is still buffered.'''
+        end = self.end if end is None else end
+        return bytes(self._data[max(start, self.base) - self.base:max(end, self.base) - self.base])
+
+
+class ExpectResult:
+    def __init__(self, index: int, start: int, end: int, groups: tuple, before: bytes, after: bytes):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.groups = groups
+        self.before = before
+        self.after = after
+
+
+class UartReader(threading.Thread):
+    '''
+    Dedicated reader thread for one serial port.
+
+    Drains the port continuously into a RingBuffer, whether or not anyone is
+    waiting, so console output between commands is never lost. Waiters call
+    expect() with several patterns at once; each wakeup only scans the bytes
+    that arrived since the previous scan (plus `overlap` bytes so matches
+    spanning two reads are still found). Listeners get every chunk as it
+    arrives, e.g. for logging or console monitoring.
+    '''
+    def __init__(self, serial_conn, capacity: int = UART_BUFFER_SIZE, overlap: int = UART_EXPECT_OVERLAP, name: str = None):
+        super().__init__(name=name or f"uart-reader-{serial_conn.port}", daemon=True)
+        self.serial_conn = serial_conn
+        self.overlap = overlap
+        self.buffer = RingBuffer(capacity)
+        self.error = None
+        self._listeners = []
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def add_listener(self, listener: callable) -> None:
+        '''listener(data: bytes) is called from the reader thread for every chunk.'''
+        with self._cond:
+            self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: callable) -> None:
+        with self._cond:
+            self._listeners = [item for item in self._listeners if item is not listener]
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                # serial timeout is short, so this returns regularly to check the stop flag
+                data = self.serial_conn.read(self.serial_conn.in_waiting or 1)
+                if not data:
+                    continue
+                with self._cond:
+                    self.buffer.append(data)
+                    listeners = self._listeners
+                    self._cond.notify_all()
+                for listener in listeners:
+                    try:
+                        listener(data)
+                    except Exception as e:
+                        print(f"[ Error ] UART listener failed on {self.serial_conn.port} : {e}")
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self.error = e
+                print(f"[ Error ] UART reader stopped on {self.serial_conn.port} : {e}")
+                print(traceback.format_exc())
+        finally:
+            self._stop_event.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def tell(self) -> int:
+        '''Absolute offset of the next byte to arrive.'''
+        with self._cond:
+            return self.buffer.end
+
+    def read(self, start: int, end: int = None) -> bytes:
+        with self._cond:
+            return self.buffer.read(start, end)
+
+    def expect(self, patterns, timeout: float = None, start: int = None) -> ExpectResult:
+        '''
+        Wait until any of `patterns` (list of str/bytes/compiled regexes, or a
+        MultiPattern) matches data received at or after `start` (default: now).
+        Returns an ExpectResult, or None on timeout or when the reader stopped.
+        '''
+        matcher = patterns if isinstance(patterns, MultiPattern) else MultiPattern(patterns)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            origin = cursor = self.buffer.end if start is None else start
+            while True:
+                end = self.buffer.end
+                found = self.buffer.search(matcher, cursor, end)
+                if found is not None:
+                    index, match_start, match_end, groups = found
+                    return ExpectResult(index, match_start, match_end, groups,
+                                        self.buffer.read(origin, match_start), self.buffer.read(match_start, match_end))
+                # next scan starts just before the data not yet seen
+                cursor = max(cursor, end - self.overlap)
+
+                if self._stop_event.is_set():
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
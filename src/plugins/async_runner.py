@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import deque
+from src.app.settings import PLUGIN_QUEUE_SIZE, PLUGIN_OVERFLOW_POLICY, PLUGIN_SAMPLE_EVERY
+
+OVERFLOW_POLICIES = ('block', 'drop', 'sample')
+
+
+class PluginStats:
+    '''Call count, errors and latency of one plugin. Updated without a lock, so approximate under contention.'''
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, elapsed: float, failed: bool = False) -> None:
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if failed:
+            self.errors += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "avg_ms": round(self.total_time / self.calls * 1000, 3) if self.calls else 0,
+            "max_ms": round(self.max_time * 1000, 3),
+        }
+
+
+class AsyncPluginRunner:
+    '''
+    Runs the hooks of one async plugin on its own thread.
+
+    submit() only appends the event to a bounded deque, with a shallow copy
+    of shared_data so later changes by the test do not leak into it; the
+    worker is only signalled when it is idle, so a busy plugin costs the
+    caller about one append. When the queue is full, the overflow policy
+    decides: 'block' waits for room, 'drop' discards the event, 'sample'
+    starts keeping only every sample_every-th event once the queue is half
+    full and drops when full.
+    '''
+    def __init__(self, name: str, queue_size: int = PLUGIN_QUEUE_SIZE, overflow: str = PLUGIN_OVERFLOW_POLICY,
+                 sample_every: int = PLUGIN_SAMPLE_EVERY):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.name = name
+        self.queue_size = max(1, queue_size)
+        self.overflow = overflow
+        self.sample_every = max(1, sample_every)
+        self.stats = PluginStats()
+        self.dropped = 0
+        self._queue = deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = False
+        self._busy = False
+        self._blocked = 0
+        self._seen = 0
+        self._thread = threading.Thread(target=self._run, name=f"plugin-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, hook: callable, shared_data: dict, method: callable, *args, **kwargs) -> None:
+        depth = len(self._queue)
+        if depth >= self.queue_size:
+            if self.overflow != 'block':
+                self.dropped += 1
+                return
+            with self._cond:
+                self._blocked += 1
+                while len(self._queue) >= self.queue_size:
+                    self._cond.wait(0.1)
+                self._blocked -= 1
+        elif self.overflow == 'sample' and depth >= self.queue_size // 2:
+            self._seen += 1
+            if self._seen % self.sample_every:
+                self.dropped += 1
+                return
+
+        self._queue.append((hook, dict(shared_data) if isinstance(shared_data, dict) else shared_data, method, args, kwargs))
+        if self._idle:
+            with self._cond:
+                self._cond.notify_all()
+
+    def drain(self, timeout: float = None) -> bool:
+        '''Wait until every queued event was handled. Returns False on timeout.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue or self._busy:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def to_dict(self) -> dict:
+        data = self.stats.to_dict()
+        data.update({
+            "queue_depth": len(self._queue),
+            "queue_size": self.queue_size,
+            "overflow": self.overflow,
+            "dropped": self.dropped,
+        })
+        return data
+
+    def _run(self) -> None:
+        while True:
+            self._busy = True
+            try:
+                hook, shared_data, method, args, kwargs = self._queue.popleft()
+            except IndexError:
+                with self._cond:
+                    # submit() appends before it looks at _idle, so an event added
+                    # after this check always finds the worker idle and wakes it
+                    self._busy = False
+                    self._idle = True
+                    if not self._queue:
+                        self._cond.wait(1)
+                    self._idle = False
+                continue
+
+            if self._blocked:
+                with self._cond:
+                    self._cond.notify_all()
+            start = time.perf_counter()
+            failed = False
+            try:
+                hook(shared_data, method, *args, **kwargs)
+            except Exception as e:
+                failed = True
+                print(f"[PLUGIN ENGINE] Exception in async plugin {self.name}.{hook.__name__}: {e}")
+            finally:
+                self.stats.record(time.perf_counter() - start, failed)
@@ -1,131 +1,135 @@
-from abc import ABC, abstractmethod
+from abc import ABC
+import time
 import functools
+from src.utils.metrics import REGISTRY
 
-# Helper function to extract shared_data from args or kwargs
-def get_shared_data(*args, **kwargs):
-    shared_data = {}
+STEP_SECONDS = REGISTRY.histogram('sysconn_step_duration_seconds', 'Duration of decorated test steps.',
+                                  ('event', 'step', 'status'))
+STEPS_IN_FLIGHT = REGISTRY.gauge('sysconn_steps_in_flight', 'Decorated test steps running now.', ('event',))
+STEP_STATUSES = ('passed', 'failed', 'error')
+
+# Helper function to take shared_data out of args or kwargs
+def split_shared_data(args: tuple, kwargs: dict) -> tuple:
     if len(args) > 0:
-        shared_data = args[0]
-    elif "shared_data" in kwargs:
-        shared_data = kwargs["shared_data"]
-    else:
-        kwargs["shared_data"] = shared_data
-    return shared_data
+        return args[0], args[1:], kwargs
+    kwargs = dict(kwargs)
+    return kwargs.pop("shared_data", {}), args, kwargs
+
+
+class StepMetrics:
+    '''Metric children of one decorated step, bound once when the step is decorated.'''
+    __slots__ = ('in_flight', 'seconds')
+
+    def __init__(self, event: str, step: str):
+        self.in_flight = STEPS_IN_FLIGHT.labels(event)
+        self.seconds = {status: STEP_SECONDS.labels(event, step, status) for status in STEP_STATUSES}
 
 
 class BasePlugin(ABC):
     '''
-    Base class for all plugins. All plugins must inherit from this class and implement the abstract methods.
-    on_<event> methods will be called at various stages of the test execution process.
+    Base class for all plugins. All plugins must inherit from this class and override the
+    on_<event>_pre_proc / on_<event>_post_proc hooks of the events they handle.
+    These hooks will be called at various stages of the test execution process.
+
+    Plugins with ASYNC = True get their hooks run on a background thread, fed
+    through a bounded queue, so they never delay the test step. OVERFLOW_POLICY
+    and QUEUE_SIZE override the PLUGIN_* defaults of settings for that queue.
     '''
+    ASYNC = False
+    OVERFLOW_POLICY = None
+    QUEUE_SIZE = None
     
     @staticmethod
-    def common_wrapper(method: callable, pre_proc: callable, post_proc: callable) -> callable:
+    def common_wrapper(method: callable, pre_proc: callable, post_proc: callable, event: str = None) -> callable:
+        metrics = StepMetrics(event or pre_proc.__name__[len('on_'):-len('_pre_proc')], method.__name__)
+
         @functools.wraps(method)
         def wrapper(self, *args, **kwargs):
-            shared_data = get_shared_data(*args, **kwargs)
+            # shared_data is passed on exactly once, whether it came positionally or by keyword
+            shared_data, args, kwargs = split_shared_data(args, kwargs)
             pre_proc(shared_data, method, *args, **kwargs)
-            result = method(self, shared_data, *args, **kwargs)
+            metrics.in_flight.inc()
+            status = 'error'
+            start = time.perf_counter()
+            try:
+                result = method(self, shared_data, *args, **kwargs)
+                status = 'failed' if result is False else 'passed'
+            finally:
+                metrics.seconds[status].observe(time.perf_counter() - start)
+                metrics.in_flight.dec()
             post_proc(shared_data, method, *args, **kwargs)
             return result
         return wrapper
 
+    def event_wrapper(self, method: callable, event: str) -> callable:
+        '''Decorate method with the on_<event>_pre_proc / on_<event>_post_proc hooks.'''
+        return BasePlugin.common_wrapper(method,
+                                         getattr(self, f"on_{event}_pre_proc"),
+                                         getattr(self, f"on_{event}_post_proc"),
+                                         event)
+
     def on_configure(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_configure_pre_proc,
-                                            self.on_configure_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'configure')
     
     def on_test(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_test_pre_proc,
-                                            self.on_test_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'test')
 
     def on_flash(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_flash_pre_proc,
-                                            self.on_flash_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'flash')
 
     def on_command(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_command_pre_proc,
-                                            self.on_command_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'command')
 
     def on_constraint_check(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_constraint_check_pre_proc,
-                                            self.on_constraint_check_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'constraint_check')
 
     def on_exception(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_exception_pre_proc,
-                                            self.on_exception_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'exception')
 
     def on_error(self, method) -> callable:
-        wrapper = BasePlugin.common_wrapper(method,
-                                            self.on_error_pre_proc,
-                                            self.on_error_post_proc)
-        return wrapper
+        return self.event_wrapper(method, 'error')
     
     
-    # Abstract methods for pre and post processing
-    @abstractmethod
+    # Pre and post processing hooks. A plugin subscribes to an event by overriding its hook;
+    # the engine never calls hooks that are left as they are here.
     def on_configure_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_configure_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_configure_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_configure_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_test_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_test_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_test_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_test_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_flash_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_flash_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_flash_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_flash_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_command_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_command_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_command_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_command_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_constraint_check_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_constraint_check_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_constraint_check_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_constraint_check_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_exception_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_exception_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_exception_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_exception_post_proc method.")
+        pass
     
-    @abstractmethod
     def on_error_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_error_pre_proc method.")
+        pass
     
-    @abstractmethod
     def on_error_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
-        raise NotImplementedError("Subclass must implement the on_error_post_proc method.")
\ No newline at end of file
+        pass
\ No newline at end of file
@@ -1,27 +1,249 @@
-from src.plugins.base_plugin import BasePlugin
-from src.plugins.result_plugin import ResultPlugin
+import time
+import functools
+import threading
+from collections import Counter
+from src.core.registry import LazyRegistry
+from src.plugins.base_plugin import BasePlugin, StepMetrics, split_shared_data
+from src.plugins.async_runner import AsyncPluginRunner, PluginStats
+from src.app.settings import PLUGIN_QUEUE_SIZE, PLUGIN_OVERFLOW_POLICY
 
-PLUGIN_LIST = [
-    ResultPlugin(),
-]
+# Plugins are imported when the first event fires. Other packages can add plugins
+# through the "sysconn.plugins" entry point group, or PLUGIN_LIST.register(name, "module:Class").
+PLUGIN_LIST = LazyRegistry({
+    'result': 'src.plugins.result_plugin:ResultPlugin',
+    'result_store': 'src.plugins.result_store_plugin:ResultStorePlugin',
+}, entry_point_group='sysconn.plugins', kind='plugin')
+
+# metrics dicts of the decorated steps running in each thread, innermost last
+_step_scope = threading.local()
+
+
+def step_metrics() -> dict:
+    '''
+    Dict for the key metrics of the step running in this thread; they end up in
+    its step record. Steps of a DAG flow run in parallel on one shared_data,
+    so metrics are kept per step instead of in shared_data.
+    '''
+    stack = getattr(_step_scope, 'stack', None)
+    return stack[-1] if stack else {}
+
+
+class PluginDispatcher:
+    '''
+    Per-event tuples of bound subscriber hooks.
+
+    The table is built once from the enabled plugins and only rebuilt when a
+    plugin is registered, enabled or disabled, so dispatching is a dict
+    lookup plus the calls. A plugin subscribes to an event by overriding
+    its hook; hooks inherited unchanged from BasePlugin are never called.
+    Hooks of async plugins are entered as AsyncPluginRunner.submit, so for
+    them the caller only pays for the hand-off.
+    '''
+    def __init__(self, registry: LazyRegistry):
+        self.registry = registry
+        self.errors = Counter()     # (plugin, event) -> exceptions raised
+        self._stats = {}            # plugin -> PluginStats of the time spent in the caller's thread
+        self._runners = {}          # async plugin -> AsyncPluginRunner
+        self._disabled = set()
+        self._table = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def table(self) -> dict:
+        '''{event_name: ((plugin_name, hook), ...)}, only events with subscribers are present.'''
+        table = self._table
+        if table is None or self._version != self.registry.version:
+            table = self._rebuild()
+        return table
+
+    def subscribers(self, event_name: str) -> tuple:
+        return self.table().get(event_name, ())
+
+    def dispatch(self, event_name: str, shared_data: dict, method: callable, *args, **kwargs) -> None:
+        for name, hook in self.table().get(event_name, ()):
+            start = time.perf_counter()
+            failed = False
+            try:
+                hook(shared_data, method, *args, **kwargs)
+            except Exception as e:
+                failed = True
+                self.errors[(name, event_name)] += 1
+                print(f"[PLUGIN ENGINE] Exception in {name}.{event_name}: {e}")
+            self._stats[name].record(time.perf_counter() - start, failed)
+
+    def enable(self, name: str) -> None:
+        with self._lock:
+            self._disabled.discard(name)
+            self._table = None
+
+    def disable(self, name: str) -> None:
+        with self._lock:
+            self._disabled.add(name)
+            self._table = None
+
+    def status(self) -> dict:
+        '''{plugin: {"enabled": bool, "loaded": bool}}'''
+        loaded = set(self.registry.loaded())
+        return {name: {"enabled": name not in self._disabled, "loaded": name in loaded} for name in self.registry.names()}
+
+    def stats(self) -> dict:
+        '''
+        {plugin: {"dispatch": latency added to the caller, "async": queue depth,
+        drops and run latency of the background thread (async plugins only)}}
+        '''
+        data = self.status()
+        for name, info in data.items():
+            if name in self._stats:
+                info["dispatch"] = self._stats[name].to_dict()
+            if name in self._runners:
+                info["async"] = self._runners[name].to_dict()
+        return data
+
+    def drain(self, timeout: float = None) -> bool:
+        '''Wait until the async plugins handled every queued event.'''
+        return all(runner.drain(timeout) for runner in list(self._runners.values()))
+
+    def _rebuild(self) -> dict:
+        with self._lock:
+            version = self.registry.version
+            table = {}
+            for name in self.registry.names():
+                if name in self._disabled:
+                    continue
+                try:
+                    plugin = self.registry.get(name)
+                except Exception as e:
+                    print(f"[PLUGIN ENGINE] Failed to load plugin {name}: {e}")
+                    continue
+                self._stats.setdefault(name, PluginStats())
+                runner = self._runner(name, plugin)
+                for event_name in self._events(plugin):
+                    hook = getattr(plugin, event_name)
+                    if runner is not None:
+                        hook = functools.partial(runner.submit, hook)
+                    table.setdefault(event_name, []).append((name, hook))
+            self._table = {event_name: tuple(hooks) for event_name, hooks in table.items()}
+            self._version = version
+            return self._table
+
+    def _runner(self, name: str, plugin: BasePlugin) -> AsyncPluginRunner:
+        # called with the lock held; runners outlive table rebuilds
+        if not getattr(plugin, 'ASYNC', False):
+            return None
+        if name not in self._runners:
+            try:
+                self._runners[name] = AsyncPluginRunner(name,
+                                                        queue_size=plugin.QUEUE_SIZE or PLUGIN_QUEUE_SIZE,
+                                                        overflow=plugin.OVERFLOW_POLICY or PLUGIN_OVERFLOW_POLICY)
+            except ValueError as e:
+                print(f"[PLUGIN ENGINE] Plugin {name} runs synchronously: {e}")
+                return None
+        return self._runners[name]
+
+    @staticmethod
+    def _events(plugin: BasePlugin) -> list:
+        # on_* attributes the plugin class defines itself; the BasePlugin decorators and no-op hooks are skipped
+        events = []
+        for attribute in dir(type(plugin)):
+            if not attribute.startswith('on_'):
+                continue
+            value = getattr(type(plugin), attribute)
+            if callable(value) and value is not getattr(BasePlugin, attribute, None):
+                events.append(attribute)
+        return events
+
+
+dispatcher = PluginDispatcher(PLUGIN_LIST)
 
 class Plugin(BasePlugin):
     @staticmethod
     def get_plugin(plugin_name: str):
         return PLUGIN_LIST.get(plugin_name, None)
+
+    @staticmethod
+    def enable_plugin(plugin_name: str) -> None:
+        dispatcher.enable(plugin_name)
+
+    @staticmethod
+    def disable_plugin(plugin_name: str) -> None:
+        dispatcher.disable(plugin_name)
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def _common_callback(self, event_name, shared_data: dict, method: callable, *args, **kwargs) -> None:
-        for plugin in PLUGIN_LIST:
+    def event_wrapper(self, method: callable, event: str) -> callable:
+        '''
+        Like BasePlugin.common_wrapper, but the subscribers are looked up per call,
+        and when nobody subscribes to the event the method is called straight away,
+        without timing or step metrics. Otherwise the post hooks get the record of
+        this call (status, duration, step_metrics()) as the last_step keyword; they
+        also run when the step raises.
+        '''
+        pre_event = f"on_{event}_pre_proc"
+        post_event = f"on_{event}_post_proc"
+        table = dispatcher.table
+        metrics = StepMetrics(event, method.__name__)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            hooks = table()
+            if pre_event not in hooks and post_event not in hooks:
+                # nobody listens; a step called without shared_data still gets a fresh
+                # dict, as on the dispatch path, never its shared default argument
+                if not args and 'shared_data' not in kwargs:
+                    args = ({},)
+                return method(self, *args, **kwargs)
+
+            shared_data, args, kwargs = split_shared_data(args, kwargs)
+            dispatcher.dispatch(pre_event, shared_data, method, *args, **kwargs)
             try:
-                # check if the plugin has the event method
-                if hasattr(plugin, event_name):
-                    plugin.__getattribute__(event_name)(shared_data, method, *args, **kwargs)
+                stack = _step_scope.stack
+            except AttributeError:
+                stack = _step_scope.stack = []
+            stack.append({})
+            started_at = time.time()
+            metrics.in_flight.inc()
+            start = time.perf_counter()
+            try:
+                result = method(self, shared_data, *args, **kwargs)
             except Exception as e:
-                print(f"[PLUGIN ENGINE] Exception in common_callback: {e}")
+                duration = time.perf_counter() - start
+                metrics.in_flight.dec()
+                metrics.seconds['error'].observe(duration)
+                # post hooks still see the failed step, then the exception goes on to the caller
+                last_step = Plugin._step_record(method, event, started_at, duration, "error", str(e), stack.pop())
+                dispatcher.dispatch(post_event, shared_data, method, *args, **dict(kwargs, last_step=last_step))
+                raise
+            duration = time.perf_counter() - start
+            metrics.in_flight.dec()
+            status = 'failed' if result is False else 'passed'
+            metrics.seconds[status].observe(duration)
+            last_step = Plugin._step_record(method, event, started_at, duration, status, None, stack.pop())
+            dispatcher.dispatch(post_event, shared_data, method, *args, **dict(kwargs, last_step=last_step))
+            return result
+        return wrapper
+
+    @staticmethod
+    def _step_record(method: callable, event: str, started_at: float, duration: float, status: str, error: str,
+                     step_metrics: dict) -> dict:
+        return {
+            "step": method.__name__,
+            "event": event,
+            "status": status,
+            "error": error,
+            "started_at": started_at,
+            "finished_at": started_at + duration,
+            "duration": round(duration, 6),
+            "metrics": step_metrics or None,
+        }
+
+    def _common_callback(self, event_name, shared_data: dict, method: callable, *args, **kwargs) -> None:
+        dispatcher.dispatch(event_name, shared_data, method, *args, **kwargs)
         
+    def notify(self, event_name: str, shared_data: dict, method: callable = None, *args, **kwargs) -> None:
+        '''Fire a standalone event (not tied to a decorated step) on every plugin that handles it.'''
+        self._common_callback(event_name, shared_data, method, *args, **kwargs)
+
     def on_configure_pre_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
         self._common_callback('on_configure_pre_proc', shared_data, method, *args, **kwargs)
         
@@ -4,6 +4,9 @@ from src.plugins.base_plugin import BasePlugin
 
 
 class ResultPlugin(BasePlugin):
+    # printing shared_data is slow, keep it off the test thread
+    ASYNC = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -49,3 +52,5 @@ class ResultPlugin(BasePlugin):
     def on_error_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
         print(f"[PLUGIN] ResultPlugin : on_error_post_proc after {method.__name__} shared_data = {shared_data}")
 
+    def on_console_match(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        print(f"[PLUGIN] ResultPlugin : on_console_match {shared_data.get('pattern')} on {shared_data.get('port')} : {shared_data.get('line')}")
@@ -0,0 +1,46 @@
+from src.core.result_store import ResultStore
+from src.plugins.base_plugin import BasePlugin
+
+
+class ResultStorePlugin(BasePlugin):
+    '''
+    Records every finished step in the ResultStore, from the last_step record
+    the plugin engine passes to the post hooks. Board and flow come from
+    shared_data, or from the test request ("board" may be given in its parameters).
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = ResultStore()
+
+    def record(self, shared_data: dict, method: callable, step: dict = None) -> None:
+        step = step or {}
+        shared_data = shared_data if isinstance(shared_data, dict) else {}
+        test_data = shared_data.get("test_data") or {}
+        parameters = test_data.get("parameters") or {}
+        self.store.append({
+            "ts": step.get("finished_at"),
+            "run_id": shared_data.get("run_id"),
+            "flow": shared_data.get("flow") or test_data.get("test_flow"),
+            "board": shared_data.get("board") or parameters.get("board"),
+            "step": step.get("step") or getattr(method, '__name__', None),
+            "event": step.get("event"),
+            "status": step.get("status"),
+            "duration": step.get("duration"),
+            "error": step.get("error"),
+            "metrics": step.get("metrics"),
+        })
+
+    def on_configure_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.record(shared_data, method, kwargs.get('last_step'))
+
+    def on_test_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.record(shared_data, method, kwargs.get('last_step'))
+
+    def on_flash_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.record(shared_data, method, kwargs.get('last_step'))
+
+    def on_command_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.record(shared_data, method, kwargs.get('last_step'))
+
+    def on_constraint_check_post_proc(self, shared_data: dict, method: callable, *args, **kwargs) -> callable:
+        self.record(shared_data, method, kwargs.get('last_step'))
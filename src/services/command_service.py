@@ -1,28 +1,288 @@
 import os
+import time
+import uuid
+import signal
+import functools
+import threading
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
+from src.app.db_client import DB
+from src.core.job_manager import Job, JobManager, QUEUED
+from src.core.output_capture import OutputCapture
+from src.utils.metrics import REGISTRY
+from src.app.settings import (STREAM_READ_CHUNK, STREAM_BACKLOG_LINES, COMMAND_MAX_WORKERS, JOB_HISTORY_LIMIT,
+                              BATCH_MAX_PARALLELISM)
+
+COMMAND_SECONDS = REGISTRY.histogram('sysconn_command_duration_seconds',
+                                     'Run time of shell commands, from spawn until both pipes are drained.', ('result',))
+COMMANDS_IN_FLIGHT = REGISTRY.gauge('sysconn_commands_in_flight', 'Shell commands running now.')
 
 class ICommandService(ABC):
     @abstractmethod
     def run_command(self, workarea: str, command: str) -> tuple:
         pass
 
+    @abstractmethod
+    def submit_command(self, command: str, cwd: str = None, env: dict = None, stream: bool = False, timeout: float = None) -> str:
+        pass
+
+    @abstractmethod
+    def run_batch(self, commands: list, parallelism: int = 1, stop_on_failure: bool = False) -> dict:
+        pass
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> dict:
+        pass
+
+    @abstractmethod
+    def cancel_job(self, job_id: str) -> bool:
+        pass
+
+
+class CommandStream:
+    '''
+    Output of one streamed command. Every chunk gets a sequence number and is
+    emitted to the Socket.IO room named after the job id. Only the last
+    STREAM_BACKLOG_LINES chunks are kept, so late subscribers can catch up
+    without the server holding the whole output.
+    '''
+    OUTPUT_EVENT = 'command_output'
+    EXIT_EVENT = 'command_exit'
+
+    def __init__(self, job_id: str, emitter=None):
+        self.job_id = job_id
+        self.emitter = emitter
+        self.returncode = None
+        self.finished = False
+        self._seq = 0
+        self._backlog = deque(maxlen=STREAM_BACKLOG_LINES)
+        self._lock = threading.Lock()
+
+    def _emit(self, event: str, payload: dict) -> None:
+        with self._lock:
+            payload['seq'] = self._seq
+            self._seq += 1
+            self._backlog.append((event, payload))
+            # emit under the lock so the room sees chunks in sequence order
+            if self.emitter is not None:
+                self.emitter.emit(event, payload, to=self.job_id)
+
+    def write(self, stream: str, data: str) -> None:
+        self._emit(self.OUTPUT_EVENT, {"job_id": self.job_id, "stream": stream, "data": data})
+
+    def finish(self, returncode: int, error: str = None) -> None:
+        self.returncode = returncode
+        self.finished = True
+        self._emit(self.EXIT_EVENT, {"job_id": self.job_id, "returncode": returncode, "error": error})
+
+    def backlog(self) -> list:
+        with self._lock:
+            return list(self._backlog)
+
+
 class CommandService(ICommandService):
-    def __init__(self, base_path: str = None):
+    JOB_KIND = 'command'
+
+    def __init__(self, base_path: str = None, emitter=None, max_workers: int = COMMAND_MAX_WORKERS):
         self.base_path = base_path
+        self.emitter = emitter
+        self.jobs = JobManager(max_workers, history_limit=JOB_HISTORY_LIMIT, on_finish=self._save_job, name='command')
 
     def run_command(self, command: str, cwd: str = None, env: dict = None) -> tuple:
+        '''Run the command inline. stdout/stderr are returned as OutputCapture objects.'''
         try:
-            result = subprocess.run(command, shell=True, cwd=cwd, capture_output=True, text=True, env=env)
-            return True, result.stdout, result.stderr
+            proc = self._spawn(command, cwd, env)
+            _, stdout, stderr, _ = self._collect(proc, uuid.uuid4().hex)
+            return True, stdout, stderr
         except Exception as e:
-            return False, '', str(e)
-
-    # def execute_command(self, cmd, stream=False):
-    #     if stream:
-    #         proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    #         for line in proc.stdout:
-    #             yield line
-    #     else:
-    #         result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-    #         return result.stdout + result.stderr
+            return False, None, str(e)
+
+    def submit_command(self, command: str, cwd: str = None, env: dict = None, stream: bool = False, timeout: float = None) -> str:
+        '''Queue the command on the worker pool and return its job id straight away.'''
+        job_id = uuid.uuid4().hex
+        output_stream = CommandStream(job_id, self.emitter) if stream else None
+        metadata = {"command": command, "cwd": cwd, "stream": stream, "timeout": timeout, "worker": os.getpid()}
+        # recorded before it can start, so every worker process can look the job up while it runs
+        DB().insert(dict(metadata, job_id=job_id, kind=self.JOB_KIND, status=QUEUED, created_at=time.time()))
+        job = self.jobs.submit(self._execute, command, cwd, env, timeout, output_stream,
+                               kind=self.JOB_KIND, metadata=metadata, job_id=job_id)
+        job.stream = output_stream
+        return job_id
+
+    def run_batch(self, commands: list, parallelism: int = 1, stop_on_failure: bool = False) -> dict:
+        '''
+        Run a list of {command, cwd, env, timeout} specs with at most `parallelism`
+        of them at once and return per-command results in input order. With
+        stop_on_failure, the first failing command kills the running ones and
+        the ones not started yet are skipped.
+        '''
+        parallelism = max(1, min(parallelism, BATCH_MAX_PARALLELISM, len(commands) or 1))
+        stop_event = threading.Event()
+        running = set()
+        running_lock = threading.Lock()
+
+        def run(index, spec):
+            if stop_event.is_set():
+                return {"index": index, "command": spec.get('command'), "status": "skipped"}
+
+            result = self._run_one(index, spec, running, running_lock, stop_event)
+            if stop_on_failure and result["status"] != "passed" and not stop_event.is_set():
+                stop_event.set()
+                with running_lock:
+                    procs = list(running)
+                for proc in procs:
+                    self._kill(proc)
+            return result
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='batch') as executor:
+            results = list(executor.map(run, range(len(commands)), commands))
+
+        summary = {status: 0 for status in ("passed", "failed", "cancelled", "skipped")}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return {
+            "results": results,
+            "summary": summary,
+            "parallelism": parallelism,
+            "duration": round(time.monotonic() - start, 4),
+        }
+
+    def _run_one(self, index: int, spec: dict, running: set, running_lock: threading.Lock, stop_event: threading.Event) -> dict:
+        command = spec.get('command')
+        result = {"index": index, "command": command, "exit_code": None, "stdout": '', "stderr": '', "error": None}
+        start = time.monotonic()
+        try:
+            proc = self._spawn(command, spec.get('cwd'), spec.get('env'))
+        except Exception as e:
+            result.update(status="failed", error=str(e), duration=round(time.monotonic() - start, 4))
+            return result
+
+        with running_lock:
+            running.add(proc)
+        try:
+            returncode, stdout, stderr, error = self._collect(proc, uuid.uuid4().hex, timeout=spec.get('timeout'))
+        finally:
+            with running_lock:
+                running.discard(proc)
+
+        result.update(exit_code=returncode, error=error, duration=round(time.monotonic() - start, 4),
+                      stdout=stdout.text(), stderr=stderr.text(),
+                      outputs={"stdout": stdout.info(), "stderr": stderr.info()})
+        if returncode == 0 and error is None:
+            result["status"] = "passed"
+        elif stop_event.is_set() and returncode == -signal.SIGKILL:
+            # killed because another command of the batch failed first
+            result["status"] = "cancelled"
+        else:
+            result["status"] = "failed"
+        return result
+
+    def get_stream(self, job_id: str) -> CommandStream:
+        job = self.jobs.get(job_id)
+        return getattr(job, 'stream', None)
+
+    def get_job(self, job_id: str) -> dict:
+        '''Jobs of this worker come from the pool, older ones and those of other workers from the DB.'''
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+
+        records = DB().search({"kind": self.JOB_KIND, "job_id": job_id})
+        return records[0] if records else None
+
+    def list_jobs(self) -> list:
+        return [job.to_dict(include_result=False) for job in self.jobs.list()]
+
+    def cancel_job(self, job_id: str) -> bool:
+        return self.jobs.cancel(job_id)
+
+    def _save_job(self, job: Job) -> None:
+        record = job.to_dict(include_result=False)
+        if isinstance(job.result, dict):
+            record["returncode"] = job.result.get("returncode")
+            record["outputs"] = job.result.get("outputs")
+        DB().update(record, {"kind": self.JOB_KIND, "job_id": job.job_id})
+
+    def _execute(self, job: Job, command: str, cwd: str, env: dict, timeout: float, stream: CommandStream) -> dict:
+        self._save_job(job)     # now running
+        try:
+            proc = self._spawn(command, cwd, env)
+        except Exception as e:
+            if stream is not None:
+                stream.finish(None, error=str(e))
+            raise
+
+        job.on_cancel(functools.partial(self._kill, proc))
+        returncode, stdout, stderr, error = self._collect(proc, job.job_id, timeout=timeout, stream=stream)
+        if stream is not None:
+            stream.finish(returncode, error=error)
+        if error:
+            job.error = error
+        result = {
+            "returncode": returncode,
+            "outputs": {"stdout": stdout.info(), "stderr": stderr.info()},
+        }
+        if stream is None:
+            # streamed output already went to the subscribers, the job only keeps where it was spilled
+            result["stdout"] = stdout.text()
+            result["stderr"] = stderr.text()
+        return result
+
+    @staticmethod
+    def _spawn(command: str, cwd: str, env: dict) -> subprocess.Popen:
+        # own process group, so cancel/timeout also kills the shell's children
+        return subprocess.Popen(command, shell=True, cwd=cwd, env=env, start_new_session=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _collect(self, proc: subprocess.Popen, output_id: str, timeout: float = None, stream: CommandStream = None) -> tuple:
+        '''
+        Drain both pipes of proc into bounded OutputCaptures (and the stream, if
+        any) and wait for it to exit. Returns (returncode, stdout, stderr, error).
+        '''
+        captures = {
+            'stdout': OutputCapture(f"{output_id}-stdout"),
+            'stderr': OutputCapture(f"{output_id}-stderr"),
+        }
+        readers = [
+            threading.Thread(target=self._pump, args=(getattr(proc, name), name, capture, stream), daemon=True)
+            for name, capture in captures.items()
+        ]
+        COMMANDS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        for reader in readers:
+            reader.start()
+
+        error = None
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._kill(proc)
+            returncode = proc.wait()
+            error = f"Command timed out after {timeout}s"
+        for reader in readers:
+            reader.join()
+        for capture in captures.values():
+            capture.close()
+        result = 'timeout' if error else ('ok' if returncode == 0 else 'failed')
+        COMMAND_SECONDS.labels(result).observe(time.perf_counter() - start)
+        COMMANDS_IN_FLIGHT.dec()
+        return returncode, captures['stdout'], captures['stderr'], error
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def _pump(pipe, name: str, capture: OutputCapture, stream: CommandStream = None) -> None:
+        # forward the pipe line by line, long lines are split at STREAM_READ_CHUNK bytes
+        with pipe:
+            for line in iter(functools.partial(pipe.readline, STREAM_READ_CHUNK), b''):
+                capture.write(line)
+                if stream is not None:
+                    stream.write(name, line.decode('utf-8', errors='replace'))
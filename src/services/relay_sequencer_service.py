@@ -0,0 +1,306 @@
+import re
+import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from src.modules.relay import Relay
+from src.core.job_manager import Job, JobManager, CANCELLED
+from src.utils.timer_wheel import TimerWheel
+from src.app.settings import JOB_HISTORY_LIMIT, RELAY_RESET_OFF_TIME, RELAY_SEQUENCE_MAX_STEPS
+
+class IRelaySequencerService(ABC):
+    @abstractmethod
+    def run_sequence(self, steps: list, stop_on_error: bool = True) -> str:
+        pass
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> dict:
+        pass
+
+    @abstractmethod
+    def cancel_job(self, job_id: str) -> bool:
+        pass
+
+
+def parse_outlets(spec) -> list:
+    '''Outlet numbers from 3, "1-8", "1,3,5", "1-4,7" or [1, "3-5"].'''
+    if isinstance(spec, bool) or spec is None:
+        raise ValueError(f"invalid outlets {spec!r}")
+    if isinstance(spec, int):
+        items = [spec]
+    elif isinstance(spec, str):
+        items = [item.strip() for item in spec.split(',') if item.strip()]
+    elif isinstance(spec, list):
+        items = spec
+    else:
+        raise ValueError(f"invalid outlets {spec!r}")
+
+    outlets = []
+    for item in items:
+        if isinstance(item, int) and not isinstance(item, bool):
+            outlets.append(item)
+            continue
+        match = re.fullmatch(r'\s*(\d+)\s*(?:-\s*(\d+)\s*)?', str(item))
+        if match is None:
+            raise ValueError(f"invalid outlets {item!r}")
+        first, last = int(match.group(1)), int(match.group(2) or match.group(1))
+        if last < first:
+            raise ValueError(f"invalid outlet range {item!r}")
+        outlets.extend(range(first, last + 1))
+    if not outlets:
+        raise ValueError("no outlets given")
+    # keep the given order, it is the stagger order
+    return list(dict.fromkeys(outlets))
+
+
+def parse_seconds(value) -> float:
+    '''Seconds from 2, 0.5, "2s", "200ms" or "1.5".'''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        seconds = float(value)
+    else:
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*', str(value))
+        if match is None:
+            raise ValueError(f"invalid duration {value!r}")
+        seconds = float(match.group(1)) / (1000 if match.group(2) == 'ms' else 1)
+    if seconds < 0:
+        raise ValueError(f"invalid duration {value!r}")
+    return seconds
+
+
+class SequenceRun:
+    '''Progress of one running sequence.'''
+    def __init__(self, job: Job, phases: list, stop_on_error: bool):
+        self.job = job
+        self.phases = phases
+        self.stop_on_error = stop_on_error
+        self.remaining = 0
+        self.actions = []
+        self.timers = []
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class RelaySequencerService(IRelaySequencerService):
+    '''
+    Runs declarative power sequences over named relays without blocking the caller.
+
+    A sequence is a list of steps:
+
+        {"action": "off",   "relay": "rack1", "outlets": "1-8"}
+        {"action": "wait",  "duration": "2s"}
+        {"action": "on",    "relays": ["rack1", "rack2"], "outlets": "1,3,5", "stagger": "200ms"}
+        {"action": "reset", "relays": {"rack1": "1-8", "rack2": "1-4"}, "off_time": 2, "stagger": 0.2}
+
+    Each step starts once every write of the previous step is done. Nothing
+    sleeps: waits and staggers are timers on a shared TimerWheel, and the
+    writes run on one worker per relay, so writes to a relay stay in order
+    and different relays and sequences proceed in parallel. Unstaggered
+    writes to a relay are batched into one set_states() call. on_change(name)
+    is called after every write. With device, e.g. RelayRegistry.device,
+    each write is done in device(name) (a context manager yielding the
+    relay) instead of on the relay directly.
+    '''
+    JOB_KIND = 'relay_sequence'
+
+    def __init__(self, relays: dict = None, on_change: callable = None, device: callable = None):
+        self.relays = {}
+        self.on_change = on_change
+        self.device = device or (lambda name: nullcontext(self.relays[name]))
+        # sequences are driven by timers and relay workers, the manager only tracks them
+        self.jobs = JobManager(0, history_limit=JOB_HISTORY_LIMIT, name='relay-sequence')
+        self.wheel = TimerWheel(name='relay-timer-wheel')
+        self._workers = {}
+        self._lock = threading.Lock()
+        for name, relay in (relays or {}).items():
+            self.add_relay(name, relay)
+
+    def add_relay(self, name: str, relay: Relay) -> None:
+        with self._lock:
+            self.relays[name] = relay
+            if name not in self._workers:
+                self._workers[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"relay-{name}")
+
+    def run_sequence(self, steps: list, stop_on_error: bool = True) -> str:
+        '''Validate and start the sequence, return its job id. Raises ValueError for bad steps.'''
+        phases = self.compile(steps)
+        job = self.jobs.track(kind=self.JOB_KIND, metadata={"steps": len(steps)})
+        run = SequenceRun(job, phases, stop_on_error)
+        job.on_cancel(lambda: self._cancel(run))
+        with run.lock:
+            self._start_phase(run, 0)
+        return job.job_id
+
+    def get_job(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        return job.to_dict() if job is not None else None
+
+    def list_jobs(self) -> list:
+        return [job.to_dict(include_result=False) for job in self.jobs.list()]
+
+    def cancel_job(self, job_id: str) -> bool:
+        return self.jobs.cancel(job_id)
+
+    def compile(self, steps: list) -> list:
+        '''
+        Turn steps into phases: {"delay": seconds before the phase starts,
+        "actions": [(offset, relay_name, {outlet: state})]}.
+        '''
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("steps must be a non-empty list")
+        if len(steps) > RELAY_SEQUENCE_MAX_STEPS:
+            raise ValueError(f"at most {RELAY_SEQUENCE_MAX_STEPS} steps are allowed")
+
+        phases = []
+        delay = 0.0
+        for number, step in enumerate(steps, 1):
+            if not isinstance(step, dict):
+                raise ValueError(f"step {number}: must be an object")
+            action = step.get("action")
+            try:
+                if action == "wait":
+                    delay += parse_seconds(step.get("duration"))
+                    continue
+                if action not in ("on", "off", "reset"):
+                    raise ValueError(f"unknown action {action!r}")
+                targets = self._targets(step)
+                stagger = parse_seconds(step.get("stagger", 0))
+                if action == "reset":
+                    # off all at once, inrush only matters when switching on
+                    phases.append({"delay": delay, "actions": self._actions(targets, 0, 0)})
+                    delay = parse_seconds(step.get("off_time", RELAY_RESET_OFF_TIME))
+                    phases.append({"delay": delay, "actions": self._actions(targets, 1, stagger)})
+                else:
+                    phases.append({"delay": delay, "actions": self._actions(targets, 1 if action == "on" else 0, stagger)})
+            except ValueError as e:
+                raise ValueError(f"step {number}: {e}")
+            delay = 0.0
+
+        if delay:
+            # a trailing wait still counts towards the job duration
+            phases.append({"delay": delay, "actions": []})
+        return phases
+
+    def _targets(self, step: dict) -> list:
+        if "relays" in step:
+            relays = step["relays"]
+        elif "relay" in step:
+            relays = [step["relay"]]
+        else:
+            raise ValueError("relay or relays is required")
+
+        if isinstance(relays, dict):
+            pairs = [(name, parse_outlets(outlets)) for name, outlets in relays.items()]
+        elif isinstance(relays, list):
+            outlets = parse_outlets(step.get("outlets"))
+            pairs = [(name, outlets) for name in relays]
+        else:
+            raise ValueError("relays must be a list or an object")
+
+        targets = []
+        for name, outlets in pairs:
+            relay = self.relays.get(name)
+            if relay is None:
+                raise ValueError(f"unknown relay {name!r}")
+            count = len(relay.prev_state)
+            for outlet in outlets:
+                if not 1 <= outlet <= count:
+                    raise ValueError(f"relay {name!r} has no outlet {outlet}")
+                targets.append((name, outlet))
+        return targets
+
+    @staticmethod
+    def _actions(targets: list, state: int, stagger: float) -> list:
+        if stagger:
+            return [(index * stagger, name, {outlet: state}) for index, (name, outlet) in enumerate(targets)]
+        grouped = {}
+        for name, outlet in targets:
+            grouped.setdefault(name, {})[outlet] = state
+        return [(0, name, states) for name, states in grouped.items()]
+
+    # all methods below are called with run.lock held
+    def _start_phase(self, run: SequenceRun, index: int) -> None:
+        if run.job.finished:
+            return
+        if index == len(run.phases):
+            self._complete(run)
+            return
+
+        delay = run.phases[index]["delay"]
+        if delay:
+            run.timers.append(self.wheel.schedule(delay, self._on_timer, run, self._run_phase, index))
+        else:
+            self._run_phase(run, index)
+
+    def _run_phase(self, run: SequenceRun, index: int) -> None:
+        if run.job.finished:
+            return
+        actions = run.phases[index]["actions"]
+        if not actions:
+            self._start_phase(run, index + 1)
+            return
+        run.remaining = len(actions)
+        for offset, name, states in actions:
+            if offset:
+                run.timers.append(self.wheel.schedule(offset, self._on_timer, run, self._dispatch, index, name, states))
+            else:
+                self._dispatch(run, index, name, states)
+
+    def _on_timer(self, run: SequenceRun, callback: callable, *args) -> None:
+        with run.lock:
+            callback(run, *args)
+
+    def _dispatch(self, run: SequenceRun, index: int, name: str, states: dict) -> None:
+        if run.job.finished:
+            return
+        self._workers[name].submit(self._apply, run, index, name, states)
+
+    def _apply(self, run: SequenceRun, index: int, name: str, states: dict) -> None:
+        # relay I/O, runs on the relay's worker without run.lock held
+        if run.job.finished:
+            return
+        error = None
+        try:
+            with self.device(name) as relay:
+                if not relay.set_states(states):
+                    error = f"relay {name} rejected {states}"
+        except Exception as e:
+            error = f"relay {name} failed: {e}"
+        if self.on_change is not None:
+            # e.g. write the new states through to a cache
+            try:
+                self.on_change(name)
+            except Exception as e:
+                print(f"[ Error ] Relay change callback failed for {name} : {e}")
+
+        with run.lock:
+            run.actions.append({
+                "relay": name,
+                "states": states,
+                "at": round(time.monotonic() - run.started, 3),
+                "error": error,
+            })
+            if run.job.finished:
+                return
+            if error is not None:
+                run.job.error = error
+                if run.stop_on_error:
+                    self._complete(run)
+                    return
+            run.remaining -= 1
+            if not run.remaining:
+                self._start_phase(run, index + 1)
+
+    def _complete(self, run: SequenceRun, status: str = None) -> None:
+        for timer in run.timers:
+            timer.cancel()
+        run.job.result = {
+            "actions": run.actions,
+            "duration": round(time.monotonic() - run.started, 3),
+        }
+        self.jobs.finish(run.job, status)
+
+    def _cancel(self, run: SequenceRun) -> None:
+        with run.lock:
+            if not run.job.finished:
+                self._complete(run, CANCELLED)
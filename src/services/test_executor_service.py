@@ -1,49 +1,359 @@
 import os
-import subprocess
+import time
+import uuid
+import itertools
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.app.db_client import DB
+from src.app.drain import DrainState, pid_alive
+from src.core.job_manager import QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED, FINISHED_STATES
+from src.utils.file_lock import FileLock
 from src.test_flow.flow_list import FLOW_ROUTES
+from src.app.settings import TEST_MAX_WORKERS, TEST_LOG_DIR, JOB_HISTORY_LIMIT
+
+# resource kinds a run can declare, e.g. {"ports": ["/dev/ttyUSB0"], "relays": ["rack1"]}
+RESOURCE_KINDS = {"ports": "port", "relays": "relay", "workareas": "workarea"}
+# other names accepted for a kind in the "kind:name" form
+RESOURCE_ALIASES = {"uart": "port"}
+
+# queued run checkpointed while the server drains for a restart, resumed by the next server
+INTERRUPTED = 'interrupted'
+
+
+def normalize_resources(resources) -> frozenset:
+    '''
+    {"ports": [...], "relays": [...], "workareas": [...]} or ["port:/dev/ttyUSB0", ...]
+    ("uart:" for "port:" as well) -> {"port:/dev/ttyUSB0", ...}. Raises ValueError.
+    '''
+    if not resources:
+        return frozenset()
+    if isinstance(resources, dict):
+        keys = set()
+        for kind, names in resources.items():
+            if kind not in RESOURCE_KINDS:
+                raise ValueError(f"Unknown resource kind '{kind}', expected one of {', '.join(RESOURCE_KINDS)}")
+            if isinstance(names, str):
+                names = [names]
+            keys.update(f"{RESOURCE_KINDS[kind]}:{name}" for name in names)
+        return frozenset(keys)
+    if isinstance(resources, (list, tuple, set, frozenset)):
+        keys = set()
+        for key in resources:
+            kind, _, name = key.partition(':') if isinstance(key, str) else ('', '', '')
+            kind = RESOURCE_ALIASES.get(kind, kind)
+            if kind not in RESOURCE_KINDS.values() or not name:
+                raise ValueError(f"Invalid resource '{key}', expected <{'|'.join(RESOURCE_KINDS.values())}>:<name>")
+            keys.add(f"{kind}:{name}")
+        return frozenset(keys)
+    raise ValueError("resources must be an object or a list")
+
+
+class TestRun:
+    '''One scheduled test run.'''
+    def __init__(self, run_id: str, fn: callable, priority: int, resources: frozenset, metadata: dict, seq: int):
+        self.run_id = run_id
+        self.fn = fn
+        self.priority = priority
+        self.resources = resources
+        self.metadata = metadata or {}
+        self.seq = seq
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.locks = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        data = {
+            "kind": TestScheduler.JOB_KIND,
+            "run_id": self.run_id,
+            "status": self.status,
+            "priority": self.priority,
+            "resources": sorted(self.resources),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        data.update(self.metadata)
+        return data
+
+
+class TestScheduler:
+    '''
+    Runs tests on a bounded worker pool, highest priority first (FIFO within a priority).
+
+    Every run declares the resources it needs (UART ports, relays, workareas).
+    A run is only started once all of them are free, and then takes them all
+    at once, so runs never hold some resources while waiting for others and
+    cannot deadlock. While a run waits, its resources are reserved against
+    lower priority runs, so it cannot be starved by them; runs that need
+    other resources still start around it. Run records are kept in the DB.
+
+    Resources are also locked against the other worker processes, with one
+    lock file per resource taken when the run starts. A run whose resources
+    are held by another worker waits and is tried again every check_interval
+    seconds (reservations only apply within a worker).
+
+    While the server drains for a restart no run is started; queued runs are
+    marked interrupted in the DB for the next server to resume, and queued
+    here again if the drain is called off. Running tests are never aborted.
+    '''
+    JOB_KIND = 'test_run'
+
+    def __init__(self, max_workers: int = TEST_MAX_WORKERS, history_limit: int = JOB_HISTORY_LIMIT,
+                 drain: DrainState = None):
+        self.max_workers = max_workers
+        self.history_limit = history_limit
+        self.drain = drain or DrainState()
+        self._parking = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='test-run')
+        self._queue = []
+        self._runs = OrderedDict()
+        self._held = set()
+        self._blocked = False
+        self._running = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._watch, name='test-scheduler', daemon=True).start()
+
+    def submit(self, fn: callable, resources=None, priority: int = 0, metadata: dict = None, run_id: str = None) -> str:
+        '''Queue fn(run) and return the run id. Raises ValueError for invalid resources.'''
+        run = TestRun(run_id or uuid.uuid4().hex, fn, int(priority), normalize_resources(resources), metadata, next(self._seq))
+        DB().insert(run.to_dict())
+        with self._lock:
+            self._runs[run.run_id] = run
+            self._prune()
+            self._queue.append(run)
+            self._dispatch()
+        return run.run_id
+
+    def get(self, run_id: str) -> dict:
+        '''Live and recent runs come from memory, older ones from the DB.'''
+        with self._lock:
+            run = self._runs.get(run_id)
+        if run is not None:
+            return run.to_dict()
+        records = DB().search({"kind": self.JOB_KIND, "run_id": run_id})
+        return records[0] if records else None
+
+    def list(self) -> list:
+        with self._lock:
+            return [run.to_dict() for run in self._runs.values()]
+
+    def cancel(self, run_id: str) -> bool:
+        '''
+        Cancel a queued or running run. Queued runs never start; running ones
+        get their cancel_event set and are expected to stop at the next check.
+        '''
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run.finished:
+                return False
+            run.cancel_event.set()
+            if run.status not in (QUEUED, INTERRUPTED):
+                return True
+            self._queue.remove(run)
+            run.status = CANCELLED
+            run.finished_at = time.time()
+            self._dispatch()
+        self._save(run)
+        return True
+
+    def _dispatch(self) -> None:
+        # called with the lock held
+        if self._parking or self.drain.active:
+            return
+        reserved = set()
+        waiting = []
+        self._blocked = False
+        for run in sorted(self._queue, key=lambda item: (-item.priority, item.seq)):
+            if (self._running < self.max_workers and not (run.resources & (self._held | reserved))
+                    and self._lock_resources(run)):
+                self._held |= run.resources
+                self._running += 1
+                run.status = RUNNING
+                run.started_at = time.time()
+                self._executor.submit(self._run, run)
+            else:
+                reserved |= run.resources
+                waiting.append(run)
+        self._queue = waiting
+
+    def _lock_resources(self, run: TestRun) -> bool:
+        # all of them or none, so a run never holds some while another worker holds the rest
+        locks = [FileLock(f"resource-{key}") for key in sorted(run.resources)]
+        for index, lock in enumerate(locks):
+            if not lock.acquire():
+                for taken in locks[:index]:
+                    taken.release()
+                self._blocked = True
+                return False
+        run.locks = locks
+        return True
+
+    def _run(self, run: TestRun) -> None:
+        self._save(run)
+        try:
+            run.result = run.fn(run)
+            if run.cancel_event.is_set():
+                status = CANCELLED
+            else:
+                status = FAILED if run.error or run.result is False else SUCCEEDED
+        except Exception as e:
+            run.error = str(e)
+            status = FAILED
+
+        with self._lock:
+            run.status = status
+            run.finished_at = time.time()
+            self._held -= run.resources
+            for lock in run.locks:
+                lock.release()
+            run.locks = []
+            self._running -= 1
+            self._dispatch()
+        self._save(run)
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.drain.check_interval)
+            if self._queue and self.drain.active:
+                self._park()
+            elif self._blocked:
+                # another worker does not tell when it frees a resource
+                with self._lock:
+                    self._dispatch()
+
+    def _park(self) -> None:
+        # checkpoint the queued runs until the drain ends, new ones included
+        with self._lock:
+            self._parking = True
+        while self.drain.active:
+            with self._lock:
+                parked = [run for run in self._queue if run.status == QUEUED]
+                for run in parked:
+                    run.status = INTERRUPTED
+            for run in parked:
+                self._save(run)
+            time.sleep(self.drain.check_interval)
+
+        # the drain was called off, this server keeps running them
+        with self._lock:
+            resumed = [run for run in self._queue if run.status == INTERRUPTED]
+        for run in resumed:
+            DB().update({"status": QUEUED}, {"kind": self.JOB_KIND, "run_id": run.run_id})
+        with self._lock:
+            for run in resumed:
+                run.status = QUEUED
+            self._parking = False
+            self._dispatch()
+        if resumed:
+            print(f"[ Info ] Drain ended, {len(resumed)} interrupted test run(s) queued again")
+
+    def _save(self, run: TestRun) -> None:
+        try:
+            DB().update(run.to_dict(), {"kind": self.JOB_KIND, "run_id": run.run_id})
+        except Exception as e:
+            print(f"[ Error ] Failed to save test run {run.run_id} : {e}")
+
+    def _prune(self) -> None:
+        # drop the oldest finished runs from memory, they stay in the DB
+        finished = [run_id for run_id, run in self._runs.items() if run.finished]
+        for run_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._runs[run_id]
+
 
 class TestExecutorService():
-    def __init__(self, test_data: dict):
+    def __init__(self, test_data: dict, scheduler: TestScheduler, run_id: str = None):
         self.test_data = test_data
+        self.scheduler = scheduler
+        self.run_id = run_id or uuid.uuid4().hex
+        self.log_dir = None
 
-    def entry_point(self) -> bool:
-        status = True
-
-        if status:
-            status = self.validate_test()
+    @classmethod
+    def resume_interrupted(cls, scheduler: TestScheduler) -> list:
+        '''
+        Queue again, under their run ids, the runs left interrupted by a server
+        process that has exited. Returns the resumed run ids.
+        '''
+        resumed = []
+        for record in DB().search({"kind": TestScheduler.JOB_KIND, "status": INTERRUPTED}):
+            if pid_alive(record.get("worker")) or not record.get("request"):
+                continue
+            cond = {"kind": TestScheduler.JOB_KIND, "run_id": record["run_id"]}
+            service = cls(record["request"], scheduler, run_id=record["run_id"])
+            try:
+                service.validate_test()
+            except ValueError as e:
+                DB().update({"status": FAILED, "error": str(e), "finished_at": time.time()}, cond)
+                continue
+            # submit() records the run afresh
+            DB().delete(cond)
+            service.setup_environment()
+            resumed.append(service.run_test())
+        if resumed:
+            print(f"[ Info ] Resumed {len(resumed)} interrupted test run(s)")
+        return resumed
 
-        if status:
-            status = self.setup_environment()
-        
-        if status:
-            status = self.run_test()
-        
-        return status
+    def entry_point(self) -> str:
+        '''Validate the request, prepare the run and queue it. Returns the run id.'''
+        self.validate_test()
+        self.setup_environment()
+        return self.run_test()
 
     def validate_test(self) -> bool:
-        # Validate test data
-        # check for required fields
-        # e.g., test_flow, parameters, etc.
-
         # check if test_flow is present
+        flow_name = self.test_data.get('test_flow')
         if flow_name not in FLOW_ROUTES:
             raise ValueError(f"Test flow '{flow_name}' is not recognized.")
-        
+
+        normalize_resources(self.test_data.get('resources'))
         return True
 
     def setup_environment(self) -> bool:
-        # create dir for logs
-        # store status and logs path in db
-        pass
+        # create dir for logs, its path is stored in the run record
+        self.log_dir = TEST_LOG_DIR / self.run_id
+        os.makedirs(self.log_dir, exist_ok=True)
+        return True
 
-    def run_test(self) -> bool:
-        # Run the test test_flow
-        flow_name = self.test_data.get('test_flow')
+    def run_test(self) -> str:
+        # Queue the test flow on the scheduler
+        metadata = {
+            "name": self.test_data.get('name'),
+            "test_flow": self.test_data.get('test_flow'),
+            "log_dir": str(self.log_dir),
+            # kept so the run can be resumed by another server process after a restart
+            "request": dict(self.test_data),
+            "worker": os.getpid(),
+        }
+        return self.scheduler.submit(self.execute, resources=self.test_data.get('resources'),
+                                     priority=self.test_data.get('priority') or 0,
+                                     metadata=metadata, run_id=self.run_id)
 
-        # Test the test flow on new thread
-        test_flow = FLOW_ROUTES.get(flow_name)
-        test_thread = threading.Thread(target=test_flow.execute, args=(self.test_data,))
-        test_thread.start()
+    def execute(self, run: TestRun) -> bool:
+        # runs on a scheduler worker once all resources of the run are free
+        test_flow = FLOW_ROUTES.get(self.test_data.get('test_flow'))
+        shared_data = {
+            "run_id": run.run_id,
+            "test_data": self.test_data,
+            "log_dir": str(self.log_dir),
+            "resources": sorted(run.resources),
+            "cancel_event": run.cancel_event,
+        }
+        for step in (test_flow.setup, test_flow.validate, test_flow.execute):
+            if run.cancel_event.is_set():
+                return False
+            if step(shared_data) is False:
+                run.error = f"{step.__name__} failed"
+                return False
         return True
-
@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import signal
+import subprocess
+import threading
+import requests
+from abc import ABC, abstractmethod
+from src.app.db_client import DB
+from src.app.drain import DrainState, pid_alive, HANDING_OFF, HANDED_OFF
+from src.app.settings import UPDATE_DRAIN_TIMEOUT, UPDATE_HEALTH_TIMEOUT, GUNICORN_PID_FILE
+
+class IUpdateService(ABC):
+    @abstractmethod
+    def start(self, deadline: float = UPDATE_DRAIN_TIMEOUT, force: bool = False) -> dict:
+        pass
+
+    @abstractmethod
+    def status(self) -> dict:
+        pass
+
+
+class UpdateService(IUpdateService):
+    '''
+    Pulls the latest code and restarts the server without dropping work.
+
+    The server first drains: new jobs and test runs are refused with 503,
+    queued test runs are checkpointed for the next server, and the update
+    waits until no command job, test run or repo sync of a live worker is
+    left, up to the deadline. Past the deadline the update is called off,
+    unless forced.
+
+    Under gunicorn the master is then sent SIGUSR2, which starts a new master
+    with the new code on the same listening socket. The old master is only
+    stopped (SIGTERM, its workers finish their requests) once /health is
+    answered by the new one, which then ends the drain; if it does not come
+    up, it is stopped instead and this server keeps serving. Without
+    gunicorn the process re-executes itself after the drain.
+    '''
+    JOB_KIND = 'update'
+
+    def __init__(self, drain: DrainState = None, repo_dir: str = None):
+        self.drain = drain or DrainState()
+        self.repo_dir = repo_dir or os.getcwd()
+        self._lock = threading.Lock()
+
+    def start(self, deadline: float = UPDATE_DRAIN_TIMEOUT, force: bool = False, port: int = None,
+              gunicorn: bool = False) -> dict:
+        '''Pull and start draining. Raises RuntimeError if an update is already running or the pull fails.'''
+        with self._lock:
+            if self.drain.active:
+                raise RuntimeError("An update is already in progress")
+
+            result = subprocess.run(
+                ["git", "pull", "origin", "main"], cwd=self.repo_dir,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or "git pull failed")
+
+            self.drain.begin(time.time() + deadline, force=force)
+        threading.Thread(target=self._run, args=(deadline, force, port, gunicorn), name='update', daemon=True).start()
+        print(f"[ Info ] Update pulled, draining for up to {deadline}s before the restart")
+        return self.status()
+
+    def status(self) -> dict:
+        '''The running update, or the outcome of the last one.'''
+        info = self.drain.info()
+        if info is None:
+            records = DB().search({"kind": self.JOB_KIND})
+            info = max(records, key=lambda record: record.get("finished_at") or 0) if records else {}
+        return dict(info, in_flight=self.in_flight())
+
+    @staticmethod
+    def in_flight() -> dict:
+        '''Command jobs, test runs and repo syncs of live server processes that are not finished yet.'''
+        counts = {}
+        for kind in ("command", "test_run", "repo_sync"):
+            counts[kind] = sum(
+                1 for status in ("queued", "running")
+                for record in DB().search({"kind": kind, "status": status})
+                if pid_alive(record.get("worker"))
+            )
+        return counts
+
+    def _run(self, deadline: float, force: bool, port: int, gunicorn: bool) -> None:
+        try:
+            if not self._wait_idle(deadline) and not force:
+                self._finish("aborted", "In-flight work did not finish before the deadline")
+                return
+            self.drain.update(phase=HANDING_OFF)
+            if gunicorn:
+                self._hand_off(port)
+            else:
+                self._reexec()
+        except Exception as e:
+            self._finish("failed", str(e))
+
+    def _wait_idle(self, deadline: float) -> bool:
+        end = time.monotonic() + deadline
+        while True:
+            in_flight = self.in_flight()
+            self.drain.update(in_flight=in_flight)
+            if not any(in_flight.values()):
+                return True
+            if time.monotonic() >= end:
+                return False
+            time.sleep(1)
+
+    def _hand_off(self, port: int) -> None:
+        old_master = os.getppid()
+        os.kill(old_master, signal.SIGUSR2)
+        new_master = self._wait_new_master(port, old_master)
+        if new_master is None:
+            # the new master wrote the pid file, the old one moved its own to <pidfile>.oldbin
+            new_master = self._read_pid(GUNICORN_PID_FILE)
+            if new_master and new_master != old_master and pid_alive(new_master):
+                os.kill(new_master, signal.SIGTERM)
+            self._finish("failed", f"The new server did not answer /health within {UPDATE_HEALTH_TIMEOUT}s")
+            return
+
+        # the drain stays on until the new server has taken over, so these workers start nothing new
+        self._finish(HANDED_OFF, f"Handed off to master {new_master}", end=False)
+        print(f"[ Info ] New server (master {new_master}) is healthy, stopping master {old_master}")
+        os.kill(old_master, signal.SIGTERM)
+
+    @staticmethod
+    def _read_pid(path) -> int:
+        try:
+            with open(path, 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _wait_new_master(port: int, old_master: int) -> int:
+        # old and new workers share the socket, so keep asking until a new one answers
+        end = time.monotonic() + UPDATE_HEALTH_TIMEOUT
+        while time.monotonic() < end:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/health", timeout=2)
+                master = response.json().get("master") if response.status_code == 200 else None
+                if master and master != old_master:
+                    return master
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(0.5)
+        return None
+
+    def _reexec(self) -> None:
+        self._finish("succeeded", "Restarting")
+        time.sleep(1)  # Give some time for the responses to be sent
+        python = sys.executable
+        os.execl(python, python, *sys.argv)
+
+    def _finish(self, phase: str, message: str, end: bool = True) -> None:
+        info = self.drain.info() or {}
+        record = dict(info, kind=self.JOB_KIND, phase=phase, message=message, finished_at=time.time())
+        try:
+            DB().insert(record)
+            DB().flush()
+        except Exception as e:
+            print(f"[ Error ] Failed to save update record : {e}")
+        if end:
+            self.drain.end()
+        else:
+            self.drain.update(phase=phase)
+        level = "[ Info ]" if phase in ("succeeded", HANDED_OFF) else "[ Error ]"
+        print(f"{level} Update {phase} : {message}")
@@ -1,17 +1,119 @@
 import os
+import time
+import uuid
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from src.app.db_client import DB
+from src.core.job_manager import Job, JobManager, QUEUED
+from src.core.repo_mirror import RepoMirror, run_git
+from src.utils.exception import GitError
+from src.app.settings import REPO_MANIFEST_DIR, REPO_SYNC_JOBS, REPO_SYNC_MAX_WORKERS, JOB_HISTORY_LIMIT
 
 class IWorkareaService(ABC):
     @abstractmethod
     def create_workarea(self, name: str) -> tuple:
         pass
 
+    @abstractmethod
     def repo_sync(self, device: str, sdk: str, xml_name: str) -> tuple:
         pass
 
+
+class ManifestProject:
+    '''One <project> of a repo manifest, with its remote and revision resolved.'''
+    def __init__(self, name: str, path: str, url: str, revision: str):
+        self.name = name
+        self.path = path
+        self.url = url
+        self.revision = revision
+
+
+def _inside(base: Path, path: Path) -> bool:
+    return os.path.commonpath([os.path.abspath(base), os.path.abspath(path)]) == os.path.abspath(base)
+
+
+def parse_manifest(path: Path) -> tuple:
+    '''
+    Projects of a repo manifest (<remote>, <default>, <project>, <include>,
+    <remove-project>). Returns ([ManifestProject], sync-j or None).
+    A relative remote fetch URL is taken relative to the manifest's directory,
+    so manifests can point at local bare repositories. Raises ValueError.
+    '''
+    path = Path(path)
+    remotes, default, elements = {}, {}, []
+
+    def load(manifest: Path, depth: int = 0) -> None:
+        if depth > 8:
+            raise ValueError(f"Manifest includes nest too deep at '{manifest.name}'")
+        try:
+            root = ET.parse(manifest).getroot()
+        except (OSError, ET.ParseError) as e:
+            raise ValueError(f"Invalid manifest '{manifest.name}' : {e}")
+        if root.tag != 'manifest':
+            raise ValueError(f"Invalid manifest '{manifest.name}' : root element is <{root.tag}>")
+        for element in root:
+            if element.tag == 'remote':
+                remotes[element.get('name')] = element.attrib
+            elif element.tag == 'default':
+                default.update(element.attrib)
+            elif element.tag == 'include':
+                load(manifest.parent / element.get('name', ''), depth + 1)
+            elif element.tag == 'project':
+                elements.append(element)
+            elif element.tag == 'remove-project':
+                elements[:] = [project for project in elements if project.get('name') != element.get('name')]
+
+    load(path)
+    projects, paths = [], set()
+    for element in elements:
+        name = element.get('name')
+        if not name:
+            raise ValueError("Manifest project without a name")
+        remote = remotes.get(element.get('remote') or default.get('remote'))
+        if remote is None or not remote.get('fetch'):
+            raise ValueError(f"Project '{name}' has no known remote")
+
+        fetch = remote['fetch']
+        if '://' not in fetch and not os.path.isabs(fetch) and ':' not in fetch.split('/', 1)[0]:
+            fetch = os.path.normpath(path.parent / fetch)
+        project_path = element.get('path') or name
+        if os.path.isabs(project_path) or '..' in Path(project_path).parts:
+            raise ValueError(f"Project '{name}' has an invalid path '{project_path}'")
+        if project_path in paths:
+            raise ValueError(f"Two projects are checked out at '{project_path}'")
+        paths.add(project_path)
+
+        revision = element.get('revision') or remote.get('revision') or default.get('revision') or 'HEAD'
+        projects.append(ManifestProject(name, project_path, f"{fetch.rstrip('/')}/{name}", revision))
+
+    if not projects:
+        raise ValueError(f"Manifest '{path.name}' has no projects")
+    sync_jobs = default.get('sync-j')
+    return projects, int(sync_jobs) if sync_jobs and sync_jobs.isdigit() else None
+
+
 class WorkareaService(IWorkareaService):
-    def __init__(self, base_path: str):
+    '''
+    Workareas under base_path, and repo syncs into them from a manifest.
+
+    repo_sync() checks out every project of REPO_MANIFEST_DIR/<device>/<sdk>/<xml_name>
+    into the workarea, `jobs` projects at a time. Objects come from the
+    shared RepoMirror: a new workarea is a --shared clone of each mirror
+    (no objects copied), an existing one is fetched from the mirror, which
+    only updates refs. Each project reports how long its mirror fetch and
+    checkout took.
+    '''
+    JOB_KIND = 'repo_sync'
+
+    def __init__(self, base_path: str, mirror: RepoMirror = None, manifest_dir: Path = REPO_MANIFEST_DIR):
         self.base_path = base_path
+        self.mirror = mirror or RepoMirror()
+        self.manifest_dir = Path(manifest_dir)
+        self.jobs = JobManager(REPO_SYNC_MAX_WORKERS, history_limit=JOB_HISTORY_LIMIT, on_finish=self._save_job,
+                               name='repo-sync')
 
     def create_workarea(self, name: str) -> tuple:
         path = os.path.join(self.base_path, name)
@@ -20,5 +122,124 @@ class WorkareaService(IWorkareaService):
             return True, os.path.abspath(path)
         return False, os.path.abspath(path)
 
-    def repo_sync(self, device: str, sdk: str, xml_name: str) -> tuple:
-        pass
\ No newline at end of file
+    def manifest_path(self, device: str, sdk: str, xml_name: str) -> Path:
+        if not xml_name.endswith('.xml'):
+            xml_name += '.xml'
+        path = self.manifest_dir / device / sdk / xml_name
+        if not _inside(self.manifest_dir, path):
+            raise ValueError("Invalid device, sdk or manifest name")
+        if not path.is_file():
+            raise ValueError(f"Manifest '{device}/{sdk}/{xml_name}' not found")
+        return path
+
+    def repo_sync(self, device: str, sdk: str, xml_name: str, workarea: str = None, jobs: int = None,
+                  cancel_event: threading.Event = None) -> tuple:
+        '''Sync the manifest's projects into the workarea. Returns (all synced, report). Raises ValueError.'''
+        manifest = self.manifest_path(device, sdk, xml_name)
+        projects, sync_jobs = parse_manifest(manifest)
+        root = Path(self.base_path) / (workarea or f"{device}_{sdk}")
+        if not _inside(self.base_path, root) or root.name.startswith('.'):
+            raise ValueError(f"Invalid workarea name '{workarea}'")
+        os.makedirs(root, exist_ok=True)
+        jobs = max(1, min(jobs or sync_jobs or REPO_SYNC_JOBS, len(projects)))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='repo-sync-project') as executor:
+            results = list(executor.map(lambda project: self._sync_project(root, project, cancel_event), projects))
+
+        failed = sum(1 for result in results if result["status"] not in ("cloned", "updated"))
+        report = {
+            "workarea": root.name,
+            "path": os.path.abspath(root),
+            "manifest": f"{device}/{sdk}/{manifest.name}",
+            "jobs": jobs,
+            "seconds": round(time.monotonic() - started, 3),
+            "failed": failed,
+            "projects": results,
+        }
+        level = "[ Info ]" if not failed else "[ Warning ]"
+        print(f"{level} repo sync of {report['manifest']} into {root.name} : {len(results) - failed}/{len(results)} projects in {report['seconds']}s")
+        return failed == 0, report
+
+    def submit_sync(self, device: str, sdk: str, xml_name: str, workarea: str = None, jobs: int = None) -> str:
+        '''Check the manifest and run repo_sync() in the background. Returns the job id. Raises ValueError.'''
+        parse_manifest(self.manifest_path(device, sdk, xml_name))
+        job_id = uuid.uuid4().hex
+        metadata = {"device": device, "sdk": sdk, "xml_name": xml_name, "workarea": workarea or f"{device}_{sdk}",
+                    "worker": os.getpid()}
+        # recorded before it can start, so every worker process can look the job up while it runs
+        DB().insert(dict(metadata, job_id=job_id, kind=self.JOB_KIND, status=QUEUED, created_at=time.time()))
+        self.jobs.submit(self._execute, device, sdk, xml_name, workarea, jobs,
+                         kind=self.JOB_KIND, metadata=metadata, job_id=job_id)
+        return job_id
+
+    def get_job(self, job_id: str) -> dict:
+        '''Jobs of this worker come from the pool, older ones and those of other workers from the DB.'''
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+
+        records = DB().search({"kind": self.JOB_KIND, "job_id": job_id})
+        return records[0] if records else None
+
+    def list_jobs(self) -> list:
+        return [job.to_dict(include_result=False) for job in self.jobs.list()]
+
+    def cancel_job(self, job_id: str) -> bool:
+        '''Projects that have not started are skipped, running git commands finish.'''
+        return self.jobs.cancel(job_id)
+
+    def _execute(self, job: Job, device: str, sdk: str, xml_name: str, workarea: str, jobs: int) -> dict:
+        self._save_job(job)     # now running
+        success, report = self.repo_sync(device, sdk, xml_name, workarea=workarea, jobs=jobs,
+                                         cancel_event=job.cancel_event)
+        if not success and not job.cancel_event.is_set():
+            job.error = f"{report['failed']} of {len(report['projects'])} projects failed to sync"
+        return report
+
+    def _save_job(self, job: Job) -> None:
+        DB().update(job.to_dict(), {"kind": self.JOB_KIND, "job_id": job.job_id})
+
+    def _sync_project(self, root: Path, project: ManifestProject, cancel_event: threading.Event = None) -> dict:
+        result = {"name": project.name, "path": project.path, "revision": project.revision, "status": "skipped",
+                  "commit": None, "mirror": None, "mirror_seconds": None, "checkout_seconds": None,
+                  "seconds": None, "error": None}
+        if cancel_event is not None and cancel_event.is_set():
+            return result
+
+        started = time.monotonic()
+        try:
+            mirror, result["mirror"] = self.mirror.update(project.url)
+            result["mirror_seconds"] = round(time.monotonic() - started, 3)
+
+            checkout_started = time.monotonic()
+            dest = root / project.path
+            if (dest / ".git").exists():
+                # objects are already in the mirror, this only moves refs
+                run_git(["fetch", "--quiet", "--prune", "--tags", "origin"], cwd=dest)
+                status = "updated"
+            else:
+                os.makedirs(dest.parent, exist_ok=True)
+                run_git(["clone", "--quiet", "--shared", "--no-checkout", str(mirror), str(dest)])
+                status = "cloned"
+            result["commit"] = self._resolve(dest, project.revision)
+            run_git(["checkout", "--quiet", "--detach", result["commit"]], cwd=dest)
+            result["checkout_seconds"] = round(time.monotonic() - checkout_started, 3)
+            result["status"] = status
+        except (GitError, OSError, ValueError) as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    @staticmethod
+    def _resolve(dest: Path, revision: str) -> str:
+        # branch names resolve to the mirror's branch, anything else (tag, sha, ref) as given
+        if revision.startswith('refs/heads/'):
+            revision = revision[len('refs/heads/'):]
+        for candidate in (f"refs/remotes/origin/{revision}", revision):
+            try:
+                return run_git(["rev-parse", "--verify", "--quiet", f"{candidate}^{{commit}}"], cwd=dest)
+            except GitError:
+                continue
+        raise ValueError(f"Revision '{revision}' not found")
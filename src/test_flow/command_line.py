@@ -3,17 +3,17 @@ from functools import wraps
 from src.test_flow.base_flow import IBaseFlow
 
 class CommandLineTestFlow(IBaseFlow):
-    def setup(self) -> bool:
+    def setup(self, shared_data: dict = {}) -> bool:
         # Setup necessary environment for command line test
         print("Setting up Command Line Test Flow")
         return True
     
-    def validate(self) -> bool:
+    def validate(self, shared_data: dict = {}) -> bool:
         # Validate the test parameters
         print("Validating Command Line Test Flow")
         return True
     
-    def execute(self) -> bool:
+    def execute(self, shared_data: dict = {}) -> bool:
         # Execute the command line test
         print("Executing Command Line Test Flow")
         return True
\ No newline at end of file
@@ -0,0 +1,138 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.test_flow.base_flow import IBaseFlow
+from src.plugins.plugin_engine import Plugin
+from src.app.settings import FLOW_MAX_PARALLEL_STAGES
+
+# Stage states
+PENDING = 'pending'
+PASSED = 'passed'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+CANCELLED = 'cancelled'
+
+
+def stage(depends_on: list = None, event: str = 'test') -> callable:
+    '''
+    Mark a DagFlow method as a stage. It starts once every stage in
+    `depends_on` passed, and runs wrapped by the Plugin on_<event> decorator.
+    '''
+    def decorator(method: callable) -> callable:
+        method._stage = {"depends_on": list(depends_on or []), "event": event}
+        return method
+    return decorator
+
+
+class DagFlow(IBaseFlow):
+    '''
+    Test flow made of stages with dependencies, e.g.
+
+        class BoardFlow(DagFlow):
+            @stage(event='flash')
+            def flash(self, shared_data): ...
+
+            @stage(event='command')
+            def sync_workarea(self, shared_data): ...
+
+            @stage(depends_on=['flash', 'sync_workarea'])
+            def run_tests(self, shared_data): ...
+
+    execute() runs every stage whose dependencies passed, as many at once as
+    are ready (up to max_parallel), so a run takes about as long as its
+    critical path. A stage fails by returning False or raising; only the
+    stages that depend on it, directly or not, are skipped. Stages share
+    shared_data, so each should write its own keys. Per-stage status and
+    durations end up in shared_data["stages"].
+    '''
+    def __init__(self, test_info: dict = None, max_parallel: int = FLOW_MAX_PARALLEL_STAGES):
+        super().__init__(test_info)
+        self.max_parallel = max_parallel
+        self.plugin = Plugin()
+        self.stages = {}
+        for name in dir(type(self)):
+            method = getattr(type(self), name, None)
+            if callable(method) and hasattr(method, '_stage'):
+                self.stages[name] = method._stage
+
+    def setup(self, shared_data: dict = {}) -> bool:
+        return True
+
+    def validate(self, shared_data: dict = {}) -> bool:
+        '''Every dependency must exist and the stages must not form a cycle.'''
+        for name, info in self.stages.items():
+            if not hasattr(self.plugin, f"on_{info['event']}"):
+                raise ValueError(f"Stage '{name}' uses unknown plugin event '{info['event']}'")
+            for dependency in info["depends_on"]:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+
+        # Kahn's algorithm: if some stages never become ready there is a cycle
+        remaining = {name: set(info["depends_on"]) for name, info in self.stages.items()}
+        while remaining:
+            ready = [name for name, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                raise ValueError(f"Stages {', '.join(sorted(remaining))} form a dependency cycle")
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        return True
+
+    def execute(self, shared_data: dict = {}) -> bool:
+        status = {name: PENDING for name in self.stages}
+        results = shared_data.setdefault("stages", {})
+        cancel_event = shared_data.get("cancel_event") or threading.Event()
+        dependents = {name: [] for name in self.stages}
+        for name, info in self.stages.items():
+            for dependency in info["depends_on"]:
+                dependents[dependency].append(name)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='flow-stage') as executor:
+            while True:
+                if not cancel_event.is_set():
+                    for name, info in self.stages.items():
+                        if (status[name] == PENDING and name not in running and
+                                all(status[dependency] == PASSED for dependency in info["depends_on"])):
+                            running[name] = executor.submit(self._run_stage, name, shared_data)
+                if not running:
+                    break
+
+                done, _ = wait(list(running.values()), return_when=FIRST_COMPLETED)
+                for name in [name for name, future in running.items() if future in done]:
+                    result = running.pop(name).result()
+                    results[name] = result
+                    status[name] = result["status"]
+                    if status[name] == FAILED:
+                        self._skip_dependents(name, dependents, status, results)
+
+        for name in self.stages:
+            if status[name] == PENDING:
+                status[name] = CANCELLED
+                results[name] = {"status": CANCELLED, "duration": 0, "error": None}
+        return all(state == PASSED for state in status.values())
+
+    def _run_stage(self, name: str, shared_data: dict) -> dict:
+        method = getattr(type(self), name)
+        wrapped = getattr(self.plugin, f"on_{self.stages[name]['event']}")(method)
+        start = time.monotonic()
+        error = None
+        try:
+            passed = wrapped(self, shared_data) is not False
+        except Exception as e:
+            print(f"[ Error ] Stage '{name}' of {type(self).__name__} failed : {e}")
+            error = str(e)
+            passed = False
+        return {"status": PASSED if passed else FAILED, "duration": round(time.monotonic() - start, 3), "error": error}
+
+    @staticmethod
+    def _skip_dependents(name: str, dependents: dict, status: dict, results: dict) -> None:
+        stack = list(dependents[name])
+        while stack:
+            dependent = stack.pop()
+            if status[dependent] != PENDING:
+                continue
+            status[dependent] = SKIPPED
+            results[dependent] = {"status": SKIPPED, "duration": 0, "error": f"dependency '{name}' failed"}
+            stack.extend(dependents[dependent])
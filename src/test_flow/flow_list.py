@@ -1,5 +1,7 @@
-from src.test_flow.command_line import CommandLineTestFlow
+from src.core.registry import LazyRegistry
 
-FLOW_ROUTES = {
-    'command_line': CommandLineTestFlow(),
-}
+# Flows are imported on first use. Other packages can add flows through the
+# "sysconn.flows" entry point group, or call FLOW_ROUTES.register(name, "module:Class").
+FLOW_ROUTES = LazyRegistry({
+    'command_line': 'src.test_flow.command_line:CommandLineTestFlow',
+}, entry_point_group='sysconn.flows', kind='flow')
@@ -5,4 +5,12 @@ Custom exception classes for the application.
 
 class UartSetupIssue(Exception):
     """Exception raised for errors in the UART setup."""
-    pass
\ No newline at end of file
+    pass
+
+class UartSessionBusy(Exception):
+    """Exception raised when a UART port could not be leased in time."""
+    pass
+
+class GitError(Exception):
+    """Exception raised when a git command fails."""
+    pass
@@ -0,0 +1,67 @@
+import os
+import re
+import time
+import fcntl
+from pathlib import Path
+from src.app.settings import LOCK_DIR
+
+
+class FileLock:
+    '''
+    Lock shared by every process on the host, through flock() on LOCK_DIR/<name>.lock.
+
+    The kernel drops the lock when the holder exits, even if it crashed, so a
+    lock is never left behind. Two FileLock objects with the same name exclude
+    each other, even inside one process.
+    '''
+    def __init__(self, name: str, directory: Path = LOCK_DIR):
+        self.name = name
+        self.path = Path(directory) / (re.sub(r'[^A-Za-z0-9_.-]', '_', name) + '.lock')
+        self._fd = None
+
+    @property
+    def locked(self) -> bool:
+        '''True while this object holds the lock.'''
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = False, timeout: float = None) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(self.path.parent, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    return False
+                # polled instead of a blocking flock() so eventlet workers are not frozen
+                time.sleep(0.05)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def owner(self) -> int:
+        '''pid of the process that last took the lock, if known.'''
+        try:
+            return int(self.path.read_text() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def __enter__(self):
+        self.acquire(blocking=True)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
@@ -0,0 +1,211 @@
+import os
+import gzip
+import time
+import queue
+import shutil
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from src.app.settings import (UART_LOG_MAX_BYTES, UART_LOG_ROTATE_INTERVAL, UART_LOG_BACKUP_COUNT,
+                              UART_LOG_QUEUE_SIZE, UART_LOG_FLUSH_INTERVAL)
+
+# closed segments of every writer are compressed one at a time, off the I/O path
+_compressor = None
+_compressor_lock = threading.Lock()
+
+def _get_compressor() -> ThreadPoolExecutor:
+    global _compressor
+    with _compressor_lock:
+        if _compressor is None:
+            _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+        return _compressor
+
+
+class AsyncLogWriter:
+    '''
+    File-like log sink that never blocks the caller on disk I/O.
+
+    write() only puts the chunk on a bounded queue (chunks are dropped and
+    counted if the queue is full). A writer thread drains the queue in
+    batches, prefixes every line with the wall-clock time the chunk arrived,
+    and rotates the file by size and/or age. Rotated segments are gzipped in
+    the background and only the newest backup_count are kept.
+    '''
+    BATCH_CHUNKS = 1024         # chunks written with one syscall at most
+    BATCH_BYTES = 256 * 1024    # bytes written with one syscall at most
+    def __init__(self, path, max_bytes: int = UART_LOG_MAX_BYTES, rotate_interval: float = UART_LOG_ROTATE_INTERVAL,
+                 backup_count: int = UART_LOG_BACKUP_COUNT, compress: bool = True, timestamps: bool = True,
+                 queue_size: int = UART_LOG_QUEUE_SIZE, flush_interval: float = UART_LOG_FLUSH_INTERVAL):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.timestamps = timestamps
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.closed = False
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._at_line_start = True
+        self._stamp_second = None
+        self._stamp_prefix = b''
+        self._file = None
+        self._opened_at = None
+        self._open()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{self.path.name}", daemon=True)
+        self._thread.start()
+
+    # file-like interface, also used as pexpect's logfile
+    def write(self, data: bytes) -> None:
+        if self.closed or not data:
+            return
+        try:
+            self._queue.put_nowait((time.time(), bytes(data)))
+        except queue.Full:
+            self.dropped += len(data)
+
+    def flush(self) -> None:
+        # pexpect calls flush() after every write; batching happens in the writer thread
+        pass
+
+    def sync(self, timeout: float = None) -> None:
+        '''Block until everything written so far is on disk.'''
+        done = threading.Event()
+        self._queue.put((None, done), timeout=timeout)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put((None, None))
+        self._thread.join()
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._opened_at = time.time()
+
+    def _run(self) -> None:
+        while True:
+            # only idle while there is nothing to write
+            batch = [self._queue.get()]
+            # gather more until the batch is big enough, flush_interval has passed,
+            # or a sync/close arrives, so a busy port is written in few syscalls
+            deadline = time.monotonic() + self.flush_interval
+            size = len(batch[0][1]) if batch[0][0] is not None else 0
+            while batch[-1][0] is not None and len(batch) < self.BATCH_CHUNKS and size < self.BATCH_BYTES:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                batch.append(item)
+                if item[0] is not None:
+                    size += len(item[1])
+
+            stop = False
+            events = []
+            chunks = []
+            for timestamp, data in batch:
+                if timestamp is None:
+                    if data is None:
+                        stop = True
+                    else:
+                        events.append(data)
+                    continue
+                chunks.append(self._stamp(timestamp, data) if self.timestamps else data)
+
+            try:
+                if chunks:
+                    self._file.write(b''.join(chunks))
+                    self._file.flush()
+                    self._maybe_rotate()
+                if events:
+                    os.fsync(self._file.fileno())
+            except Exception as e:
+                print(f"[ Error ] Log writer failed on {self.path} : {e}")
+                if self._file.closed:
+                    # a rotation failed half way, keep logging to the current path
+                    try:
+                        self._open()
+                    except OSError:
+                        pass
+
+            for event in events:
+                event.set()
+            if stop:
+                self._file.close()
+                return
+
+    def _stamp(self, timestamp: float, data: bytes) -> bytes:
+        # strftime is the slow part, redo it only when the second changes
+        second = int(timestamp)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp_prefix = time.strftime('[%Y-%m-%d %H:%M:%S', time.localtime(second)).encode()
+        prefix = self._stamp_prefix + b'.%03d] ' % int((timestamp - second) * 1000)
+
+        lines = data.split(b'\n')
+        out = []
+        for index, line in enumerate(lines):
+            if index > 0:
+                out.append(b'\n')
+                self._at_line_start = True
+            if not line:
+                continue
+            if self._at_line_start:
+                out.append(prefix)
+                self._at_line_start = False
+            out.append(line)
+        return b''.join(out)
+
+    def _maybe_rotate(self) -> None:
+        too_big = self.max_bytes and self._file.tell() >= self.max_bytes
+        too_old = self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval
+        if not (too_big or too_old):
+            return
+
+        self._file.close()
+        segment = self.path.with_name(f"{self.path.name}.{time.strftime('%Y%m%d-%H%M%S')}")
+        suffix = 1
+        while segment.exists() or Path(f"{segment}.gz").exists():
+            segment = self.path.with_name(f"{self.path.name}.{time.strftime('%Y%m%d-%H%M%S')}-{suffix}")
+            suffix += 1
+        os.replace(self.path, segment)
+        self._open()
+
+        if self.compress:
+            _get_compressor().submit(self._compress, segment)
+        else:
+            self._prune()
+
+    def _compress(self, segment: Path) -> None:
+        try:
+            with open(segment, 'rb') as src, gzip.open(f"{segment}.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment)
+        except Exception as e:
+            print(f"[ Error ] Failed to compress log segment {segment} : {e}")
+        self._prune()
+
+    def _prune(self) -> None:
+        if not self.backup_count:
+            return
+        segments = []
+        for segment in self.path.parent.glob(f"{self.path.name}.*"):
+            try:
+                segments.append((segment.stat().st_mtime, segment))
+            except OSError:
+                pass    # removed by a concurrent prune
+        segments = [segment for _, segment in sorted(segments)]
+        for segment in segments[:max(0, len(segments) - self.backup_count)]:
+            try:
+                os.remove(segment)
+            except OSError:
+                pass
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+from pathlib import Path
+from src.utils.file_lock import FileLock
+from src.app.drain import pid_alive
+from src.app.settings import METRICS_LATENCY_BUCKETS, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Child:
+    '''
+    A metric with its label values bound. Each thread gets its own cell (a list
+    of numbers) on first use, so updates are plain list operations, no lock.
+    '''
+    __slots__ = ('_metric', '_key', '_local', '_buckets')
+
+    def __init__(self, metric, key: tuple):
+        self._metric = metric
+        self._key = key
+        self._local = threading.local()
+        self._buckets = getattr(metric, 'buckets', None)
+
+    def _cell(self) -> list:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = self._metric._new_cell()
+            self._metric._shard()[self._key] = cell
+            return cell
+
+    def inc(self, amount: float = 1) -> None:
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._cell()[0] += amount
+
+    def dec(self, amount: float = 1) -> None:
+        try:
+            self._local.cell[0] -= amount
+        except AttributeError:
+            self._cell()[0] -= amount
+
+    def observe(self, value: float) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-1] += value
+
+
+class Metric:
+    '''
+    Base of the metric types. Every thread updates its own cells ({label values: cell})
+    without taking a lock; collect() merges them. Cells of threads that ended are
+    folded into one set, by collect() and whenever the number of shards has
+    doubled since the last fold, so short-lived threads do not pile up even if
+    nothing collects.
+    '''
+    FOLD_MIN = 64   # shards registered before the first fold
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []       # (thread, {label values: cell}) of live threads
+        self._retired = {}      # merged cells of finished threads
+        self._fold_at = self.FOLD_MIN
+        self._children = {}
+        self._lock = threading.Lock()
+        self._default = _Child(self, ()) if not self.labelnames else None
+
+    def labels(self, *values) -> _Child:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {', '.join(self.labelnames)}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, _Child(self, key))
+        return child
+
+    def _new_cell(self) -> list:
+        return [0]
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) >= self._fold_at:
+                    self._fold()
+                    # amortised: the next fold waits until the live shards have doubled
+                    self._fold_at = max(self.FOLD_MIN, 2 * len(self._shards))
+            return shard
+
+    def _fold(self) -> None:
+        # called with the lock held
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                for key, cell in list(shard.items()):
+                    self._merge(self._retired, key, cell)
+        self._shards = live
+
+    @staticmethod
+    def _merge(into: dict, key: tuple, cell: list) -> None:
+        # list() copies in one step, the owning thread may be updating the cell
+        cell = list(cell)
+        if key in into:
+            into[key] = [total + value for total, value in zip(into[key], cell)]
+        else:
+            into[key] = cell
+
+    def collect(self) -> dict:
+        '''{label values: cell} summed over every thread.'''
+        with self._lock:
+            self._fold()
+            merged = {}
+            for key, cell in self._retired.items():
+                self._merge(merged, key, cell)
+            for _, shard in self._shards:
+                for key, cell in list(shard.items()):
+                    self._merge(merged, key, cell)
+        return merged
+
+    def exposition(self, values: dict = None) -> list:
+        '''Text lines of values ({label values: cell}, by default collect()).'''
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for key, cell in sorted((self.collect() if values is None else values).items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(cell[0])}")
+        return lines
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    '''Up/down gauge such as in-flight operations; values from all threads are added up.'''
+    TYPE = 'gauge'
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.dec(amount)
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_cell(self) -> list:
+        # one count per bucket, the +Inf bucket, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def exposition(self, values: dict = None) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for key, counts in sorted((self.collect() if values is None else values).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    '''Named metrics of the process. Asking for an existing name returns the same metric.'''
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, documentation: str, labelnames: tuple, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric '{name}' is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = METRICS_LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def metrics(self) -> list:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self) -> dict:
+        '''{name: [[label values, cell], ...]} of every metric, JSON serializable.'''
+        return {metric.name: [[list(key), cell] for key, cell in metric.collect().items()] for metric in self.metrics()}
+
+    def exposition(self, values: dict = None) -> str:
+        '''
+        Every metric in the Prometheus text format (version 0.0.4), from this
+        process or from values ({name: {label values: cell}}) when given.
+        '''
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.exposition(None if values is None else values.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MultiProcessMetrics:
+    '''
+    Metrics of every worker process, for /metrics with several gunicorn workers.
+
+    Each process writes a snapshot of its registry to directory/<pid>.json every
+    interval seconds (and right before it answers a scrape). A scrape adds up the
+    snapshots of all processes. Snapshots of processes that exited are folded
+    into archive.json, counters and histograms only, so totals never go back;
+    gauges of a dead process are dropped. Other workers' values can be up to
+    interval seconds old.
+    '''
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, directory: Path = METRICS_DIR,
+                 interval: float = METRICS_SNAPSHOT_INTERVAL):
+        self.registry = registry
+        self.directory = Path(directory)
+        self.interval = interval
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='metrics-snapshot', daemon=True)
+            self._thread.start()
+
+    def write(self) -> None:
+        self._write_json(self.directory / f"{os.getpid()}.json", self.registry.snapshot())
+
+    def exposition(self) -> str:
+        self.write()
+        kinds = {metric.name: metric.TYPE for metric in self.registry.metrics()}
+        merged = {}
+        # under the lock, a snapshot is never seen both in the archive and in its pid file
+        with FileLock('metrics'):
+            self._fold_dead(kinds)
+            for path in self.directory.glob('*.json'):
+                self._merge(merged, self._read_json(path))
+        return self.registry.exposition(merged)
+
+    def _fold_dead(self, kinds: dict) -> None:
+        archive_path = self.directory / self.ARCHIVE
+        archive = None
+        for path in self.directory.glob('*.json'):
+            if path.name == self.ARCHIVE or not path.stem.isdigit() or pid_alive(int(path.stem)):
+                continue
+            if archive is None:
+                archive = self._read_json(archive_path)
+            snapshot = self._read_json(path)
+            self._merge(archive, {name: entries for name, entries in snapshot.items() if kinds.get(name) != 'gauge'})
+            path.unlink()
+        if archive is not None:
+            self._write_json(archive_path, {name: [[list(key), cell] for key, cell in values.items()]
+                                            for name, values in archive.items()})
+
+    @staticmethod
+    def _merge(into: dict, snapshot: dict) -> None:
+        # snapshot as read from a file ({name: [[labels, cell], ...]}) or already merged ({name: {labels: cell}})
+        for name, entries in snapshot.items():
+            values = into.setdefault(name, {})
+            for key, cell in (entries.items() if isinstance(entries, dict) else entries):
+                Metric._merge(values, tuple(key), cell)
+
+    @staticmethod
+    def _read_json(path: Path) -> dict:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path: Path, data: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                print(f"[ Error ] Failed to write the metrics snapshot : {e}")
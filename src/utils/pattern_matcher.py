@@ -0,0 +1,74 @@
+import re
+
+
+class MultiPattern:
+    '''
+    Several regexes matched in a single pass.
+
+    The patterns are combined into one alternation with a named group per
+    pattern, so one search() scans the data once no matter how many patterns
+    there are. Patterns that cannot be combined (e.g. numbered backreferences)
+    fall back to being searched one by one.
+    '''
+    def __init__(self, patterns: list, flags: int = 0):
+        self.patterns = [self._to_bytes(pattern) for pattern in patterns]
+        self.flags = flags
+        self._group_counts = [re.compile(pattern, flags).groups for pattern in self.patterns]
+        self._combined = None
+        self._separate = None
+        try:
+            combined = b'|'.join(b'(?P<_p%d>%s)' % (index, pattern) for index, pattern in enumerate(self.patterns))
+            self._combined = re.compile(combined, flags)
+            # numbered groups shift inside the alternation, reject patterns that rely on them
+            if any(count and re.search(rb'\\[1-9]', pattern) for count, pattern in zip(self._group_counts, self.patterns)):
+                raise re.error("numbered backreference")
+        except re.error:
+            self._combined = None
+            self._separate = [re.compile(pattern, flags) for pattern in self.patterns]
+
+    @staticmethod
+    def _to_bytes(pattern) -> bytes:
+        if isinstance(pattern, re.Pattern):
+            pattern = pattern.pattern
+        return pattern.encode('iso8859-1') if isinstance(pattern, str) else bytes(pattern)
+
+    def search(self, data, pos: int = 0, endpos: int = None) -> tuple:
+        '''
+        Find the earliest match of any pattern in data[pos:endpos] without
+        copying data. Returns (pattern_index, match) or None.
+        '''
+        endpos = len(data) if endpos is None else endpos
+        if self._combined is not None:
+            match = self._combined.search(data, pos, endpos)
+            if match is None:
+                return None
+            return int(match.lastgroup[2:]), match
+
+        best = None
+        for index, regex in enumerate(self._separate):
+            match = regex.search(data, pos, endpos)
+            if match is not None and (best is None or match.start() < best[1].start()):
+                best = (index, match)
+        return best
+
+    def groups(self, index: int, match: re.Match) -> tuple:
+        '''Groups of pattern `index` as numbered in that pattern on its own.'''
+        if self._combined is None:
+            return match.groups()
+        first = self._combined.groupindex[f'_p{index}']
+        return match.groups()[first:first + self._group_counts[index]]
+
+    def finditer(self, data, pos: int = 0, endpos: int = None):
+        '''Yield (pattern_index, match) for every non-overlapping match in one pass.'''
+        endpos = len(data) if endpos is None else endpos
+        if self._combined is not None:
+            for match in self._combined.finditer(data, pos, endpos):
+                yield int(match.lastgroup[2:]), match
+            return
+
+        while pos < endpos:
+            found = self.search(data, pos, endpos)
+            if found is None:
+                return
+            yield found
+            pos = found[1].end() if found[1].end() > found[1].start() else found[1].end() + 1
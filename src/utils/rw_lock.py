@@ -0,0 +1,67 @@
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    '''
+    Many readers or one writer.
+
+    Phase-fair: once a writer waits, new readers queue behind it, so readers
+    cannot starve writes; and when a writer is done, the readers that queued
+    meanwhile all get in before the next writer, so a burst of writes cannot
+    starve reads either. Not re-entrant, a thread must not take the lock
+    again while holding it.
+    '''
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._waiting_readers = 0
+        self._read_pass = 0     # readers let in ahead of waiting writers
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            self._waiting_readers += 1
+            while self._writer or (self._waiting_writers and not self._read_pass):
+                self._cond.wait()
+            self._waiting_readers -= 1
+            if self._read_pass:
+                self._read_pass -= 1
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers or self._read_pass:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._read_pass = self._waiting_readers
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -3,7 +3,7 @@ import threading
 # Thread-safe Singleton Metaclass
 class SingletonMeta(type):
     _instances = {}
-    _lock = threading.Lock()
+    _lock = threading.RLock()  # re-entrant, a singleton's __init__ may create other singletons
 
     def __call__(cls, *args, **kwargs):
         with cls._lock:
@@ -0,0 +1,86 @@
+import math
+import time
+import threading
+from src.app.settings import TIMER_WHEEL_TICK, TIMER_WHEEL_SLOTS
+
+
+class Timer:
+    '''Handle of a scheduled callback.'''
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick: int, callback: callable, args: tuple):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    '''
+    Hashed timer wheel: one thread drives any number of timers.
+
+    Time is cut into ticks; a timer due at tick t sits in slot t % slots and
+    fires when the wheel reaches it (timers further out than one revolution
+    simply stay in their slot until their tick comes). Scheduling and
+    cancelling are O(1), and the thread sleeps while no timer is pending.
+    Callbacks run on the wheel thread, so they must only hand work off
+    (e.g. submit to an executor), never block.
+    '''
+    def __init__(self, tick: float = TIMER_WHEEL_TICK, slots: int = TIMER_WHEEL_SLOTS, name: str = 'timer-wheel'):
+        self.tick = tick
+        self.name = name
+        self._slots = [[] for _ in range(slots)]
+        self._current = 0
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, delay: float, callback: callable, *args) -> Timer:
+        '''Call callback(*args) after `delay` seconds (rounded up to the tick).'''
+        with self._cond:
+            ticks = max(1, math.ceil(delay / self.tick))
+            timer = Timer(self._current + ticks, callback, args)
+            self._slots[timer.tick % len(self._slots)].append(timer)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return timer
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending
+
+    def _run(self) -> None:
+        next_tick = time.monotonic() + self.tick
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                    next_tick = time.monotonic() + self.tick
+
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick += self.tick
+
+            with self._cond:
+                self._current += 1
+                index = self._current % len(self._slots)
+                bucket = self._slots[index]
+                due = [timer for timer in bucket if timer.tick <= self._current]
+                if due:
+                    self._slots[index] = [timer for timer in bucket if timer.tick > self._current]
+                    self._pending -= len(due)
+
+            for timer in due:
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"[ Error ] Timer callback {timer.callback} failed : {e}")
@@ -90,19 +90,26 @@ echo "🌟 Starting server on http://localhost:5500 and http://0.0.0.0:5500"
 echo "🔋 Health check: http://localhost:5500/health"
 echo ""
 
+# Number of worker processes, e.g. SYSCONN_WORKERS=4 ./start_server.sh
+# (exported, the workers read it to relay Socket.IO messages between each other)
+export SYSCONN_WORKERS=${SYSCONN_WORKERS:-1}
+echo "👷 Workers: $SYSCONN_WORKERS"
+
 # Run with Gunicorn - use the Flask app, not socketio
+# (no --reload / --max-requests: both restart workers in the middle of running tests,
+#  code updates go through POST /update, which drains first and hands the socket over)
 gunicorn \
     --worker-class eventlet \
-    --workers 1 \
+    --workers "$SYSCONN_WORKERS" \
     --bind 0.0.0.0:5500 \
+    --pid logs/gunicorn.pid \
     --timeout 60 \
+    --graceful-timeout 60 \
     --keep-alive 2 \
-    --max-requests 1000 \
     --access-logfile logs/access.log \
     --error-logfile logs/error.log \
     --capture-output \
     --log-level info \
-    --reload \
     app:app &
 
 echo "✅ Server Running in background..."
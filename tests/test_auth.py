@@ -0,0 +1,62 @@
+from src.app.auth import AuthMiddleware, TokenSnapshot
+
+
+class StubConfig:
+    def __init__(self, data: dict):
+        self.data = data
+        self.version = 1
+
+    def get_data(self) -> dict:
+        return self.data
+
+
+def call(config_data: dict, path: str = "/api/v1/command", authorization: str = None) -> str:
+    def app(environ, start_response):
+        start_response('200 OK', [])
+        return [environ.get('sysconn.auth_token', '').encode()]
+
+    statuses = []
+    environ = {'PATH_INFO': path, 'REMOTE_ADDR': '10.0.0.2'}
+    if authorization is not None:
+        environ['HTTP_AUTHORIZATION'] = authorization
+    middleware = AuthMiddleware(app, config=StubConfig(config_data))
+    body = middleware(environ, lambda status, headers: statuses.append(status))
+    return statuses[0].split()[0], b''.join(body).decode()
+
+
+def test_no_token_configured_lets_requests_without_header_through():
+    assert call({}) == ('200', '')
+    assert call({}, authorization='guess')[0] == '401'
+
+
+def test_configured_token_is_required():
+    config = {"AUTH_TOKEN": "secret"}
+
+    assert call(config)[0] == '401'
+    assert call(config, authorization='wrong')[0] == '401'
+    assert call(config, authorization='Bearer secret') == ('200', 'default')
+
+
+def test_scoped_token_outside_its_scopes_is_forbidden():
+    config = {"AUTH_TOKENS": {"ci": {"token": "ci-token", "scopes": ["/api/v1/results"]}}}
+
+    assert call(config, path="/api/v1/results", authorization='ci-token') == ('200', 'ci')
+    assert call(config, authorization='ci-token')[0] == '403'
+
+
+def test_duplicate_token_keeps_first_entry():
+    snapshot = TokenSnapshot({"AUTH_TOKENS": {"ci": {"token": "same", "scopes": ["/api/v1/results"]},
+                                              "admin": {"token": "same"}}}, 1)
+
+    assert snapshot.match("same") == ("ci", ("/api/v1/results",))
+
+
+def test_index_prefix_collision_keeps_both_tokens(monkeypatch):
+    import src.app.auth as auth
+    # every token lands in the same index slot
+    monkeypatch.setattr(auth, "_digest", lambda token: b"\0" * 8 + token.encode())
+    snapshot = TokenSnapshot({"AUTH_TOKENS": {"one": "token-1", "two": "token-2"}}, 1)
+
+    assert snapshot.match("token-1")[0] == "one"
+    assert snapshot.match("token-2")[0] == "two"
+    assert snapshot.match("token-3") is None
@@ -0,0 +1,57 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.app.drain import DrainState, DRAINING, HANDING_OFF
+from src.app.settings import UPDATE_HEALTH_TIMEOUT
+from src.utils.singleton import SingletonMeta
+
+
+@pytest.fixture
+def drain(tmp_path, monkeypatch):
+    monkeypatch.setattr(SingletonMeta, "_instances", {})
+    return DrainState(path=str(tmp_path / "draining"), check_interval=0)
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def write(drain: DrainState, **info) -> None:
+    with open(drain.path, "w") as f:
+        json.dump(dict({"phase": DRAINING, "started_at": time.time()}, **info), f)
+
+
+def test_drain_of_live_update_is_active(drain):
+    drain.begin(time.time() + 60)
+
+    assert drain.active
+    assert not drain.stale()
+
+
+@pytest.mark.parametrize("phase", [DRAINING, HANDING_OFF])
+def test_drain_of_dead_update_process_ends(drain, phase):
+    write(drain, phase=phase, pid=dead_pid(), deadline=time.time() + 60)
+
+    assert drain.stale()
+    assert not drain.active
+    assert drain.info() is None
+
+
+def test_drain_past_deadline_ends(drain):
+    # e.g. after a reboot the pid may belong to another process
+    write(drain, pid=1, deadline=time.time() - UPDATE_HEALTH_TIMEOUT - 1)
+
+    assert not drain.active
+    assert drain.info() is None
+
+
+def test_forced_hand_off_after_deadline_keeps_draining(drain):
+    drain.begin(time.time() - 1, force=True)
+
+    assert drain.active
@@ -0,0 +1,142 @@
+import re
+import json
+import hashlib
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.modules.relay import IpRelay
+
+USERNAME = "admin"
+PASSWORD = "1234"
+REALM = "relay"
+NONCE = "5ccc069c403ebaf9f0171e9517f40e41"
+DIGEST_FIELD = re.compile(r'(\w+)=(?:"([^"]*)"|([^,\s]*))')
+
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class StandInRelay(ThreadingHTTPServer):
+    '''Local stand-in of an IP relay's REST API, with digest auth and keep-alive.'''
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.states = [False] * 8
+        self.connections = 0
+        self.challenges = 0
+        self.requests = []      # (method, path) of the authorized requests
+        self.lock = threading.Lock()
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self._authorized() and self.path == "/restapi/relay/outlets/all;/physical_state/":
+            self._reply(200, json.dumps(self.server.states).encode())
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        if not self._authorized():
+            return
+        prefix, suffix = "/restapi/relay/outlets/=", "/state/"
+        if not (self.path.startswith(prefix) and self.path.endswith(suffix)):
+            self._reply(404)
+            return
+        value = parse_qs(body)["value"][0] == "true"
+        with self.server.lock:
+            for outlet in self.path[len(prefix):-len(suffix)].split(","):
+                self.server.states[int(outlet)] = value
+        self._reply(204)
+
+    def _authorized(self) -> bool:
+        header = self.headers.get("Authorization") or ""
+        fields = {key: quoted or plain for key, quoted, plain in DIGEST_FIELD.findall(header)} \
+            if header.startswith("Digest ") else {}
+        if fields:
+            ha1 = _md5(f"{USERNAME}:{REALM}:{PASSWORD}")
+            ha2 = _md5(f"{self.command}:{fields.get('uri')}")
+            expected = _md5(f"{ha1}:{NONCE}:{fields.get('nc')}:{fields.get('cnonce')}:{fields.get('qop')}:{ha2}")
+            if fields.get("username") == USERNAME and fields.get("response") == expected:
+                with self.server.lock:
+                    self.server.requests.append((self.command, self.path))
+                return True
+        with self.server.lock:
+            self.server.challenges += 1
+        self._reply(401, headers={
+            "WWW-Authenticate": f'Digest realm="{REALM}", nonce="{NONCE}", qop="auth", algorithm=MD5'})
+        return False
+
+    def _reply(self, status: int, body: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stand_in():
+    server = StandInRelay()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_writes_reuse_one_connection_and_one_digest_challenge(stand_in):
+    relay = IpRelay(stand_in.address, USERNAME, PASSWORD, state_ttl=60)
+
+    relay.initialize()
+    assert relay.set_states({1: 1, 2: 1, 5: 0, 6: 0})
+    assert relay.on(3)
+
+    assert stand_in.connections == 1
+    assert stand_in.challenges == 1
+    assert stand_in.requests == [
+        ("GET", "/restapi/relay/outlets/all;/physical_state/"),
+        ("PUT", "/restapi/relay/outlets/=0,1/state/"),
+        ("PUT", "/restapi/relay/outlets/=4,5/state/"),
+        ("PUT", "/restapi/relay/outlets/=2/state/"),
+    ]
+    assert stand_in.states == [True, True, True, False, False, False, False, False]
+    # written through, not read back from the relay
+    assert relay.get_state() == stand_in.states
+    assert len(stand_in.requests) == 4
+
+
+def test_state_is_read_back_only_when_stale(stand_in):
+    relay = IpRelay(stand_in.address, USERNAME, PASSWORD, state_ttl=60)
+    relay.initialize()
+    stand_in.states[7] = True   # switched outside this server
+
+    assert relay.get_state()[7] is False
+    assert relay.get_state(refresh=True)[7] is True
+    assert [method for method, _ in stand_in.requests] == ["GET", "GET"]
+
+
+def test_rejected_write_leaves_state_unknown(stand_in):
+    relay = IpRelay(stand_in.address, USERNAME, "wrong", state_ttl=60)
+
+    assert relay.on(8) is False
+    assert stand_in.states[7] is False
+    assert relay.synced_at == 0     # re-read on the next access
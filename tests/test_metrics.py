@@ -0,0 +1,27 @@
+import threading
+
+from src.utils.metrics import Counter, Histogram
+
+
+def run_threads(target, count: int) -> None:
+    for _ in range(count):
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+
+def test_shards_of_finished_threads_are_folded_without_collect():
+    counter = Counter('test_requests_total', 'Requests.')
+
+    run_threads(counter.inc, 1000)
+
+    assert len(counter._shards) < 2 * Counter.FOLD_MIN
+    assert counter.collect() == {(): [1000]}
+
+
+def test_histogram_sums_every_thread():
+    histogram = Histogram('test_duration_seconds', 'Durations.', ('result',), buckets=(0.1, 1))
+
+    run_threads(lambda: histogram.labels('ok').observe(0.5), 10)
+
+    assert histogram.collect() == {('ok',): [0, 10, 0, 5.0]}
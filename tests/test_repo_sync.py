@@ -0,0 +1,148 @@
+import functools
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import src.core.repo_mirror as repo_mirror
+from src.core.repo_mirror import RepoMirror
+from src.services.workarea_service import WorkareaService, parse_manifest
+from src.utils.file_lock import FileLock
+
+
+def git(*args, cwd=None) -> str:
+    result = subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                            cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout.strip()
+
+
+def make_remote(remotes: Path, name: str) -> Path:
+    '''Bare repository remotes/<name> with one commit on main.'''
+    bare = remotes / name
+    git("init", "--quiet", "--bare", "--initial-branch=main", str(bare))
+    commit(bare, f"{name} 1")
+    return bare
+
+
+def commit(bare: Path, message: str) -> str:
+    '''Push a new commit to main of the bare repository, return its sha.'''
+    work = bare.parent / f".{bare.name}.work"
+    if not work.exists():
+        git("clone", "--quiet", str(bare), str(work))
+        git("checkout", "--quiet", "-B", "main", cwd=work)
+    (work / "file.txt").write_text(message)
+    git("add", "file.txt", cwd=work)
+    git("commit", "--quiet", "-m", message, cwd=work)
+    git("push", "--quiet", "origin", "main", cwd=work)
+    return git("rev-parse", "HEAD", cwd=work)
+
+
+def write_manifest(path: Path, body: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"<manifest>\n{body}\n</manifest>\n")
+    return path
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    # keep the mirror lock files out of the working directory
+    monkeypatch.setattr(repo_mirror, "FileLock", functools.partial(FileLock, directory=tmp_path / "locks"))
+
+
+@pytest.fixture
+def sdk(tmp_path):
+    '''Manifest dev/sdk1/default.xml with projects a and b on local bare repositories.'''
+    remotes = tmp_path / "remotes"
+    for name in ("a", "b"):
+        make_remote(remotes, name)
+    write_manifest(tmp_path / "manifests" / "dev" / "sdk1" / "default.xml", '''
+  <remote name="local" fetch="../../../remotes"/>
+  <default remote="local" revision="main" sync-j="2"/>
+  <project name="a" path="sdk/a"/>
+  <project name="b" path="sdk/b"/>''')
+    service = WorkareaService(str(tmp_path / "workareas"), mirror=RepoMirror(tmp_path / "mirror"),
+                              manifest_dir=tmp_path / "manifests")
+    return service, remotes
+
+
+def test_parse_manifest_resolves_relative_fetch(tmp_path):
+    manifest = write_manifest(tmp_path / "dev" / "default.xml", '''
+  <remote name="local" fetch="../remotes"/>
+  <remote name="web" fetch="https://example.com/git"/>
+  <default remote="local" revision="main" sync-j="4"/>
+  <project name="a"/>
+  <project name="b" path="sdk/b" remote="web" revision="v1.0"/>''')
+
+    projects, sync_jobs = parse_manifest(manifest)
+
+    assert sync_jobs == 4
+    assert [(project.name, project.path, project.revision) for project in projects] == [
+        ("a", "a", "main"), ("b", "sdk/b", "v1.0")]
+    assert projects[0].url == f"{tmp_path / 'remotes'}/a"
+    assert projects[1].url == "https://example.com/git/b"
+
+
+def test_parse_manifest_include_and_remove_project(tmp_path):
+    write_manifest(tmp_path / "common.xml", '''
+  <remote name="local" fetch="remotes"/>
+  <default remote="local"/>
+  <project name="a"/>
+  <project name="b"/>''')
+    manifest = write_manifest(tmp_path / "default.xml", '''
+  <include name="common.xml"/>
+  <remove-project name="a"/>
+  <project name="c" revision="dev"/>''')
+
+    projects, sync_jobs = parse_manifest(manifest)
+
+    assert sync_jobs is None
+    assert [(project.name, project.revision) for project in projects] == [("b", "HEAD"), ("c", "dev")]
+
+
+@pytest.mark.parametrize("path", ["../outside", "/etc/outside", "sdk/../../outside"])
+def test_parse_manifest_rejects_path_traversal(tmp_path, path):
+    manifest = write_manifest(tmp_path / "default.xml", f'''
+  <remote name="local" fetch="remotes"/>
+  <project name="a" remote="local" path="{path}"/>''')
+
+    with pytest.raises(ValueError, match="invalid path"):
+        parse_manifest(manifest)
+
+
+def test_manifest_path_stays_inside_manifest_dir(sdk):
+    service, _ = sdk
+
+    with pytest.raises(ValueError):
+        service.manifest_path("..", "..", "default.xml")
+
+
+def test_first_sync_clones_shared_from_mirror(sdk, tmp_path):
+    service, remotes = sdk
+
+    success, report = service.repo_sync("dev", "sdk1", "default.xml")
+
+    assert success and report["failed"] == 0 and report["jobs"] == 2
+    for result in report["projects"]:
+        assert result["status"] == "cloned"
+        assert result["mirror"] == "cloned"
+        dest = tmp_path / "workareas" / "dev_sdk1" / result["path"]
+        # objects come from the mirror, none are copied into the workarea
+        alternates = (dest / ".git" / "objects" / "info" / "alternates").read_text().strip()
+        assert Path(alternates) == service.mirror.path(f"{remotes}/{result['name']}") / "objects"
+        assert result["commit"] == git("rev-parse", "HEAD", cwd=dest)
+        assert (dest / "file.txt").read_text() == f"{result['name']} 1"
+
+
+def test_second_sync_fetches_new_revision(sdk, tmp_path):
+    service, remotes = sdk
+    service.repo_sync("dev", "sdk1", "default.xml")
+    head = commit(remotes / "a", "a 2")
+
+    success, report = service.repo_sync("dev", "sdk1", "default.xml")
+
+    assert success
+    results = {result["name"]: result for result in report["projects"]}
+    assert {result["status"] for result in results.values()} == {"updated"}
+    assert {result["mirror"] for result in results.values()} == {"fetched"}
+    assert results["a"]["commit"] == head
+    assert (tmp_path / "workareas" / "dev_sdk1" / "sdk" / "a" / "file.txt").read_text() == "a 2"